@@ -1,32 +1,31 @@
 import streamlit as st
-import ollama
-import io
+from utils.startup import PageRun, cached_image
+
+# Started before the other imports so the first run's import time is counted
+page_run = PageRun("app")
+
 import os
-import tempfile
 import logging
 import sys
 import json
-from PIL import Image
-from llama_index.core import (
-    Settings, 
-    Document,
-    load_index_from_storage,
-    SimpleDirectoryReader
-)
-from llama_index.core.storage import StorageContext
-from llama_index.llms.ollama import Ollama
-from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.readers.web import SimpleWebPageReader
-from llama_index.core.memory import ChatMemoryBuffer
-
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+import time
+import uuid
+from utils.index_meta import read_index_metadata
+from utils.chat_history import ChatHistory, history_budget, to_chat_messages
+from utils.scheduler import get_scheduler, request_context
+from utils.metrics import observe, span, start_metrics_server, timed_stream
+from utils.streaming import StreamRenderer
+from utils.residency import FAILED, LOADING, format_gb, get_residency_manager
+from utils.ollama_client import OLLAMA_BASE_URL, get_client, get_embed_model, get_llm, get_model_registry
+
 os.environ["OLLAMA_HOST"] = OLLAMA_BASE_URL
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+start_metrics_server()
 
 st.set_page_config(page_title="Jetson Copilot V4.4.4 SaaS", page_icon="🤖")
 
-AVATAR_AI = Image.open('./images/jetson-soc.png')
-AVATAR_USER = Image.open('./images/user-purple.png')
+AVATAR_AI = cached_image('./images/jetson-soc.png')
+AVATAR_USER = cached_image('./images/user-purple.png')
 
 DEFAULT_PROMPT = """You are a highly capable AI assistant. Use any document context provided to inform your answers.
 
@@ -58,36 +57,33 @@ def get_embedding_for_index(index_name):
             return None
     return None
 
-# Model Loader - loads from Ollama, returns only host models, sorted
+# Model Loader - host models from the shared, TTL-cached registry, sorted
 def load_models():
     try:
-        response = ollama.list()
-        models_raw = response.get("models", [])
-        models = [
-            m.get("name") or m.get("model")
-            for m in models_raw if (m.get("name") or m.get("model"))
-        ]
+        return get_model_registry().model_names()
     except Exception as e:
         st.error(f"Failed to query Ollama models: {e}")
-        models = []
-    return sorted(models)
+        return []
 
-# Session state: Model list always loaded
-if "models" not in st.session_state:
-    st.session_state.models = load_models()
-models = st.session_state.models
+# Refreshed in the background by the registry, so new host models show up without a reload
+models = load_models()
 
 # Session State Init
-if "memory" not in st.session_state:
-    st.session_state.memory = ChatMemoryBuffer.from_defaults(token_limit=4096)
+if "history" not in st.session_state:
+    st.session_state.history = ChatHistory()
 if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "assistant", "content": "Hello! Upload documents or start chatting.", "avatar": AVATAR_AI}]
 if "context_prompt" not in st.session_state:
     st.session_state.context_prompt = DEFAULT_PROMPT
 if "rag_mode" not in st.session_state:
     st.session_state.rag_mode = False
-if "active_index" not in st.session_state:
-    st.session_state.active_index = None
+if "active_indexes" not in st.session_state:
+    st.session_state.active_indexes = []
+if "session_id" not in st.session_state:
+    # Owner key for fair sharing of Ollama between sessions
+    st.session_state.session_id = uuid.uuid4().hex
+if "answer_cache" not in st.session_state:
+    st.session_state.answer_cache = False
 
 # --- Filter LLM models (for dropdown) ---
 llm_models = [m for m in models if not is_embedding_model(m)]
@@ -113,6 +109,7 @@ with st.sidebar:
         st.session_state["model"] = None
 
     st.page_link("pages/model_list.py", label=" Available Models", icon="🧠")
+    st.page_link("pages/metrics.py", label=" Latency Metrics", icon="📈")
 
     # RAG toggle and system prompt
     st.toggle("Enable RAG", value=st.session_state.rag_mode, key="rag_mode", on_change=lambda: None)
@@ -123,23 +120,48 @@ with st.sidebar:
 
     # Index management and embedding model tracking
     if st.session_state.rag_mode:
+        # llama_index and the index modules load with the first RAG run, not at startup
+        from llama_index.core import Settings
+        from utils.embed_cache import get_embedding_cache
+        from utils.federated import embedding_models as index_embedding_models, index_label
+        from utils.index_cache import get_index_registry
+        from utils.response_cache import get_response_cache
+
         st.subheader("RAG Index Management:")
         # List indexes
         os.makedirs(INDEX_DIR, exist_ok=True)
         indexes = [d for d in os.listdir(INDEX_DIR) if os.path.isdir(os.path.join(INDEX_DIR, d))]
         if indexes:
-            selected_index = st.selectbox("Select RAG Index:", indexes, index=0)
-            st.session_state.active_index = selected_index
+            # Keep the selection valid when indexes are added or deleted
+            st.session_state.active_indexes = [
+                name for name in st.session_state.active_indexes if name in indexes
+            ] or indexes[:1]
+            st.multiselect(
+                "Select RAG Indexes:",
+                indexes,
+                key="active_indexes",
+                help="Several indexes built with the same embedding model are searched in parallel "
+                     "and their best chunks merged."
+            )
         else:
             st.info("No indexes found.")
-            st.session_state.active_index = None
+            st.session_state.active_indexes = []
 
         st.page_link("pages/build_index.py", label="🛠️ Manage Indexes")
 
-        # -- Embedding model info for selected index --
+        # -- Embedding model info for selected indexes --
         index_embed = None
-        if st.session_state.active_index:
-            index_embed = get_embedding_for_index(st.session_state.active_index)
+        if st.session_state.active_indexes:
+            index_models = index_embedding_models([os.path.join(INDEX_DIR, name) for name in st.session_state.active_indexes])
+            index_embed = get_embedding_for_index(st.session_state.active_indexes[0])
+            if len(set(index_models.values())) > 1:
+                # Scores from different embedding spaces cannot be merged
+                skipped = [name for name in st.session_state.active_indexes
+                           if index_models[os.path.join(INDEX_DIR, name)] != index_embed]
+                st.error(
+                    f"⚠️ {', '.join(skipped)} use a different embedding model than "
+                    f"{st.session_state.active_indexes[0]} and will not be searched."
+                )
             if index_embed:
                 st.markdown(
                     f"**Embedding model for this index:** <span style='color: green'>{index_embed}</span>",
@@ -153,17 +175,65 @@ with st.sidebar:
             else:
                 st.warning("Could not determine embedding model for this index. (Was it built with an older version?)")
 
+            for name in st.session_state.active_indexes:
+                meta = read_index_metadata(os.path.join(INDEX_DIR, name))
+                ann_report = meta.get("ann")
+                if ann_report:
+                    st.caption(
+                        f"{name} ANN search (IVF, nprobe {ann_report['nprobe']}/{ann_report['nlist']}): "
+                        f"recall@12 {ann_report['recall_at_12']:.3f} on {ann_report['recall_queries']} held-out queries"
+                    )
+                lexical_report = meta.get("lexical")
+                if lexical_report:
+                    st.caption(f"{name} keyword index: {lexical_report['terms']} terms, hybrid search")
+                quant_report = meta.get("quantization")
+                if quant_report:
+                    st.caption(
+                        f"{name} {quant_report['kind']} vectors: {quant_report['memory_saved']:.0%} less memory, "
+                        f"recall@12 {quant_report['recall_at_12']:.3f} on {quant_report['recall_queries']} held-out queries"
+                    )
+
         # Show which embedding model is actually in use (or will be)
         # We align the embedding model to match the index if possible
         used_embedding = index_embed if index_embed else default_embedding
-        if used_embedding and used_embedding in embedding_models:
-            Settings.embed_model = OllamaEmbedding(used_embedding, base_url=OLLAMA_BASE_URL)
-        else:
-            Settings.embed_model = OllamaEmbedding(default_embedding, base_url=OLLAMA_BASE_URL)
+        if not (used_embedding and used_embedding in embedding_models):
+            used_embedding = default_embedding
+        Settings.embed_model = get_embed_model(used_embedding)
+
+        cache_stats = get_index_registry().stats()
+        st.caption(
+            f"Index cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+            f"{cache_stats['entries']} loaded ({cache_stats['bytes'] / (1024 * 1024):.1f} MB)"
+        )
+        embed_stats = get_embedding_cache().stats()
+        st.caption(f"Embedding cache: {embed_stats['hits']} hits / {embed_stats['misses']} misses")
+
+        st.toggle(
+            "Reuse answers to similar questions",
+            key="answer_cache",
+            help="Replays a cached answer when a question closely matches an earlier one on the same index, "
+                 "model and system prompt. Cached answers are dropped when the index changes."
+        )
+        if st.session_state.answer_cache:
+            answer_stats = get_response_cache().stats()
+            st.caption(
+                f"Answer cache: {answer_stats['hits']} hits / {answer_stats['misses']} misses "
+                f"({answer_stats['hit_rate']:.0%}), {answer_stats['entries']} answers cached"
+            )
+
+# Preload the selected models now rather than on the first question
+residency = get_residency_manager()
+selected_models = [selected_model, used_embedding if st.session_state.rag_mode else None]
+residency_report = residency.select(st.session_state.session_id, selected_models)
 
-# Always set the LLM model
-llm = Ollama(model=selected_model, request_timeout=300.0, base_url=OLLAMA_BASE_URL) if selected_model else None
-Settings.llm = llm
+def render_stream(chunks, labels):
+    """Render streamed text incrementally and record the render overhead; returns the answer."""
+    renderer = StreamRenderer()
+    for chunk in chunks:
+        renderer.write(chunk)
+    response = renderer.finish()
+    observe("chat_render_seconds", renderer.render_seconds, **labels, **renderer.stats())
+    return response
 
 # Chat flow
 for msg in st.session_state.messages:
@@ -175,59 +245,132 @@ if prompt := st.chat_input("Enter your question..."):
     with st.chat_message("user", avatar=AVATAR_USER):
         st.markdown(prompt)
 
-    with st.chat_message("assistant", avatar=AVATAR_AI):
+    with st.chat_message("assistant", avatar=AVATAR_AI), request_context(owner=st.session_state.session_id), \
+            page_run.paused():
         with st.spinner("Thinking..."):
-            response, buffer, flush_every = "", "", 20
-            placeholder = st.empty()
+            turn_start = time.perf_counter()
+            llm = get_llm(selected_model) if selected_model else None
+            response = ""
+            rag_indexes = [
+                name for name in st.session_state.active_indexes
+                if get_embedding_for_index(name) == index_embed
+            ] if st.session_state.rag_mode else []
+            rag_turn = bool(rag_indexes)
+            labels = {"index": index_label(rag_indexes) if rag_turn else None, "model": selected_model}
 
-            if st.session_state.rag_mode and st.session_state.active_index:
-                rag_index = load_index_from_storage(
-                    StorageContext.from_defaults(persist_dir=os.path.join(INDEX_DIR, st.session_state.active_index))
+            # Recent turns verbatim within the model's budget, older ones as a rolling summary
+            chat_history = [
+                {"role": m["role"], "content": m["content"]}
+                for m in st.session_state.messages
+                if m["role"] in ("user", "assistant")
+            ]
+            with span("chat_prompt_assembly", **labels) as attrs:
+                summary, recent_history, history_stats = st.session_state.history.compact(
+                    chat_history, selected_model, llm
                 )
-                chat_engine = rag_index.as_chat_engine(
-                    chat_mode="context",
-                    memory=st.session_state.memory,
-                    system_prompt=st.session_state.context_prompt,
-                    streaming=True,
-                    similarity_top_k=12  # or whatever your default/top_k needs
-                )
-                stream = chat_engine.stream_chat(prompt)
-                for chunk in stream.response_gen:
-                    buffer += chunk
-                    if len(buffer) >= flush_every:
-                        response += buffer
-                        placeholder.markdown(response)
-                        buffer = ""
-                if buffer:
-                    response += buffer
-                    placeholder.markdown(response)
-            else:
-                # --- ALWAYS include latest system prompt at top, then actual chat history (user/assistant only) ---
                 system_prompt = st.session_state.context_prompt
-                chat_history = [
-                    {"role": m["role"], "content": m["content"]}
-                    for m in st.session_state.messages
-                    if m["role"] in ("user", "assistant")
-                ]
-                messages_input = [{"role": "system", "content": system_prompt}] + chat_history
-
-                stream = ollama.chat(model=selected_model, messages=messages_input, stream=True)
-                for chunk in stream:
-                    piece = chunk["message"]["content"]
-                    buffer += piece
-                    if len(buffer) >= flush_every:
-                        response += buffer
-                        placeholder.markdown(response)
-                        buffer = ""
-                if buffer:
-                    response += buffer
-                    placeholder.markdown(response)
+                if summary:
+                    system_prompt += f"\n\nSummary of the earlier conversation:\n{summary}"
+                attrs.update(history_stats)
+
+            if rag_turn:
+                from llama_index.core.chat_engine import ContextChatEngine
+                from llama_index.core.memory import ChatMemoryBuffer
+                from utils.federated import FederatedRetriever, federated_retriever, format_shard_stats, load_indexes
+                from utils.lexical import HYBRID_CANDIDATES, hybrid_retriever_kwargs
+                from utils.response_cache import index_version
+                from utils.retrieval import TimedRetriever
+
+                Settings.llm = llm
+                index_paths = [os.path.join(INDEX_DIR, name) for name in rag_indexes]
+                cached_answer, answer_key = None, None
+                if st.session_state.answer_cache:
+                    answer_cache = get_response_cache()
+                    # Keyed on the conversation too, so a follow-up never gets another chat's answer
+                    answer_context = ([{"role": "system", "content": summary}] if summary else []) + recent_history[:-1]
+                    answer_key = answer_cache.group_key(
+                        labels["index"], selected_model, st.session_state.context_prompt, answer_context
+                    )
+                    with span("answer_cache_lookup", **labels) as attrs:
+                        answer_version = "+".join(index_version(path) for path in index_paths)
+                        question_embedding = Settings.embed_model.get_query_embedding(prompt)
+                        cached_answer = answer_cache.lookup(answer_key, answer_version, question_embedding)
+                        attrs["hit"] = cached_answer is not None
+
+                if cached_answer is not None:
+                    response = cached_answer
+                    st.markdown(response)
+                else:
+                    # Shared across sessions; reloaded only when the index files change
+                    with span("rag_index_load", **labels):
+                        loaded = load_indexes(index_paths, get_index_registry().get)
+                    # The engine adds the current question itself
+                    memory = ChatMemoryBuffer.from_defaults(
+                        chat_history=to_chat_messages(recent_history[:-1]),
+                        token_limit=history_budget(selected_model),
+                    )
+                    # Same engine as as_chat_engine(chat_mode="context"), with timed embedding and retrieval
+                    # Indexes with BM25 postings fuse keyword and vector rankings and send fewer chunks
+                    retriever_kwargs = hybrid_retriever_kwargs(loaded, top_k=HYBRID_CANDIDATES)
+                    if len(loaded) == 1:
+                        base_retriever = loaded[0].as_retriever(**retriever_kwargs)
+                    else:
+                        # One query embedding, every index searched in parallel, merged top-k
+                        base_retriever = federated_retriever(
+                            dict(zip(rag_indexes, loaded)), retriever_kwargs, Settings.embed_model, selected_model
+                        )
+                    retriever = TimedRetriever(base_retriever, Settings.embed_model, **labels)
+                    chat_engine = ContextChatEngine.from_defaults(
+                        retriever=retriever,
+                        memory=memory,
+                        system_prompt=system_prompt,
+                        llm=llm,
+                    )
+                    stream = chat_engine.stream_chat(prompt)
+                    if retriever.finished_at is not None:
+                        observe("rag_context_assembly_seconds", time.perf_counter() - retriever.finished_at, **labels)
+                    response = render_stream(timed_stream(stream.response_gen, turn_start, **labels), labels)
+                    if answer_key is not None and response:
+                        answer_cache.store(answer_key, answer_version, question_embedding, response)
+                    if isinstance(base_retriever, FederatedRetriever) and base_retriever.shard_stats:
+                        st.caption(f"Searched in parallel: {format_shard_stats(base_retriever.shard_stats)}")
+            else:
+                # --- ALWAYS include latest system prompt at top, then compacted chat history ---
+                messages_input = [{"role": "system", "content": system_prompt}] + recent_history
+
+                stream = get_client().chat(model=selected_model, messages=messages_input, stream=True)
+                pieces = (chunk["message"]["content"] for chunk in stream)
+                response = render_stream(timed_stream(pieces, turn_start, **labels), labels)
 
             st.session_state.messages.append({"role": "assistant", "content": response, "avatar": AVATAR_AI})
+            observe("chat_turn_seconds", time.perf_counter() - turn_start, **labels)
+        if history_stats["saved"]:
+            st.caption(
+                f"History: {history_stats['sent']} tokens sent, "
+                f"{history_stats['saved']} saved by compaction"
+            )
 
-# Chat reset
+# Ollama queue depth and chat reset
 with st.sidebar:
+    sched_stats = get_scheduler().stats()
+    if sched_stats["queued"] or sched_stats["running"]:
+        st.caption(f"Ollama queue: {sched_stats['running']} running, {sched_stats['queued']} waiting")
+    if residency_report["warning"]:
+        (st.error if residency_report["refused"] else st.warning)(f"⚠️ {residency_report['warning']}")
+    for model in filter(None, selected_models):
+        state, error = residency.status(model)
+        if state == LOADING:
+            st.caption(f"Loading {model} into memory…")
+        elif state == FAILED:
+            st.caption(f"Could not preload {model}: {error}")
+    loaded_models = residency.loaded()
+    if loaded_models:
+        st.caption("Loaded in Ollama: " + ", ".join(
+            f"{entry['model']} ({format_gb(entry['size'] or 0)})" for entry in loaded_models
+        ))
     if st.button("🔄 Reset Chat"):
         st.session_state.messages = [{"role": "assistant", "content": "Hello! Upload documents or start chatting.", "avatar": AVATAR_AI}]
-        st.session_state.memory = ChatMemoryBuffer.from_defaults(token_limit=4096)
+        st.session_state.history = ChatHistory()
         st.success("Chat reset.")
+
+page_run.finish()
@@ -0,0 +1,365 @@
+"""Deterministic stand-in for the Ollama HTTP API, for offline benchmarks.
+
+Run from streamlit_app/:
+    python -m benchmarks.fake_ollama --port 11434 --dim 1024 --token-rate 40
+
+Embeddings are unit vectors seeded from a hash of the model and text, so
+the same text always gets the same vector. Chat and generate stream a fixed
+answer of --answer-tokens tokens, the first after --first-token-ms and the
+rest at --token-rate tokens per second. Only the endpoints the app uses are
+implemented: tags, show, ps, version, embed, embeddings, chat and generate.
+
+Model residency is simulated like Ollama does it: the first request for a
+model that is not loaded waits --load-ms, keep_alive sets how long it stays
+loaded (0 unloads it, an empty generate/embed only loads it), and with
+--memory-gb set, least recently used models are evicted to make room.
+"""
+import sys
+import json
+import re
+import time
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+CREATED_AT = "2024-01-01T00:00:00Z"
+DEFAULT_MODELS = ("llama3.2:latest", "mxbai-embed-large:latest")
+DEFAULT_KEEP_ALIVE_S = 300.0
+DEFAULT_MODEL_BYTES = 1 << 30
+
+
+class FakeOllamaConfig:
+    def __init__(
+        self,
+        dim=1024,
+        token_rate=40.0,
+        first_token_ms=150.0,
+        answer_tokens=64,
+        embed_ms=2.0,
+        embed_ms_per_text=0.2,
+        context_length=8192,
+        models=DEFAULT_MODELS,
+        load_ms=0.0,
+        memory_bytes=0,
+        model_bytes=None,
+    ):
+        self.dim = dim
+        self.token_rate = token_rate
+        self.first_token_ms = first_token_ms
+        self.answer_tokens = answer_tokens
+        self.embed_ms = embed_ms
+        self.embed_ms_per_text = embed_ms_per_text
+        self.context_length = context_length
+        self.models = list(models)
+        self.load_ms = load_ms
+        self.memory_bytes = memory_bytes  # 0 = unlimited
+        self.model_bytes = dict(model_bytes or {})
+        for name in self.model_bytes:
+            if name not in self.models:
+                self.models.append(name)
+
+    def size_of(self, model):
+        return self.model_bytes.get(model, DEFAULT_MODEL_BYTES)
+
+
+def keep_alive_seconds(value):
+    """Ollama keep_alive (None, seconds, or "5m" / "1h" / "30s") in seconds; negative = forever."""
+    if value is None:
+        return DEFAULT_KEEP_ALIVE_S
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r"(-?[\d.]+)\s*(ms|s|m|h)?", str(value).strip())
+    if not match:
+        return DEFAULT_KEEP_ALIVE_S
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}[match.group(2)]
+    return float(match.group(1)) * scale
+
+
+class ModelResidency:
+    """Loaded models with their expiry, evicted least recently used first."""
+
+    def __init__(self, config):
+        self.config = config
+        self.loaded = {}  # model -> {"expires": monotonic or None, "used": monotonic}
+        self.lock = threading.Lock()
+        # Serializes loads, like Ollama's scheduler
+        self.load_lock = threading.Lock()
+
+    def _expire(self, now):
+        for model in [m for m, state in self.loaded.items() if state["expires"] is not None and state["expires"] <= now]:
+            del self.loaded[model]
+
+    def use(self, model, keep_alive, count):
+        """Load model if needed (paying load_ms), then apply keep_alive; returns whether it was cold."""
+        with self.load_lock:
+            with self.lock:
+                self._expire(time.monotonic())
+                cold = model not in self.loaded
+            if cold:
+                time.sleep(self.config.load_ms / 1000)
+                count("loads")
+            with self.lock:
+                if cold and self.config.memory_bytes:
+                    while self.loaded and (
+                        sum(self.config.size_of(m) for m in self.loaded) + self.config.size_of(model)
+                        > self.config.memory_bytes
+                    ):
+                        victim = min(self.loaded, key=lambda m: self.loaded[m]["used"])
+                        del self.loaded[victim]
+                        count("evictions")
+                self._touch(model, keep_alive)
+        return cold
+
+    def _touch(self, model, keep_alive):
+        now = time.monotonic()
+        seconds = keep_alive_seconds(keep_alive)
+        if seconds == 0:
+            self.loaded.pop(model, None)
+            return
+        self.loaded[model] = {"expires": None if seconds < 0 else now + seconds, "used": now}
+
+    def unload(self, model):
+        with self.lock:
+            self.loaded.pop(model, None)
+
+    def ps(self):
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            models = []
+            for model, state in self.loaded.items():
+                expires = state["expires"]
+                expires_at = time.gmtime(time.time() + (expires - now)) if expires is not None else time.gmtime(2 ** 31 - 1)
+                models.append({
+                    "name": model,
+                    "model": model,
+                    "size": self.config.size_of(model),
+                    "size_vram": self.config.size_of(model),
+                    "expires_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", expires_at),
+                })
+            return models
+
+
+def fake_embedding(model, text, dim):
+    seed = int.from_bytes(hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def answer_tokens(count):
+    return [f"token{i} " for i in range(count)]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, delayed ACKs add ~40 ms
+    disable_nagle_algorithm = True
+    # Set on the subclass created by make_server
+    config = None
+    counters = None
+    counters_lock = None
+    residency = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, key, amount=1):
+        with self.counters_lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        self._count(self.path)
+        if self.path == "/api/tags":
+            self._send_json({"models": [
+                {"name": name, "model": name, "size": self.config.size_of(name), "modified_at": CREATED_AT}
+                for name in self.config.models
+            ]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": self.residency.ps()})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path == "/_stats":
+            with self.counters_lock:
+                self._send_json(dict(self.counters))
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        self._count(self.path)
+        request = self._read_json()
+        if self.path == "/api/show":
+            embedding = "embed" in str(request.get("model", ""))
+            self._send_json({
+                "model_info": {"general.architecture": "llama", "llama.context_length": self.config.context_length},
+                "capabilities": ["embedding"] if embedding else ["completion"],
+            })
+        elif self.path == "/api/embed":
+            texts = request.get("input", [])
+            texts = [texts] if isinstance(texts, str) else [text for text in texts if text]
+            self._use_model(request)
+            self._embed_delay(len(texts))
+            self._send_json({
+                "model": request.get("model"),
+                "embeddings": [fake_embedding(request.get("model"), text, self.config.dim) for text in texts],
+            })
+        elif self.path == "/api/embeddings":
+            self._use_model(request)
+            self._embed_delay(1)
+            self._send_json({"embedding": fake_embedding(request.get("model"), request.get("prompt", ""), self.config.dim)})
+        elif self.path in ("/api/chat", "/api/generate"):
+            self._generate(request, chat=self.path == "/api/chat")
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _use_model(self, request):
+        self.residency.use(request.get("model"), request.get("keep_alive"), self._count)
+
+    def _embed_delay(self, texts):
+        self._count("embedded_texts", texts)
+        time.sleep((self.config.embed_ms + self.config.embed_ms_per_text * texts) / 1000)
+
+    def _message(self, model, content, chat, done):
+        message = {"model": model, "created_at": CREATED_AT, "done": done}
+        if chat:
+            message["message"] = {"role": "assistant", "content": content}
+        else:
+            message["response"] = content
+        if done:
+            message.update(done_reason="stop", eval_count=self.config.answer_tokens, prompt_eval_count=0)
+        return message
+
+    def _generate(self, request, chat):
+        model = request.get("model")
+        if not request.get("messages") and not request.get("prompt"):
+            # Ollama's load / unload request: no prompt, only keep_alive
+            if keep_alive_seconds(request.get("keep_alive")) == 0:
+                self.residency.unload(model)
+                reason = "unload"
+            else:
+                self._use_model(request)
+                reason = "load"
+            message = self._message(model, "", chat, done=True)
+            message["done_reason"] = reason
+            self._send_json(message)
+            return
+        self._use_model(request)
+        tokens = answer_tokens(self.config.answer_tokens)
+        time.sleep(self.config.first_token_ms / 1000)
+        if not request.get("stream", True):
+            time.sleep(max(len(tokens) - 1, 0) / self.config.token_rate)
+            self._send_json(self._message(model, "".join(tokens), chat, done=True))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        interval = 1 / self.config.token_rate
+        next_at = time.perf_counter()
+        try:
+            for token in tokens:
+                # Pace against a schedule so per-chunk overhead doesn't lower the rate
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_at += interval
+                self._write_chunk(self._message(model, token, chat, done=False))
+            self._write_chunk(self._message(model, "", chat, done=True))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def make_server(config, host="127.0.0.1", port=0):
+    handler = type("Handler", (FakeOllamaHandler,), {
+        "config": config,
+        "counters": {},
+        "counters_lock": threading.Lock(),
+        "residency": ModelResidency(config),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(config, host="127.0.0.1", port=0):
+    """Serve from a daemon thread; returns (server, base_url)."""
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-ollama").start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def add_arguments(parser):
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="Streamed tokens per second")
+    parser.add_argument("--first-token-ms", type=float, default=150.0, help="Delay before the first token")
+    parser.add_argument("--answer-tokens", type=int, default=64, help="Tokens per answer")
+    parser.add_argument("--embed-ms", type=float, default=2.0, help="Latency of each embedding request")
+    parser.add_argument("--embed-ms-per-text", type=float, default=0.2, help="Extra latency per embedded text")
+    parser.add_argument("--load-ms", type=float, default=0.0, help="Cold load time of a model that is not loaded")
+    parser.add_argument("--memory-gb", type=float, default=0.0, help="Memory for loaded models, 0 = unlimited")
+    parser.add_argument("--model-gb", action="append", default=[], metavar="NAME=GB",
+                        help="Memory of a model when loaded (repeatable, default 1 GB)")
+
+
+def config_from_args(args):
+    return FakeOllamaConfig(
+        dim=args.dim,
+        token_rate=args.token_rate,
+        first_token_ms=args.first_token_ms,
+        answer_tokens=args.answer_tokens,
+        embed_ms=args.embed_ms,
+        embed_ms_per_text=args.embed_ms_per_text,
+        load_ms=args.load_ms,
+        memory_bytes=int(args.memory_gb * (1 << 30)),
+        model_bytes={
+            name: int(float(gb) * (1 << 30))
+            for name, gb in (item.rsplit("=", 1) for item in args.model_gb)
+        },
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434, help="0 picks a free port")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = make_server(config_from_args(args), args.host, args.port)
+    # The benchmark suite reads this line to find the port
+    print(f"listening on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
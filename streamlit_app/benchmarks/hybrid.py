@@ -0,0 +1,183 @@
+"""Hybrid (BM25 + vector) retrieval against the current top-12 vector search.
+
+Run from streamlit_app/:
+    python -m benchmarks.hybrid --documents 2000 --queries 100
+    python -m benchmarks.hybrid --base-url http://localhost:11434   # real embeddings
+
+The corpus is benchmarks.rag's random Jetson vocabulary with one exact
+identifier planted per target document: an error code, an L4T release and
+a CLI flag. Every query asks about one identifier. For each mode this
+reports how often a chunk containing the identifier reaches the context,
+retrieval latency, and the prompt tokens spent on retrieved chunks.
+
+The fake server's embeddings carry no meaning, so against it the vector
+side finds the target only by chance; use --base-url with a real embedding
+model for a fair dense baseline.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+from benchmarks import fake_ollama
+from benchmarks.rag import EMBED_MODEL, RESULTS_DIR, WORDS, build_index, git_commit, percentiles, start_fake_server
+
+VECTOR_TOP_K = 12
+TEMPLATES = (
+    ("error code {}", "Jetson reports error code {} when the camera pipeline stalls."),
+    ("L4T release {}", "The fix ships in L4T release {} for Orin modules."),
+    ("flag {}", "Start the service with the {} flag to keep the fan curve."),
+)
+
+
+def identifier(kind, rng):
+    if kind == 0:
+        return f"NVGPU-E{rng.randint(1000, 9999)}"
+    if kind == 1:
+        return f"R{rng.randint(32, 36)}.{rng.randint(0, 9)}.{rng.randint(0, 9)}{rng.choice('abcdefgh')}"
+    return "--" + "-".join(rng.choice(WORDS) for _ in range(2)) + f"-{rng.randint(10, 99)}"
+
+
+def write_corpus(doc_dir, count, targets, words_per_doc, seed):
+    """Random documents, the first `targets` of them with one planted identifier; returns the queries."""
+    rng = random.Random(seed)
+    os.makedirs(doc_dir, exist_ok=True)
+    queries, used = [], set()
+    for i in range(count):
+        words = [rng.choice(WORDS) for _ in range(words_per_doc)]
+        text = " ".join(words).capitalize() + "."
+        if i < targets:
+            kind = i % len(TEMPLATES)
+            value = identifier(kind, rng)
+            while value in used:
+                value = identifier(kind, rng)
+            used.add(value)
+            question, sentence = TEMPLATES[kind]
+            # Planted mid-document so the identifier lands inside one chunk
+            middle = len(text) // 2
+            text = text[:middle] + " " + sentence.format(value) + " " + text[middle:]
+            queries.append((f"How do I deal with {question.format(value)}?", value))
+        with open(os.path.join(doc_dir, f"doc-{i:06d}.txt"), "w") as f:
+            f.write(f"Document {seed}-{i}\n\n{text}\n")
+    rng.shuffle(queries)
+    return queries
+
+
+def measure(index, queries, retriever_kwargs):
+    from llama_index.core.schema import QueryBundle
+    from llama_index.core.settings import Settings
+    from utils.chat_history import count_tokens
+
+    retriever = index.as_retriever(**retriever_kwargs)
+    hits, search_ms, total_ms, tokens, chunks = 0, [], [], [], []
+    for question, value in queries:
+        start = time.perf_counter()
+        embedding = Settings.embed_model.get_query_embedding(question)
+        embedded = time.perf_counter()
+        nodes = retriever.retrieve(QueryBundle(question, embedding=embedding))
+        done = time.perf_counter()
+        search_ms.append((done - embedded) * 1000)
+        total_ms.append((done - start) * 1000)
+        texts = [node.node.get_content() for node in nodes]
+        hits += any(value in text for text in texts)
+        # What the context chat engine puts into the prompt
+        tokens.append(count_tokens("\n\n".join(texts)))
+        chunks.append(len(nodes))
+    return {
+        "hit_rate": hits / len(queries),
+        "chunks": sum(chunks) / len(chunks),
+        "prompt_tokens": sum(tokens) / len(tokens),
+        "search": percentiles(search_ms),
+        "total": percentiles(total_ms),
+    }
+
+
+def run(args, base_url, work_dir):
+    from llama_index.core.settings import Settings
+    from utils.index_cache import load_index
+    from utils.lexical import HYBRID_ALPHA, HYBRID_CANDIDATES
+    from utils.ollama_client import get_embed_model
+
+    Settings.embed_model = get_embed_model(EMBED_MODEL, base_url)
+    doc_dir = os.path.join(work_dir, "Documents", "hybrid")
+    index_path = os.path.join(work_dir, "Indexes", "hybrid")
+    queries = write_corpus(doc_dir, args.documents, args.queries, args.words_per_doc, args.seed)
+    build = build_index(index_path, doc_dir, "hybrid", "float32", lexical=True)
+    index = load_index(index_path)
+    modes = {
+        f"vector top-{VECTOR_TOP_K}": {"similarity_top_k": VECTOR_TOP_K},
+        f"vector top-{args.top_k}": {"similarity_top_k": args.top_k},
+        f"hybrid top-{args.top_k}": {
+            "similarity_top_k": HYBRID_CANDIDATES,
+            "vector_store_query_mode": "hybrid",
+            "sparse_top_k": HYBRID_CANDIDATES,
+            "hybrid_top_k": args.top_k,
+            "alpha": HYBRID_ALPHA,
+        },
+    }
+    results = {name: measure(index, queries, kwargs) for name, kwargs in modes.items()}
+    return build, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100, help="Target documents, one query each")
+    parser.add_argument("--words-per-doc", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=6, help="Chunks sent by the hybrid mode")
+    parser.add_argument("--seed", type=int, default=22)
+    parser.add_argument("--base-url", help="Use this Ollama server instead of the fake one")
+    fake_ollama.add_arguments(parser)
+    parser.add_argument("--json", help="Write results here (default benchmarks/results/hybrid-<timestamp>.json)")
+    args = parser.parse_args(argv)
+    args.queries = min(args.queries, args.documents)
+
+    work_dir = tempfile.mkdtemp(prefix="hybrid-bench-")
+    os.environ["EMBED_CACHE_PATH"] = os.path.join(work_dir, "embedding_cache.sqlite")
+    os.environ["METRICS_LOG_DIR"] = os.path.join(work_dir, "logs")
+    os.environ["METRICS_PORT"] = "0"
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        server, base_url = start_fake_server(args)
+    os.environ["OLLAMA_BASE_URL"] = base_url
+    try:
+        build, modes = run(args, base_url, work_dir)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{build['chunks']} chunks, {args.queries} identifier queries")
+    print(f"{'mode':>16} {'hit rate':>9} {'chunks':>7} {'prompt tokens':>14} {'search p50':>11} {'total p50':>10}")
+    for name, row in modes.items():
+        print(
+            f"{name:>16} {row['hit_rate']:9.1%} {row['chunks']:7.1f} {row['prompt_tokens']:14.0f} "
+            f"{row['search']['p50_ms']:9.2f}ms {row['total']['p50_ms']:8.2f}ms"
+        )
+
+    results = {
+        "benchmark": "hybrid",
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "settings": {key: value for key, value in vars(args).items() if key != "json"},
+        "build": build,
+        "modes": modes,
+    }
+    path = args.json or os.path.join(RESULTS_DIR, time.strftime("hybrid-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""End-to-end RAG benchmark against a deterministic fake Ollama server.
+
+Run from streamlit_app/:
+    python -m benchmarks.rag --sizes 100,1000,5000 --dim 1024
+    python -m benchmarks.rag --compare benchmarks/results/rag-<earlier run>.json
+
+For every corpus size (documents of --words-per-doc words) this builds a
+binary index the way the Manage Indexes page does, then measures index
+load time, query embedding + retrieval latency and time to first token of
+a RAG chat turn the way the chat page runs it. Plain chat TTFT and peak RSS
+are recorded once per run. The fake server (benchmarks.fake_ollama) runs in
+a child process so its CPU time and memory stay out of the numbers.
+
+Results go to --json (default benchmarks/results/rag-<timestamp>.json)
+together with the git commit and settings, so runs can be compared.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+from benchmarks import fake_ollama
+
+LLM_MODEL = "llama3.2:latest"
+EMBED_MODEL = "mxbai-embed-large:latest"
+TOP_K = 12
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+SYSTEM_PROMPT = "You are a helpful assistant. Answer using the context provided."
+# Metrics compared by --compare: (label, path into a size row, higher is better)
+COMPARED = (
+    ("build chunks/s", ("build", "chunks_per_s"), True),
+    ("load s", ("load", "median_s"), False),
+    ("retrieval p50 ms", ("retrieval", "total", "p50_ms"), False),
+    ("rag ttft p50 ms", ("rag_chat", "ttft", "p50_ms"), False),
+)
+
+WORDS = (
+    "jetson orin module carrier board power mode nvpmodel clock fan thermal sensor "
+    "camera csi pipeline gstreamer cuda kernel tensorrt engine precision fp16 int8 "
+    "calibration batch latency throughput memory swap storage nvme flash image "
+    "container docker runtime driver jetpack l4t ubuntu package update network "
+    "ethernet wifi bluetooth usb gpio i2c spi uart pwm pin header voltage current"
+).split()
+
+
+def percentiles(values_ms):
+    return {
+        "p50_ms": float(np.percentile(values_ms, 50)),
+        "p95_ms": float(np.percentile(values_ms, 95)),
+        "mean_ms": float(np.mean(values_ms)),
+    }
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def write_corpus(doc_dir, count, words_per_doc, seed):
+    rng = random.Random(seed)
+    os.makedirs(doc_dir, exist_ok=True)
+    for i in range(count):
+        sentences = []
+        remaining = words_per_doc
+        while remaining > 0:
+            length = min(rng.randint(8, 20), remaining)
+            sentences.append(" ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + ".")
+            remaining -= length
+        with open(os.path.join(doc_dir, f"doc-{i:06d}.txt"), "w") as f:
+            f.write(f"Document {seed}-{i}\n\n" + " ".join(sentences) + "\n")
+
+
+def make_queries(count, seed):
+    rng = random.Random(seed)
+    return [
+        "How do I configure the " + " ".join(rng.choice(WORDS) for _ in range(6)) + "?"
+        for _ in range(count)
+    ]
+
+
+def start_fake_server(args):
+    """Start benchmarks.fake_ollama in a child process; returns (process, base_url)."""
+    command = [
+        sys.executable, "-m", "benchmarks.fake_ollama", "--port", "0",
+        "--dim", str(args.dim),
+        "--token-rate", str(args.token_rate),
+        "--first-token-ms", str(args.first_token_ms),
+        "--answer-tokens", str(args.answer_tokens),
+        "--embed-ms", str(args.embed_ms),
+        "--embed-ms-per-text", str(args.embed_ms_per_text),
+    ]
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.dirname(__file__))
+    )
+    line = process.stdout.readline()
+    if not line.startswith("listening on "):
+        process.kill()
+        raise RuntimeError(f"Fake Ollama server did not start: {line!r}")
+    return process, line.split("listening on ", 1)[1].strip()
+
+
+def build_index(index_path, doc_dir, index_name, dtype, lexical=False):
+    # Same steps as pages/build_index.py for a new binary index
+    from llama_index.core import StorageContext, VectorStoreIndex
+    from utils.index_meta import update_index_metadata
+    from utils.indexing import file_sources, sync_index
+    from utils.manifest import load_manifest, save_manifest
+    from utils.vector_store import MmapVectorStore
+
+    start = time.perf_counter()
+    storage_context = StorageContext.from_defaults(vector_store=MmapVectorStore(dtype=dtype, lexical=lexical))
+    index = VectorStoreIndex(nodes=[], storage_context=storage_context)
+    manifest = load_manifest(index_path)
+    summary = sync_index(index, manifest, file_sources(doc_dir), index_name=index_name)
+    sync_s = time.perf_counter() - start
+    index.storage_context.persist(persist_dir=index_path)
+    save_manifest(index_path, manifest)
+    update_index_metadata(index_path, embedding_model=EMBED_MODEL)
+    total_s = time.perf_counter() - start
+    if summary["failed"]:
+        raise RuntimeError(f"Build failed for {len(summary['failed'])} sources: {summary['failed'][0]}")
+    chunks = summary["chunks_added"]
+    return {
+        "documents": summary["added"],
+        "chunks": chunks,
+        "total_s": total_s,
+        "persist_s": total_s - sync_s,
+        "parse_s": sum(summary["parse_seconds"].values()),
+        "chunks_per_s": chunks / total_s if total_s else 0.0,
+        "index_bytes": sum(
+            os.path.getsize(os.path.join(index_path, name)) for name in os.listdir(index_path)
+        ),
+    }
+
+
+def measure_load(index_path, repeats):
+    from utils.index_cache import load_index
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        index = load_index(index_path)
+        timings.append(time.perf_counter() - start)
+    return index, {"min_s": min(timings), "median_s": float(np.median(timings))}
+
+
+def measure_retrieval(index, queries):
+    from llama_index.core.schema import QueryBundle
+    from llama_index.core.settings import Settings
+
+    retriever = index.as_retriever(similarity_top_k=TOP_K)
+    embed_ms, retrieve_ms, total_ms = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        embedding = Settings.embed_model.get_query_embedding(query)
+        embedded = time.perf_counter()
+        retriever.retrieve(QueryBundle(query, embedding=embedding))
+        done = time.perf_counter()
+        embed_ms.append((embedded - start) * 1000)
+        retrieve_ms.append((done - embedded) * 1000)
+        total_ms.append((done - start) * 1000)
+    return {
+        "queries": len(queries),
+        "embedding": percentiles(embed_ms),
+        "search": percentiles(retrieve_ms),
+        "total": percentiles(total_ms),
+    }
+
+
+def measure_rag_chat(index_path, index_name, llm, questions):
+    # Mirrors the RAG branch of app.py: cached index, timed retriever, context chat engine
+    from llama_index.core.chat_engine import ContextChatEngine
+    from llama_index.core.memory import ChatMemoryBuffer
+    from llama_index.core.settings import Settings
+    from utils.index_cache import get_index_registry
+    from utils.metrics import timed_stream
+    from utils.retrieval import TimedRetriever
+
+    ttft_ms, turn_ms, tokens = [], [], 0
+    for question in questions:
+        turn_start = time.perf_counter()
+        rag_index = get_index_registry().get(index_path)
+        retriever = TimedRetriever(
+            rag_index.as_retriever(similarity_top_k=TOP_K), Settings.embed_model, index_name, LLM_MODEL
+        )
+        chat_engine = ContextChatEngine.from_defaults(
+            retriever=retriever,
+            memory=ChatMemoryBuffer.from_defaults(),
+            system_prompt=SYSTEM_PROMPT,
+            llm=llm,
+        )
+        stream = chat_engine.stream_chat(question)
+        first = None
+        for _ in timed_stream(stream.response_gen, turn_start, index_name, LLM_MODEL):
+            if first is None:
+                first = time.perf_counter()
+            tokens += 1
+        turn_ms.append((time.perf_counter() - turn_start) * 1000)
+        ttft_ms.append(((first or time.perf_counter()) - turn_start) * 1000)
+    return {"turns": len(questions), "ttft": percentiles(ttft_ms), "turn": percentiles(turn_ms), "chunks": tokens}
+
+
+def measure_plain_chat(client, questions):
+    ttft_ms, rates = [], []
+    for question in questions:
+        start = time.perf_counter()
+        first, count = None, 0
+        stream = client.chat(
+            model=LLM_MODEL,
+            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": question}],
+            stream=True,
+        )
+        for chunk in stream:
+            if not chunk["message"]["content"]:
+                continue
+            if first is None:
+                first = time.perf_counter()
+            count += 1
+        end = time.perf_counter()
+        ttft_ms.append(((first or end) - start) * 1000)
+        if first is not None and end > first:
+            rates.append(count / (end - first))
+    return {"turns": len(questions), "ttft": percentiles(ttft_ms), "tokens_per_s": float(np.mean(rates)) if rates else 0.0}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args, base_url, work_dir):
+    # Imported here: these modules read their settings from the environment set up in main()
+    from llama_index.core.settings import Settings
+    from utils.ollama_client import get_client, get_embed_model, get_llm
+
+    Settings.embed_model = get_embed_model(EMBED_MODEL, base_url)
+    llm = get_llm(LLM_MODEL, base_url)
+    Settings.llm = llm
+
+    rows = []
+    for size in args.sizes:
+        index_name = f"bench-{size}"
+        doc_dir = os.path.join(work_dir, "Documents", index_name)
+        index_path = os.path.join(work_dir, "Indexes", index_name)
+        # Text and queries are seeded by size so no run reuses another's cached embeddings
+        write_corpus(doc_dir, size, args.words_per_doc, seed=size)
+        row = {"documents": size}
+        row["build"] = build_index(index_path, doc_dir, index_name, args.dtype)
+        index, row["load"] = measure_load(index_path, args.load_repeats)
+        row["retrieval"] = measure_retrieval(index, make_queries(args.queries, seed=size))
+        del index
+        row["rag_chat"] = measure_rag_chat(index_path, index_name, llm, make_queries(args.chat_turns, seed=-size))
+        row["peak_rss_mb"] = peak_rss_mb()
+        rows.append(row)
+        print(format_row(row), flush=True)
+
+    chat = measure_plain_chat(get_client(base_url), make_queries(args.chat_turns, seed=0))
+    print(
+        f"plain chat: ttft p50 {chat['ttft']['p50_ms']:.0f} ms, {chat['tokens_per_s']:.1f} tokens/s",
+        flush=True,
+    )
+    return rows, chat
+
+
+def format_row(row):
+    build = row["build"]
+    return (
+        f"{row['documents']:>7} docs / {build['chunks']:>7} chunks | "
+        f"build {build['total_s']:7.2f} s ({build['chunks_per_s']:7.1f} chunks/s) | "
+        f"load {row['load']['median_s'] * 1000:8.1f} ms | "
+        f"retrieval p50 {row['retrieval']['total']['p50_ms']:7.2f} ms "
+        f"(search {row['retrieval']['search']['p50_ms']:6.2f}) | "
+        f"rag ttft p50 {row['rag_chat']['ttft']['p50_ms']:7.1f} ms | rss {row['peak_rss_mb']:.0f} MB"
+    )
+
+
+def lookup(row, path):
+    for key in path:
+        row = row.get(key) if isinstance(row, dict) else None
+    return row
+
+
+def compare(previous, current):
+    """Print per-size changes of the COMPARED metrics; positive % is an improvement."""
+    print(f"\nvs {previous.get('git_commit') or '?'} ({previous.get('started_at', '?')}):")
+    earlier = {row["documents"]: row for row in previous.get("sizes", [])}
+    for row in current["sizes"]:
+        base = earlier.get(row["documents"])
+        if base is None:
+            continue
+        changes = []
+        for label, path, higher_is_better in COMPARED:
+            old, new = lookup(base, path), lookup(row, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old if higher_is_better else (old - new) / old
+            changes.append(f"{label} {change:+.1%}")
+        print(f"{row['documents']:>7} docs | " + " | ".join(changes))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,5000", help="Corpus sizes in documents")
+    parser.add_argument("--words-per-doc", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=50, help="Retrieval queries per size")
+    parser.add_argument("--chat-turns", type=int, default=5, help="Chat turns per size for TTFT")
+    parser.add_argument("--load-repeats", type=int, default=3)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    fake_ollama.add_arguments(parser)
+    parser.add_argument("--json", help="Write results here (default benchmarks/results/rag-<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare this run against")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated corpus and indexes")
+    args = parser.parse_args(argv)
+    args.sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    work_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    # Fresh caches and logs per run, so earlier runs can't turn misses into hits
+    os.environ["EMBED_CACHE_PATH"] = os.path.join(work_dir, "embedding_cache.sqlite")
+    os.environ["WEB_CACHE_DIR"] = os.path.join(work_dir, "web_cache")
+    os.environ["METRICS_LOG_DIR"] = os.path.join(work_dir, "logs")
+    os.environ["METRICS_PORT"] = "0"
+
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    server, base_url = start_fake_server(args)
+    os.environ["OLLAMA_BASE_URL"] = base_url
+    try:
+        rows, chat = run(args, base_url, work_dir)
+        results = {
+            "benchmark": "rag",
+            "started_at": started_at,
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("json", "compare", "keep")},
+            "sizes": rows,
+            "plain_chat": chat,
+            "peak_rss_mb": peak_rss_mb(),
+            # Parse workers that have exited; the fake server is still running
+            "peak_children_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+        if args.keep:
+            print(f"Corpus and indexes kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    path = args.json or os.path.join(RESULTS_DIR, time.strftime("rag-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
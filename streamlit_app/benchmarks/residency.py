@@ -0,0 +1,186 @@
+"""Model preloading benchmark against the fake Ollama server.
+
+Run from streamlit_app/:
+    python -m benchmarks.residency --load-ms 3000 --memory-gb 16
+
+The fake server (benchmarks.fake_ollama) simulates cold loads of --load-ms
+and a memory limit of --memory-gb, with model sizes from the catalog below.
+Three scenarios, each with and without utils.residency:
+  switch    time to first token of the first question after switching the
+            LLM; the user takes --think-s to type it
+  rag       model loads over --turns RAG turns (embed, then chat) with an
+            LLM and embedding model that fit together, none loaded at first
+  thrash    the same with a pair that does not fit; the manager must warn
+A run fails (exit 1) if preloading does not remove the cold load or the
+thrashing pair is not flagged.
+"""
+import sys
+import json
+import time
+import argparse
+import urllib.request
+
+from benchmarks import fake_ollama
+
+GB = 1 << 30
+# RAM strings as they appear in model_catalog.json
+CATALOG = {
+    "llama3.2:latest": {"RAM": "~4-5 GB"},
+    "llama3:latest": {"RAM": "~8-10 GB"},
+    "llama3.1:latest": {"RAM": "~10-12 GB"},
+    "mxbai-embed-large:latest": {"RAM": "~1 GB"},
+    "bge-m3:latest": {"RAM": "~5-6 GB"},
+}
+FIRST_LLM = "llama3.2:latest"
+SWITCH_LLM = "llama3:latest"
+EMBED_MODEL = "mxbai-embed-large:latest"
+THRASH_PAIR = ("llama3.1:latest", "bge-m3:latest")
+
+
+def server_stats(base_url):
+    with urllib.request.urlopen(f"{base_url}/_stats") as response:
+        return json.load(response)
+
+
+def start_server(args):
+    from utils.residency import parse_ram
+
+    config = fake_ollama.FakeOllamaConfig(
+        dim=64,
+        first_token_ms=args.first_token_ms,
+        answer_tokens=8,
+        load_ms=args.load_ms,
+        memory_bytes=int(args.memory_gb * GB),
+        # The fake server charges what the catalog promises
+        model_bytes={name: parse_ram(entry["RAM"]) for name, entry in CATALOG.items()},
+    )
+    return fake_ollama.start_in_thread(config)
+
+
+def make_client(base_url, args, preload):
+    """(client, manager or None); with a manager, requests carry its keep_alive like the app's."""
+    from utils.ollama_client import ScheduledClient
+    from utils.residency import ResidencyManager
+    from utils.scheduler import Scheduler
+
+    manager = None
+    if preload:
+        manager = ResidencyManager(None, int(args.memory_gb * GB), keep_alive=args.keep_alive, catalog=lambda: CATALOG)
+    # A scheduler of its own keeps the shared one's limits out of the numbers
+    client = ScheduledClient(
+        host=base_url,
+        scheduler=Scheduler(max_per_model=4, max_models=4, swap_after=0),
+        keep_alive_for=manager.keep_alive_for if manager else None,
+    )
+    if manager:
+        manager.client = client
+    return client, manager
+
+
+def first_token_ms(client, model):
+    start = time.perf_counter()
+    stream = client.chat(model=model, messages=[{"role": "user", "content": "Hello"}], stream=True)
+    next(iter(stream))
+    ttft = (time.perf_counter() - start) * 1000
+    for _ in stream:
+        pass
+    return ttft
+
+
+def run_switch(args, preload):
+    server, base_url = start_server(args)
+    try:
+        client, manager = make_client(base_url, args, preload)
+        if manager:
+            manager.select("session", [FIRST_LLM])
+            manager.wait([FIRST_LLM])
+        first_token_ms(client, FIRST_LLM)
+        if manager:
+            manager.select("session", [SWITCH_LLM])
+        time.sleep(args.think_s)
+        return {"ttft_ms": first_token_ms(client, SWITCH_LLM), "loads": server_stats(base_url).get("loads", 0)}
+    finally:
+        server.shutdown()
+
+
+def run_rag(args, models, preload):
+    llm, embed = models
+    server, base_url = start_server(args)
+    try:
+        client, manager = make_client(base_url, args, preload)
+        report = None
+        if manager:
+            report = manager.select("session", models)
+            manager.wait(models)
+        time.sleep(args.think_s)
+        before = server_stats(base_url).get("loads", 0)
+        ttfts = []
+        for turn in range(args.turns):
+            start = time.perf_counter()
+            client.embed(model=embed, input=[f"question {turn}"])
+            stream = client.chat(model=llm, messages=[{"role": "user", "content": f"question {turn}"}], stream=True)
+            next(iter(stream))
+            ttfts.append((time.perf_counter() - start) * 1000)
+            for _ in stream:
+                pass
+        stats = server_stats(base_url)
+        return {
+            "loads_during_turns": stats.get("loads", 0) - before,
+            "evictions": stats.get("evictions", 0),
+            "first_turn_ttft_ms": ttfts[0],
+            "warning": report and report["warning"],
+        }
+    finally:
+        server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--load-ms", type=float, default=3000.0, help="Simulated cold load per model")
+    parser.add_argument("--memory-gb", type=float, default=16.0, help="Memory for loaded models")
+    parser.add_argument("--first-token-ms", type=float, default=150.0, help="Time to first token of a loaded model")
+    parser.add_argument("--think-s", type=float, default=None,
+                        help="Time between the switch and the question (default: load time + 1 s)")
+    parser.add_argument("--turns", type=int, default=5, help="RAG turns per scenario")
+    parser.add_argument("--keep-alive", default="30m", help="keep_alive the manager sends")
+    parser.add_argument("--json", default=None, help="Write results here")
+    args = parser.parse_args(argv)
+    if args.think_s is None:
+        args.think_s = args.load_ms / 1000 + 1.0
+
+    results = {"settings": vars(args).copy()}
+    for name, preload in (("cold", False), ("preload", True)):
+        results[name] = {
+            "switch": run_switch(args, preload),
+            "rag": run_rag(args, (SWITCH_LLM, EMBED_MODEL), preload),
+            "thrash": run_rag(args, THRASH_PAIR, preload),
+        }
+
+    print(f"{'':10} {'switch ttft':>12} {'rag loads':>10} {'1st rag ttft':>13} {'thrash loads':>13}")
+    for name in ("cold", "preload"):
+        row = results[name]
+        print(
+            f"{name:10} {row['switch']['ttft_ms']:10.0f}ms {row['rag']['loads_during_turns']:10d} "
+            f"{row['rag']['first_turn_ttft_ms']:11.0f}ms {row['thrash']['loads_during_turns']:13d}"
+        )
+    warning = results["preload"]["thrash"]["warning"]
+    print(f"thrash warning: {warning}")
+
+    failures = []
+    if results["preload"]["switch"]["ttft_ms"] >= args.load_ms:
+        failures.append("preloading did not hide the cold load after a switch")
+    if results["preload"]["rag"]["loads_during_turns"]:
+        failures.append("models were loaded during RAG turns despite preloading")
+    if not warning:
+        failures.append(f"{' + '.join(THRASH_PAIR)} was not flagged")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Retrieval latency: SimpleVectorStore (current default) vs the NumPy top-k engine.
+
+Run from streamlit_app/:
+    python -m benchmarks.retrieval --sizes 10000,100000,1000000 --dim 1024
+
+The SimpleVectorStore baseline keeps every embedding as a Python list, so it
+is skipped above --baseline-max vectors to keep the run within RAM.
+"""
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.simple import SimpleVectorStoreData
+from llama_index.core.vector_stores.types import (
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+)
+
+from utils.vector_store import MmapVectorStore
+
+TOP_K = 12
+
+
+def random_matrix(count, dim, seed):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((count, dim), dtype=np.float32)
+
+
+def time_queries(store, queries, filters=None):
+    latencies = []
+    for query in queries:
+        vector_query = VectorStoreQuery(
+            query_embedding=query.tolist(), similarity_top_k=TOP_K, filters=filters
+        )
+        start = time.perf_counter()
+        store.query(vector_query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def run(sizes, dim, num_queries, baseline_max, dtype):
+    results = []
+    queries = random_matrix(num_queries, dim, seed=1)
+    for size in sizes:
+        matrix = random_matrix(size, dim, seed=size)
+        ids = [f"node-{i}" for i in range(size)]
+        metadata = [{"file_name": f"doc-{i % 100}.pdf"} for i in range(size)]
+        row = {"vectors": size, "dim": dim, "dtype": dtype}
+
+        start = time.perf_counter()
+        store = MmapVectorStore.from_arrays(matrix, ids, metadata=metadata, dtype=dtype)
+        row["numpy_build_s"] = time.perf_counter() - start
+        row["numpy"] = time_queries(store, queries)
+        doc_filter = MetadataFilters(filters=[MetadataFilter(key="file_name", value="doc-7.pdf")])
+        row["numpy_filtered"] = time_queries(store, queries, filters=doc_filter)
+        del store
+
+        if size <= baseline_max:
+            simple = SimpleVectorStore(
+                data=SimpleVectorStoreData(embedding_dict=dict(zip(ids, matrix.tolist())))
+            )
+            row["simple"] = time_queries(simple, queries)
+            row["speedup_p50"] = row["simple"]["p50_ms"] / row["numpy"]["p50_ms"]
+            del simple
+        results.append(row)
+        print(format_row(row), flush=True)
+    return results
+
+
+def format_row(row):
+    simple = f"{row['simple']['p50_ms']:9.2f}" if "simple" in row else "  skipped"
+    speedup = f"{row['speedup_p50']:7.1f}x" if "speedup_p50" in row else "      -"
+    return (
+        f"{row['vectors']:>9} vectors | simple p50 {simple} ms | "
+        f"numpy p50 {row['numpy']['p50_ms']:8.2f} ms (filtered {row['numpy_filtered']['p50_ms']:7.2f} ms) | {speedup}"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--baseline-max", type=int, default=100000)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = run(sizes, args.dim, args.queries, args.baseline_max, args.dtype)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
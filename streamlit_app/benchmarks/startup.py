@@ -0,0 +1,227 @@
+"""Cold start and rerun cost of the Streamlit pages, each in fresh processes.
+
+Run from streamlit_app/:
+    python -m benchmarks.startup --repeats 5
+    python -m benchmarks.startup --compare benchmarks/results/startup-<earlier run>.json
+
+For every page, each repeat starts a new Python process, like a freshly
+started container:
+  imports   runs the page's module-level import statements and reports
+            their time and which heavy packages (llama_index, pandas, ...)
+            they pulled in; streamlit itself is imported first, as the
+            server has it loaded before any page runs
+  script    runs the page with streamlit.testing's AppTest: the first run
+            (cold: imports, assets, Ollama model list) and --reruns more
+            (what every widget interaction costs); skipped when streamlit
+            is not installed
+Pages that query Ollama talk to benchmarks.fake_ollama. With --compare, a
+page whose median got slower by more than --max-regression fails the run
+(exit 1).
+"""
+import os
+import ast
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+from benchmarks import fake_ollama
+from benchmarks.rag import RESULTS_DIR, git_commit
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ("app.py", "pages/build_index.py", "pages/model_list.py", "pages/metrics.py")
+# Packages worth knowing about when a page imports them at startup
+HEAVY_PACKAGES = ("llama_index", "pandas", "numpy", "PIL", "ollama", "httpx", "tiktoken")
+# Compared by --compare, lower is better
+COMPARED = ("imports_s", "cold_s", "rerun_s")
+
+
+def module_imports(path):
+    """The page's import statements at module level, in order."""
+    with open(path, "r") as f:
+        tree = ast.parse(f.read(), path)
+    return [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def child_imports(page):
+    try:
+        import streamlit  # noqa: F401
+    except ImportError:
+        pass
+    statements = module_imports(page)
+    skipped = []
+    start = time.perf_counter()
+    for node in statements:
+        code = compile(ast.Module(body=[node], type_ignores=[]), page, "exec")
+        try:
+            exec(code, {})
+        except ImportError as e:
+            skipped.append(str(e))
+    seconds = time.perf_counter() - start
+    loaded = sorted(name for name in HEAVY_PACKAGES if name in sys.modules)
+    return {"seconds": seconds, "heavy": loaded, "skipped": skipped}
+
+
+def child_script(page, reruns):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(page, default_timeout=120)
+    start = time.perf_counter()
+    app.run()
+    cold = time.perf_counter() - start
+    rerun_times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        rerun_times.append(time.perf_counter() - start)
+    errors = [str(exception.value) for exception in app.exception]
+    return {"cold": cold, "reruns": rerun_times, "errors": errors}
+
+
+def run_child(mode, page, env, reruns=0):
+    command = [sys.executable, "-m", "benchmarks.startup", "--child", mode, "--page", page, "--reruns", str(reruns)]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=APP_DIR, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"{mode} run of {page} failed:\n{result.stderr.strip()}")
+    # Pages log to stdout; the result is the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def streamlit_testing_available():
+    command = [sys.executable, "-c", "import streamlit.testing.v1"]
+    return subprocess.run(command, capture_output=True, cwd=APP_DIR).returncode == 0
+
+
+def measure_page(page, args, env, scripts):
+    imports = [run_child("imports", page, env) for _ in range(args.repeats)]
+    row = {
+        "page": page,
+        "imports_s": statistics.median(run["seconds"] for run in imports),
+        "heavy_imports": imports[-1]["heavy"],
+        "skipped_imports": imports[-1]["skipped"],
+        "cold_s": None,
+        "rerun_s": None,
+        "errors": [],
+    }
+    if scripts:
+        runs = [run_child("script", page, env, args.reruns) for _ in range(args.repeats)]
+        row["cold_s"] = statistics.median(run["cold"] for run in runs)
+        reruns = [seconds for run in runs for seconds in run["reruns"]]
+        row["rerun_s"] = statistics.median(reruns) if reruns else None
+        row["errors"] = sorted({error for run in runs for error in run["errors"]})
+    return row
+
+
+def format_ms(seconds):
+    return f"{seconds * 1000:8.0f}ms" if seconds is not None else f"{'—':>10}"
+
+
+def compare(previous, current, max_regression):
+    """Print per-page changes of the COMPARED metrics; returns the regressions beyond max_regression."""
+    print(f"\nvs {previous.get('git_commit') or '?'} ({previous.get('started_at', '?')}):")
+    earlier = {row["page"]: row for row in previous.get("pages", [])}
+    regressions = []
+    for row in current["pages"]:
+        base = earlier.get(row["page"])
+        if base is None:
+            continue
+        changes = []
+        for key in COMPARED:
+            old, new = base.get(key), row.get(key)
+            if not old or new is None:
+                continue
+            change = (old - new) / old
+            changes.append(f"{key} {change:+.1%}")
+            if -change > max_regression:
+                regressions.append(f"{row['page']} {key}: {old * 1000:.0f}ms -> {new * 1000:.0f}ms")
+        print(f"{row['page']:>22} | " + " | ".join(changes))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", default=",".join(PAGES), help="Pages to measure, relative to streamlit_app/")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh processes per page and measurement")
+    parser.add_argument("--reruns", type=int, default=5, help="Reruns per process after the cold run")
+    parser.add_argument("--base-url", help="Use this Ollama server instead of the fake one")
+    fake_ollama.add_arguments(parser)
+    parser.add_argument("--json", help="Write results here (default benchmarks/results/startup-<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare this run against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="With --compare, fail when a median is this much slower (0.25 = 25%%)")
+    parser.add_argument("--child", choices=["imports", "script"], help=argparse.SUPPRESS)
+    parser.add_argument("--page", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = child_imports(args.page) if args.child == "imports" else child_script(args.page, args.reruns)
+        print(json.dumps(result))
+        return 0
+
+    work_dir = tempfile.mkdtemp(prefix="startup-bench-")
+    env = dict(
+        os.environ,
+        PYTHONPATH=APP_DIR,
+        METRICS_LOG_DIR=os.path.join(work_dir, "logs"),
+        METRICS_PORT="0",
+        EMBED_CACHE_PATH=os.path.join(work_dir, "embedding_cache.sqlite"),
+    )
+    scripts = streamlit_testing_available()
+    if not scripts:
+        print("streamlit is not installed: measuring imports only")
+
+    server = None
+    if args.base_url:
+        env["OLLAMA_BASE_URL"] = args.base_url
+    else:
+        server, env["OLLAMA_BASE_URL"] = fake_ollama.start_in_thread(fake_ollama.config_from_args(args))
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    try:
+        rows = [measure_page(page, args, env, scripts) for page in args.pages.split(",") if page]
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'page':>22} {'imports':>10} {'cold run':>10} {'rerun':>10}  heavy imports")
+    for row in rows:
+        print(
+            f"{row['page']:>22} {format_ms(row['imports_s'])} {format_ms(row['cold_s'])} "
+            f"{format_ms(row['rerun_s'])}  {', '.join(row['heavy_imports']) or '—'}"
+        )
+        for error in row["errors"]:
+            print(f"{'':>22} error: {error}")
+
+    results = {
+        "benchmark": "startup",
+        "started_at": started_at,
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("json", "compare", "child", "page")},
+        "pages": rows,
+    }
+    path = args.json or os.path.join(RESULTS_DIR, time.strftime("startup-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.max_regression)
+        for regression in regressions:
+            print(f"FAIL: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
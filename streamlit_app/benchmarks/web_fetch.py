@@ -0,0 +1,155 @@
+"""Concurrent web fetching and its conditional-request cache, against a local HTTP server.
+
+Run from streamlit_app/:
+    python -m benchmarks.web_fetch --pages 16 --delay-ms 100 --per-host 2
+
+A stand-in server on 127.0.0.1 serves --pages HTML pages with an ETag and
+Last-Modified, answering each request after --delay-ms and 304 to a
+matching If-None-Match. utils.web_fetch.WebFetcher fetches them all twice
+with a fresh PageCache:
+  cold      every page is downloaded and converted; the server records the
+            most requests it had in flight at once
+  revalid.  the same URLs again; every page must come back as a 304 and be
+            served from the cache with the text of the first pass
+A run fails (exit 1) if more than --per-host requests were in flight at
+once, if fetching was not concurrent at all, or if a revalidation did not
+replay the cached text.
+"""
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.web_fetch import FETCHED, NOT_MODIFIED, PageCache, WebFetcher
+
+LAST_MODIFIED = "Wed, 01 Oct 2025 12:00:00 GMT"
+
+
+class PageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay_s):
+        super().__init__(address, PageHandler)
+        self.delay_s = delay_s
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.counts = {"200": 0, "304": 0}
+
+    def stats(self):
+        with self.lock:
+            return {"max_in_flight": self.max_in_flight, **self.counts}
+
+    def reset(self):
+        with self.lock:
+            self.max_in_flight = 0
+            self.counts = {"200": 0, "304": 0}
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.delay_s)
+            page = self.path.rsplit("/", 1)[-1]
+            etag = f'"page-{page}-v1"'
+            if self.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+            else:
+                status = 200
+                body = f"<html><body><h1>Page {page}</h1><p>Jetson notes for page {page}.</p></body></html>"
+                body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", LAST_MODIFIED)
+            if status == 200:
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            with server.lock:
+                server.counts[str(status)] += 1
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+def run_pass(fetcher, server, urls):
+    server.reset()
+    start = time.perf_counter()
+    results = fetcher.fetch_all(urls)
+    return results, time.perf_counter() - start, server.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=16, help="Pages served and fetched")
+    parser.add_argument("--delay-ms", type=float, default=100.0, help="Server time per request")
+    parser.add_argument("--concurrency", type=int, default=8, help="WebFetcher concurrency")
+    parser.add_argument("--per-host", type=int, default=2, help="WebFetcher requests per host")
+    parser.add_argument("--json", default=None, help="Write results here")
+    args = parser.parse_args(argv)
+
+    server = PageServer(("127.0.0.1", 0), args.delay_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True, name="page-server").start()
+    cache_dir = tempfile.mkdtemp(prefix="web-fetch-bench-")
+    urls = [f"http://127.0.0.1:{server.server_port}/page/{i}" for i in range(args.pages)]
+    try:
+        fetcher = WebFetcher(cache=PageCache(cache_dir), concurrency=args.concurrency, per_host=args.per_host)
+        cold, cold_s, cold_stats = run_pass(fetcher, server, urls)
+        warm, warm_s, warm_stats = run_pass(fetcher, server, urls)
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    serial_s = args.pages * args.delay_ms / 1000
+    print(f"{'':10} {'seconds':>8} {'200':>5} {'304':>5} {'in flight':>10}")
+    for name, seconds, stats in (("cold", cold_s, cold_stats), ("revalid.", warm_s, warm_stats)):
+        print(f"{name:10} {seconds:8.2f} {stats['200']:5d} {stats['304']:5d} {stats['max_in_flight']:10d}")
+    print(f"one request at a time would take {serial_s:.2f}s")
+
+    failures = []
+    errors = [f"{result.url}: {result.error}" for result in cold + warm if result.error]
+    failures.extend(f"fetch failed: {error}" for error in errors)
+    for name, stats in (("cold", cold_stats), ("revalidation", warm_stats)):
+        if stats["max_in_flight"] > args.per_host:
+            failures.append(f"{name}: {stats['max_in_flight']} requests in flight to one host, limit {args.per_host}")
+    if args.per_host > 1 and args.pages > 1 and cold_stats["max_in_flight"] < 2:
+        failures.append("pages were fetched one at a time")
+    if any(result.status != FETCHED for result in cold):
+        failures.append("the first pass did not download every page")
+    if warm_stats["304"] != args.pages or warm_stats["200"]:
+        failures.append(f"revalidation got {warm_stats['304']} 304s and {warm_stats['200']} full responses")
+    replayed = [
+        first.text is not None and second.status == NOT_MODIFIED and second.text == first.text
+        for first, second in zip(cold, warm)
+    ]
+    if not all(replayed):
+        failures.append(f"{replayed.count(False)} pages were not served from the cache after a 304")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    if args.json:
+        results = {
+            "settings": vars(args).copy(),
+            "cold": {"seconds": cold_s, **cold_stats},
+            "revalidation": {"seconds": warm_s, **warm_stats},
+            "serial_estimate_s": serial_s,
+        }
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,28 @@
 import streamlit as st
-import ollama
+from utils.startup import PageRun
+
+# Started before the other imports so the first run's import time is counted
+page_run = PageRun("build_index")
+
 import os
 import sys
 import time
 import logging
-import json
-from llama_index.core import (
-    VectorStoreIndex,
-    StorageContext,
-    SimpleDirectoryReader,
-    load_index_from_storage
+from utils.index_meta import read_index_metadata
+from utils.indexing import list_source_files
+from utils.ollama_client import OLLAMA_BASE_URL, get_model_registry
+from utils.build_jobs import (
+    DONE,
+    JOB_POLL_S,
+    QUEUED,
+    RUNNING,
+    check_index_job,
+    enqueue_index_job,
+    format_progress,
+    get_job_store,
+    get_worker_pool,
 )
-from llama_index.core.settings import Settings
-from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.readers.web import SimpleWebPageReader
 
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 os.environ["OLLAMA_HOST"] = OLLAMA_BASE_URL
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
@@ -34,27 +41,23 @@ def is_embedding_model(model_name):
         or "bge" in model_name.lower()
     )
 
-def write_index_metadata(index_path, embedding_model_name):
-    meta_path = os.path.join(index_path, "metadata.json")
-    metadata = {
-        "embedding_model": embedding_model_name,
-        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-    }
-    with open(meta_path, "w") as f:
-        json.dump(metadata, f, indent=2)
-
-def read_index_metadata(index_path):
-    meta_path = os.path.join(index_path, "metadata.json")
-    if os.path.exists(meta_path):
-        with open(meta_path, "r") as f:
-            return json.load(f)
-    else:
-        return {}
+# Vector storage formats offered for new indexes (label -> mmap dtype, None = legacy JSON)
+VECTOR_FORMATS = {
+    "Binary, float32": "float32",
+    "Binary, float16 (half the memory)": "float16",
+    "JSON (legacy)": None,
+}
+
+# In-memory vector compression for binary formats (label -> quantization kind)
+VECTOR_COMPRESSION = {
+    "None (exact search)": None,
+    "int8 (4x smaller, near-exact)": "int8",
+    "Product quantization (about 32x smaller)": "pq",
+}
 
 # Models from Ollama
 try:
-    ollama_models = ollama.list().get("models", [])
-    all_models = [m.get("name") or m.get("model") for m in ollama_models]
+    all_models = get_model_registry().model_names()
 except Exception as e:
     st.error(f"Failed to query Ollama host: {e}")
     all_models = []
@@ -114,6 +117,46 @@ with st.form("index_form", clear_on_submit=False):
                 embedding_models,
                 key="embedding_model_select"
             ) if embedding_models else ""
+            vector_format = st.selectbox(
+                "Vector storage format",
+                list(VECTOR_FORMATS),
+                key="vector_format_select"
+            )
+            disk_docstore = st.checkbox(
+                "Keep chunk text on disk (SQLite docstore)",
+                value=True,
+                key="disk_docstore",
+                help="Only the retrieved chunks are read per question, instead of loading every chunk with the index."
+            )
+            vector_compression = st.selectbox(
+                "Vector compression",
+                list(VECTOR_COMPRESSION),
+                key="vector_compression",
+                help="Binary formats only. Queries scan compact codes held in memory and re-score the best "
+                     "candidates exactly from disk. Memory saved and recall@12 are reported after the build."
+            )
+            rerank = st.number_input(
+                "Candidates re-scored exactly (multiple of top-k)", min_value=1, value=8, step=1, key="rerank"
+            )
+            build_lexical = st.checkbox(
+                "Keyword index for exact terms (BM25)",
+                value=True,
+                key="build_lexical",
+                help="Binary formats only. Chat also matches versions, CLI flags and error codes literally "
+                     "and fuses both rankings, so fewer chunks go into the prompt."
+            )
+            build_ann = st.checkbox(
+                "Build ANN index (IVF-flat, for very large indexes)",
+                key="build_ann",
+                help="Binary formats only. Queries scan the nprobe closest clusters instead of every vector."
+            )
+            ann_nlist = st.number_input(
+                "ANN clusters (nlist, 0 = auto)", min_value=0, value=0, step=64, key="ann_nlist"
+            )
+            ann_nprobe = st.number_input(
+                "ANN clusters probed per query (nprobe, higher = better recall)",
+                min_value=1, value=8, step=1, key="ann_nprobe"
+            )
         else:
             meta = read_index_metadata(os.path.join(INDEX_DIR, selected_existing))
             emb_locked = meta.get("embedding_model", default_embedding)
@@ -149,73 +192,155 @@ if submit_btn:
             st.error("Please upload at least one file or provide a URL.")
         else:
             index_name = new_index_name
+            appending = False
+            vector_dtype = VECTOR_FORMATS[vector_format]
+            ann_params = (
+                {"nlist": ann_nlist or None, "nprobe": ann_nprobe}
+                if vector_dtype and build_ann else None
+            )
+            quantization = (
+                {"kind": VECTOR_COMPRESSION[vector_compression], "m": None, "rerank": rerank}
+                if VECTOR_COMPRESSION[vector_compression] else None
+            )
+            lexical = bool(vector_dtype) and build_lexical
+            docstore = "sqlite" if disk_docstore else "json"
             go_build = True
     else:
         if not existing_indexes or selected_existing == "(No indexes)":
             st.error("No existing indexes to append to. Please create a new one.")
             go_build = False
-        elif not (uploaded_files or urls):
+        elif not (uploaded_files or urls or list_source_files(os.path.join(DOC_ROOT, selected_existing))):
+            # With no new input, an append re-syncs the index with its documents folder
             st.error("Please upload at least one file or provide a URL.")
             go_build = False
         else:
             index_name = selected_existing
+            # The index keeps its own storage options
+            appending = True
+            vector_dtype, ann_params, quantization, lexical, docstore = None, None, None, False, "json"
             go_build = True
 
     # --- If all validations passed ---
     if 'go_build' in locals() and go_build:
-        start_time = time.time()
-        st.info(f"Index target: `{index_name}` using embedding: `{embedding_model}`")
-        documents = []
-
-        uploaded_docs = []
-        if uploaded_files:
-            for file in uploaded_files:
-                file_path = os.path.join(DOC_ROOT, file.name)
-                with open(file_path, "wb") as f:
-                    f.write(file.read())
-                uploaded_docs.append(file_path)
-            st.success(f"Uploaded {len(uploaded_docs)} files.")
-
-        if uploaded_docs:
-            reader = SimpleDirectoryReader(input_dir=DOC_ROOT, recursive=False)
-            all_docs = reader.load_data()
-            for i, doc in enumerate(all_docs):
-                st.write(f"Processing: {doc.metadata.get('file_name', 'Unnamed')}")
-                documents.append(doc)
-            st.success("✅ All local documents processed.")
-
-        if urls:
-            st.write("🔍 Fetching web documents...")
-            web_docs = []
-            for url in urls:
-                try:
-                    doc = SimpleWebPageReader(html_to_text=True).load_data([url])
-                    web_docs.extend(doc)
-                except Exception as e:
-                    st.warning(f"Failed to load {url}: {e}")
-            documents.extend(web_docs)
-            st.success("✅ All web documents processed.")
-
-        Settings.embed_model = OllamaEmbedding(model_name=embedding_model, base_url=OLLAMA_BASE_URL)
-
-        if mode == "Append to existing index" and os.path.exists(os.path.join(INDEX_DIR, index_name)):
-            st.info(f"Appending to existing index `{index_name}`...")
-            storage_context = StorageContext.from_defaults(persist_dir=os.path.join(INDEX_DIR, index_name))
-            try:
-                index = load_index_from_storage(storage_context)
-                index.insert_documents(documents)
-                st.success(f"Documents added to index `{index_name}`.")
-                write_index_metadata(os.path.join(INDEX_DIR, index_name), embedding_model)
-            except Exception as e:
-                st.error(f"Failed to append to index: {e}")
+        index_path = os.path.join(INDEX_DIR, index_name)
+        doc_dir = os.path.join(DOC_ROOT, index_name)
+
+        if not appending and os.path.exists(index_path):
+            st.warning("Index name already exists! Pick a different name or choose 'Append'.")
         else:
-            if os.path.exists(os.path.join(INDEX_DIR, index_name)):
-                st.warning("Index name already exists! Pick a different name or choose 'Append'.")
+            job_options = dict(
+                append=appending, vector_dtype=vector_dtype, ann_params=ann_params,
+                quantization=quantization, lexical=lexical,
+            )
+            written, created_dir = [], False
+            try:
+                # Checked before any upload is written, so a rejected job leaves Documents/ as it was
+                check_index_job(index_name, **job_options)
+                # Uploads are kept per index so later appends can spot changed or removed files
+                created_dir = not os.path.exists(doc_dir)
+                os.makedirs(doc_dir, exist_ok=True)
+                if uploaded_files:
+                    for file in uploaded_files:
+                        path = os.path.join(doc_dir, file.name)
+                        if not os.path.exists(path):
+                            written.append(path)
+                        with open(path, "wb") as f:
+                            f.write(file.read())
+                    st.success(f"Uploaded {len(uploaded_files)} files.")
+                job_id = enqueue_index_job(
+                    index_name, embedding_model, urls=urls, docstore=docstore, **job_options
+                )
+            except ValueError as e:
+                # Another session may have queued a job for this name since the check
+                for path in written:
+                    os.remove(path)
+                if created_dir and not os.listdir(doc_dir):
+                    os.rmdir(doc_dir)
+                st.error(str(e))
             else:
-                st.info(f"Building new index `{index_name}`...")
-                index = VectorStoreIndex.from_documents(documents)
-                index.storage_context.persist(persist_dir=os.path.join(INDEX_DIR, index_name))
-                write_index_metadata(os.path.join(INDEX_DIR, index_name), embedding_model)
-                st.success(f"Index `{index_name}` created successfully in {time.time() - start_time:.1f} seconds.")
+                get_worker_pool().ensure()
+                st.success(
+                    f"Queued job #{job_id}: {'append to' if appending else 'build'} `{index_name}` "
+                    f"using embedding `{embedding_model}`. It keeps running if you leave this page."
+                )
+
+def show_job_result(job):
+    result = job["result"]
+    for warning in result.get("warnings", []):
+        st.warning(warning)
+    for key, error in result.get("failed", []):
+        st.warning(f"Failed to load {key}: {error}")
+    st.write(f"{job['message']} ({result.get('seconds', 0):.1f} seconds)")
+    web = result.get("web")
+    if web:
+        st.caption(
+            f"Web: fetched {web['fetched']}/{web['requested']} documents "
+            f"({web['not_modified']} unchanged since last fetch)"
+        )
+    st.caption(
+        f"Embedding cache: {result.get('embeddings_reused', 0)} chunks reused, "
+        f"{result.get('embeddings_sent', 0)} sent to Ollama"
+    )
+    if result.get("slowest_parses"):
+        st.table([{"source": key, "seconds": round(seconds, 2)} for key, seconds in result["slowest_parses"]])
+    ann_report = result.get("ann")
+    if ann_report:
+        st.info(
+            f"ANN index: {ann_report['nlist']} clusters, nprobe {ann_report['nprobe']}, "
+            f"recall@12 {ann_report['recall_at_12']:.3f} vs exact search "
+            f"({ann_report['ann_ms']:.2f} ms vs {ann_report['exact_ms']:.2f} ms per query)"
+        )
+    quant_report = result.get("quantization")
+    if quant_report:
+        st.info(
+            f"{quant_report['kind']} vectors: {quant_report['bytes_codes'] / (1024 * 1024):.1f} MB in memory instead of "
+            f"{quant_report['bytes_full'] / (1024 * 1024):.1f} MB ({quant_report['memory_saved']:.0%} saved). "
+            f"recall@12 {quant_report['recall_at_12']:.3f} vs exact search after re-scoring "
+            f"{quant_report['rerank_candidates']} candidates ({quant_report['first_pass_recall_at_12']:.3f} without), "
+            f"{quant_report['quantized_ms']:.2f} ms vs {quant_report['exact_ms']:.2f} ms per query"
+        )
+    lexical_report = result.get("lexical")
+    if lexical_report:
+        st.caption(
+            f"Keyword index: {lexical_report['terms']} terms, {lexical_report['postings']} postings "
+            f"({lexical_report['bytes'] / (1024 * 1024):.1f} MB)"
+        )
+
+
+@st.fragment(run_every=JOB_POLL_S)
+def job_status():
+    jobs = get_job_store().jobs(limit=20)
+    if not jobs:
+        return
+    workers = get_worker_pool().ensure()
+    st.subheader("Index Jobs")
+    st.caption(f"{workers} worker(s) started by this app; jobs can also be run with `python -m utils.build_jobs worker`.")
+    st.dataframe(
+        [
+            {
+                "Job": job["id"],
+                "Index": job["index_name"],
+                "Kind": job["kind"],
+                "Status": job["status"] + (" (cancelling)" if job["cancel_requested"] and job["status"] == RUNNING else ""),
+                "Progress": format_progress(job) or job["message"] or "",
+                "Queued": time.strftime("%H:%M:%S", time.localtime(job["created_at"])),
+            }
+            for job in jobs
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+    for job in jobs:
+        if job["status"] in (QUEUED, RUNNING) and not job["cancel_requested"]:
+            if st.button(f"Cancel job #{job['id']} ({job['index_name']})", key=f"cancel_job_{job['id']}"):
+                get_job_store().cancel(job["id"])
+        elif job["status"] == DONE and job["result"]:
+            with st.expander(f"Job #{job['id']}: {job['kind']} `{job['index_name']}`"):
+                show_job_result(job)
+
+
+job_status()
 
 st.page_link("app.py", label="⬅️ Back to Chat", icon="💬")
+
+page_run.finish()
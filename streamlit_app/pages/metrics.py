@@ -0,0 +1,82 @@
+import streamlit as st
+import pandas as pd
+from utils.metrics import METRICS_LOG_DIR, METRICS_PORT, get_metrics
+from utils.scheduler import get_scheduler
+
+st.set_page_config(
+    page_title="Jetson Copilot - Latency Metrics",
+    page_icon="📈",
+    layout="wide"
+)
+
+st.title("Latency Metrics")
+st.caption(
+    f"Percentiles over the most recent samples since the app started. "
+    f"Prometheus: :{METRICS_PORT}/metrics · JSONL log: {METRICS_LOG_DIR}/"
+)
+
+rows = get_metrics().summary()
+if st.button("🔄 Refresh"):
+    st.rerun()
+
+
+def metrics_table(prefix):
+    selected = [row for row in rows if row["metric"].startswith(prefix)]
+    if not selected:
+        return None
+    table = []
+    for row in selected:
+        seconds = row["metric"].endswith("_seconds")
+        # Latencies in milliseconds, rates as they are
+        scale = 1000 if seconds else 1
+        unit = "ms" if seconds else "tok/s"
+        table.append({
+            "Metric": row["metric"].removeprefix(prefix).removesuffix("_seconds"),
+            "Index": row["index"] or "—",
+            "Model": row["model"] or "—",
+            "Count": row["count"],
+            "p50": f"{row['p50'] * scale:.1f} {unit}",
+            "p95": f"{row['p95'] * scale:.1f} {unit}",
+            "p99": f"{row['p99'] * scale:.1f} {unit}",
+            "Mean": f"{row['mean'] * scale:.1f} {unit}",
+        })
+    return pd.DataFrame(table)
+
+
+SECTIONS = (
+    ("Chat", "chat_"),
+    ("Retrieval", "rag_"),
+    ("Answer Cache", "answer_cache_"),
+    ("Index Builds", "build_"),
+    # First run of each page in this process vs. later reruns
+    ("Page Loads", "page_"),
+)
+for title, prefix in SECTIONS:
+    df = metrics_table(prefix)
+    if df is not None:
+        st.subheader(title)
+        st.dataframe(df, use_container_width=True, hide_index=True)
+
+if not rows:
+    st.info("No samples yet. Ask a question or build an index, then refresh.")
+
+queue = get_scheduler().stats()
+if queue["models"]:
+    st.subheader("Ollama Queue")
+    st.dataframe(
+        pd.DataFrame([
+            {
+                "Model": model,
+                "Running": info["running"],
+                "Queued": info["queued"],
+                "Admitted": info["admitted"],
+                "Wait avg": f"{info['wait_avg_s'] * 1000:.0f} ms",
+                "Wait p95": f"{info['wait_p95_s'] * 1000:.0f} ms",
+            }
+            for model, info in queue["models"].items()
+        ]),
+        use_container_width=True,
+        hide_index=True,
+    )
+
+st.page_link("app.py", label="⬅️ Back to Home", icon="🏠")
@@ -1,8 +1,13 @@
 import streamlit as st
-import ollama
+from utils.startup import PageRun
+
+# Started before the other imports so the first run's import time is counted
+page_run = PageRun("model_list")
+
 import pandas as pd
-import json
 import os
+from utils.ollama_client import get_model_registry
+from utils.model_catalog import CATALOG_PATH, DEFAULT_CONTEXT_TOKENS, load_model_catalog
 
 st.set_page_config(
     page_title="Jetson Copilot - Model Catalog", 
@@ -12,23 +17,13 @@ st.set_page_config(
 
 st.title("Available Models on Host")
 
-# Path to the model catalog (mount as /app/model_catalog.json)
-CATALOG_PATH = os.getenv("MODEL_CATALOG_PATH", "/app/model_catalog.json")
-
-def load_model_catalog():
-    if os.path.exists(CATALOG_PATH):
-        with open(CATALOG_PATH, "r") as f:
-            return json.load(f)
-    else:
-        st.warning("Model catalog not found. Showing basic model info only.")
-        return {}
-
 catalog = load_model_catalog()
+if not os.path.exists(CATALOG_PATH):
+    st.warning("Model catalog not found. Showing basic model info only.")
 
 # Get models from Ollama host API
 try:
-    models_resp = ollama.list()
-    models_list = models_resp.get("models", [])
+    models_list = get_model_registry().models()
 except Exception as e:
     st.error(f"Failed to query Ollama on host: {e}")
     models_list = []
@@ -55,6 +50,7 @@ for model_entry in models_list:
     jetson_safe = cat_info.get("JetsonSafe", "N/A")
     why = cat_info.get("Why", "")
     reasoning = cat_info.get("Reasoning", "N/A")
+    context = str(cat_info.get("Context", f"{DEFAULT_CONTEXT_TOKENS} (default)"))
 
     row = {
         "Model": model_name,
@@ -68,6 +64,7 @@ for model_entry in models_list:
         embed_rows.append(row)
     else:
         row["Reasoning"] = reasoning
+        row["Context"] = context
         llm_rows.append(row)
 
 # --- Show Language Models ---
@@ -109,7 +106,7 @@ st.markdown("""
        ```
     3. Or, mount a shared models volume when launching the container.
 
-- **To update model metadata** (RAM, Jetson safety, etc.),  
+- **To update model metadata** (RAM, Jetson safety, context size, etc.),  
     - Edit `model_catalog.json` on the host.
     - **No need to rebuild the app container!**
 
@@ -119,3 +116,5 @@ st.markdown("""
 """)
 
 st.page_link("app.py", label="⬅️ Back to Home", icon="🏠")
+
+page_run.finish()
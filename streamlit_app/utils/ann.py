@@ -0,0 +1,184 @@
+"""IVF-flat approximate nearest-neighbour index in pure NumPy.
+
+Vectors are partitioned with spherical k-means into nlist inverted lists.
+A query scores the nlist centroids, then scans only the rows of the nprobe
+closest lists, so nprobe trades recall for speed at query time.
+
+Files written next to vectors.npy:
+    ann_centroids.npy   (nlist, dim) float32 unit centroids
+    ann_rows.npy        row numbers grouped by list
+    ann_offsets.npy     (nlist + 1,) start of each list in ann_rows.npy
+"""
+import os
+import time
+
+import numpy as np
+
+from utils.retrieval import BLOCK_ROWS, DenseTopK, normalize_query, normalize_rows, top_k
+
+ANN_KIND = "ivf_flat"
+CENTROIDS_FNAME = "ann_centroids.npy"
+ROWS_FNAME = "ann_rows.npy"
+OFFSETS_FNAME = "ann_offsets.npy"
+DEFAULT_NPROBE = 8
+DEFAULT_NITER = 10
+# k-means is trained on at most this many rows per list
+TRAIN_ROWS_PER_LIST = 256
+RECALL_K = 12
+RECALL_QUERIES = 200
+
+
+def auto_nlist(count):
+    return max(1, min(count, int(4 * np.sqrt(count))))
+
+
+def _assign(matrix, centroids):
+    """Index of the closest centroid for every row, computed blockwise."""
+    assign = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + BLOCK_ROWS], dtype=np.float32)
+        assign[start:start + BLOCK_ROWS] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def _kmeans(data, nlist, niter, rng):
+    centroids = data[rng.choice(data.shape[0], nlist, replace=False)].copy()
+    for _ in range(niter):
+        assign = _assign(data, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        sums[filled] = np.add.reduceat(data[order], starts, axis=0)
+        # Re-seed empty lists with random rows so every list stays usable
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = data[rng.choice(data.shape[0], empty.size)]
+        centroids = normalize_rows(sums, np.float32)
+    return centroids
+
+
+class IVFFlatIndex:
+    def __init__(self, centroids, rows, offsets, nprobe=DEFAULT_NPROBE):
+        self.centroids = centroids
+        self.rows = rows
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @property
+    def count(self):
+        """Number of matrix rows covered; later rows must be scanned exactly."""
+        return self.rows.shape[0]
+
+    @classmethod
+    def build(cls, matrix, nlist=None, nprobe=DEFAULT_NPROBE, niter=DEFAULT_NITER, seed=0, train_rows=None):
+        """Cluster the unit-normalized matrix; train_rows restricts k-means training."""
+        rng = np.random.default_rng(seed)
+        count = matrix.shape[0]
+        if train_rows is None:
+            train_rows = np.arange(count)
+        # k-means seeds every list with a distinct training row
+        nlist = min(nlist or auto_nlist(count), train_rows.shape[0])
+        sample_size = min(train_rows.shape[0], nlist * TRAIN_ROWS_PER_LIST)
+        sample = np.sort(rng.choice(train_rows, sample_size, replace=False))
+        centroids = _kmeans(np.asarray(matrix[sample], dtype=np.float32), nlist, niter, rng)
+
+        assign = _assign(matrix, centroids)
+        rows = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        return cls(centroids, rows, offsets, nprobe=nprobe)
+
+    def search(self, matrix, query, k, mask=None, nprobe=None):
+        """Return (rows, scores) of the best k rows among the probed lists."""
+        query = normalize_query(query)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+        candidates = np.concatenate([self.rows[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+        # Sorted rows turn the gather into mostly sequential reads of the mmap
+        candidates.sort()
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        if candidates.size == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+        scores = np.asarray(matrix[candidates], dtype=np.float32) @ query
+        selected, scores = top_k(scores, k)
+        return candidates[selected], scores
+
+    def save(self, index_path):
+        for fname, array in (
+            (CENTROIDS_FNAME, self.centroids),
+            (ROWS_FNAME, self.rows),
+            (OFFSETS_FNAME, self.offsets),
+        ):
+            tmp_path = os.path.join(index_path, fname + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, os.path.join(index_path, fname))
+
+    @classmethod
+    def load(cls, index_path, nprobe=DEFAULT_NPROBE):
+        return cls(
+            np.load(os.path.join(index_path, CENTROIDS_FNAME)),
+            np.load(os.path.join(index_path, ROWS_FNAME), mmap_mode="r"),
+            np.load(os.path.join(index_path, OFFSETS_FNAME)),
+            nprobe=nprobe,
+        )
+
+
+def remove_ann_files(index_path):
+    for fname in (CENTROIDS_FNAME, ROWS_FNAME, OFFSETS_FNAME):
+        path = os.path.join(index_path, fname)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def build_with_recall(matrix, nlist=None, nprobe=DEFAULT_NPROBE, seed=0):
+    """Build an IVF index and measure recall@12 against exact search.
+
+    A random set of rows is held out of k-means training and used as the
+    query set, so the recall figure is not flattered by the centroids
+    having been fitted to the queries. Each query's own row is dropped from
+    both result lists, since it is still indexed and always found.
+    """
+    rng = np.random.default_rng(seed)
+    count = matrix.shape[0]
+    num_queries = min(RECALL_QUERIES, max(1, count // 10))
+    held_out = rng.choice(count, num_queries, replace=False)
+    train_rows = np.setdiff1d(np.arange(count), held_out) if count > num_queries else np.arange(count)
+
+    start = time.perf_counter()
+    ann = IVFFlatIndex.build(matrix, nlist=nlist, nprobe=nprobe, seed=seed, train_rows=train_rows)
+    build_seconds = time.perf_counter() - start
+
+    exact = DenseTopK(matrix)
+    hits, exact_ms, ann_ms = 0, 0.0, 0.0
+    for row in held_out:
+        query = np.asarray(matrix[row], dtype=np.float32)
+        start = time.perf_counter()
+        truth, _ = exact.search(query, RECALL_K + 1)
+        exact_ms += (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        found, _ = ann.search(matrix, query, RECALL_K + 1)
+        ann_ms += (time.perf_counter() - start) * 1000
+        truth = truth[truth != row][:RECALL_K]
+        found = found[found != row][:RECALL_K]
+        hits += np.intersect1d(truth, found).size
+    neighbours = min(RECALL_K, count - 1)
+    report = {
+        "kind": ANN_KIND,
+        "nlist": ann.nlist,
+        "nprobe": ann.nprobe,
+        "count": ann.count,
+        "recall_at_12": hits / (num_queries * neighbours) if neighbours else 1.0,
+        "recall_queries": int(num_queries),
+        "exact_ms": exact_ms / num_queries,
+        "ann_ms": ann_ms / num_queries,
+        "build_seconds": build_seconds,
+    }
+    return ann, report
@@ -0,0 +1,646 @@
+"""Persistent queue of index build and append jobs, run by worker processes.
+
+Jobs are rows in a SQLite file (BUILD_JOBS_DB), so they survive Streamlit
+restarts and can be enqueued without the UI. From streamlit_app/:
+    python -m utils.build_jobs enqueue manuals --model mxbai-embed-large:latest --docs ~/pdfs
+    python -m utils.build_jobs enqueue manuals --append --url https://example.com/faq --wait
+    python -m utils.build_jobs worker
+    python -m utils.build_jobs list
+    python -m utils.build_jobs cancel 12
+
+Workers are separate `python -m utils.build_jobs worker` processes; the
+Manage Indexes page starts up to BUILD_JOB_WORKERS of them when jobs are
+queued, so a build no longer dies with the browser tab that started it.
+  - one job per index at a time: claiming skips indexes with a running job,
+    and a file lock (Indexes/.<name>.lock) guards against other processes
+  - running jobs heartbeat; a job whose worker stopped heartbeating is
+    requeued, up to JOB_MAX_ATTEMPTS times, and resumes from its last
+    checkpoint (index and manifest are persisted every BUILD_CHECKPOINT_S)
+  - cancellation is cooperative and takes effect between sources; the index
+    on disk is left as of the last checkpoint
+  - a new index whose build fails, or is cancelled before its first
+    checkpoint, is removed, so the name can be used again
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+import subprocess
+from contextlib import closing, contextmanager
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = "Indexes"
+DOC_ROOT = "Documents"
+BUILD_JOBS_DB = os.getenv("BUILD_JOBS_DB", os.path.join(INDEX_DIR, ".build_jobs.sqlite"))
+BUILD_JOB_WORKERS = int(os.getenv("BUILD_JOB_WORKERS", "1"))
+BUILD_CHECKPOINT_S = float(os.getenv("BUILD_CHECKPOINT_S", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_HEARTBEAT_S = 10.0
+# A running job whose heartbeat is older than this is considered orphaned
+JOB_STALE_S = 6 * JOB_HEARTBEAT_S
+JOB_POLL_S = 2.0
+# Workers started by the page exit after this long without work
+JOB_WORKER_IDLE_S = 60.0
+# Minimum interval between progress writes
+PROGRESS_WRITE_S = 1.0
+
+BUILD = "build"
+APPEND = "append"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE = (QUEUED, RUNNING)
+
+_JSON_FIELDS = ("params", "progress", "result")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobStore:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, index_name TEXT NOT NULL, "
+                "params TEXT NOT NULL, status TEXT NOT NULL, created_at REAL NOT NULL, "
+                "started_at REAL, finished_at REAL, heartbeat_at REAL, worker TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, cancel_requested INTEGER NOT NULL DEFAULT 0, "
+                "progress TEXT, message TEXT, result TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, id)")
+
+    def _connect(self):
+        # Short-lived connections: the store is shared by Streamlit threads and worker processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        for field in _JSON_FIELDS:
+            job[field] = json.loads(job[field]) if job[field] else {}
+        return job
+
+    def enqueue(self, kind, index_name, params):
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, index_name, params, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, index_name, json.dumps(params), QUEUED, time.time()),
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker):
+        """Mark the oldest queued job on an index without a running job as ours."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND index_name NOT IN "
+                    "(SELECT index_name FROM jobs WHERE status = ?) ORDER BY id LIMIT 1",
+                    (QUEUED, RUNNING),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, started_at = COALESCE(started_at, ?), "
+                        "heartbeat_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        (RUNNING, worker, now, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"]) if row is not None else None
+
+    def heartbeat(self, job_id, progress=None):
+        """Record liveness (and progress); returns True if cancellation was requested."""
+        with closing(self._connect()) as conn:
+            if progress is None:
+                conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+            else:
+                conn.execute(
+                    "UPDATE jobs SET heartbeat_at = ?, progress = ? WHERE id = ?",
+                    (time.time(), json.dumps(progress), job_id),
+                )
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def finish(self, job_id, status, message="", result=None):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, message = ?, result = ? WHERE id = ?",
+                (status, time.time(), message, json.dumps(result or {}), job_id),
+            )
+
+    def cancel(self, job_id):
+        """Cancel a queued job now, or ask a running one to stop; False if already finished."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, message = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), "Cancelled before it started", job_id, QUEUED),
+            )
+            if cursor.rowcount:
+                return True
+            cursor = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING)
+            )
+            return bool(cursor.rowcount)
+
+    def recover(self, stale_after=JOB_STALE_S, max_attempts=JOB_MAX_ATTEMPTS):
+        """Requeue running jobs whose worker stopped heartbeating; returns how many."""
+        now = time.time()
+        cutoff = now - stale_after
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, message = ? "
+                "WHERE status = ? AND heartbeat_at < ? AND cancel_requested = 1",
+                (CANCELLED, now, "Cancelled; the worker had stopped", RUNNING, cutoff),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, message = ? "
+                "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+                (FAILED, now, f"Worker stopped {max_attempts} times; giving up", RUNNING, cutoff, max_attempts),
+            )
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, message = ? WHERE status = ? AND heartbeat_at < ?",
+                (QUEUED, "Worker stopped; resuming from the last checkpoint", RUNNING, cutoff),
+            )
+            if cursor.rowcount:
+                logger.warning(f"Requeued {cursor.rowcount} orphaned build jobs")
+            return cursor.rowcount
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            return self._job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def jobs(self, limit=20):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def active(self, index_name=None):
+        query = "SELECT * FROM jobs WHERE status IN (?, ?)"
+        args = list(ACTIVE)
+        if index_name is not None:
+            query += " AND index_name = ?"
+            args.append(index_name)
+        with closing(self._connect()) as conn:
+            return [self._job(row) for row in conn.execute(query + " ORDER BY id", args)]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_job_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore(BUILD_JOBS_DB)
+        return _store
+
+
+def check_index_job(index_name, append=False, vector_dtype="float32", ann_params=None, quantization=None,
+                    lexical=False):
+    """Raise ValueError if enqueue_index_job() would reject these options, so callers can check before writing files."""
+    index_path = os.path.join(INDEX_DIR, index_name)
+    pending = get_job_store().active(index_name)
+    if append:
+        if not os.path.exists(index_path) and not any(job["kind"] == BUILD for job in pending):
+            raise ValueError(f"Index '{index_name}' does not exist")
+    elif os.path.exists(index_path) or pending:
+        raise ValueError(f"Index '{index_name}' already exists or is being built")
+    if quantization and (not vector_dtype or ann_params):
+        raise ValueError("Quantized vectors need a binary vector format and no ANN index")
+    if lexical and not vector_dtype:
+        raise ValueError("A keyword index needs a binary vector format")
+
+
+def enqueue_index_job(
+    index_name, embedding_model, append=False, urls=(), vector_dtype="float32", ann_params=None, docstore="sqlite",
+    quantization=None, lexical=False,
+):
+    """Validate and queue a build (new index) or append job; returns the job id.
+
+    Files must already be in Documents/<index_name>; URLs are fetched by the job.
+    quantization ({"kind": "int8" or "pq", "m", "rerank"}) needs a binary
+    vector format and excludes an ANN index. lexical (BM25 postings) needs a
+    binary vector format; appends keep whatever the index has.
+    """
+    check_index_job(index_name, append, vector_dtype, ann_params, quantization, lexical)
+    params = {
+        "embedding_model": embedding_model,
+        "urls": list(urls),
+        "vector_dtype": vector_dtype,
+        "ann_params": ann_params,
+        "docstore": docstore,
+        "quantization": quantization,
+        "lexical": lexical,
+    }
+    return get_job_store().enqueue(APPEND if append else BUILD, index_name, params)
+
+
+@contextmanager
+def index_lock(index_name):
+    """Exclusive lock on an index across processes, held while a job writes it."""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with open(os.path.join(INDEX_DIR, f".{index_name}.lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class JobReporter:
+    """Progress writes, heartbeats and cancellation checks for one running job."""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self.progress = {"phase": "starting"}
+        self.cancel_requested = False
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, daemon=True, name=f"job-{job_id}-heartbeat")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _beat(self):
+        # Keeps the job alive through long parses or embedding batches with no progress callback
+        while not self._stop.wait(JOB_HEARTBEAT_S):
+            self._write()
+
+    def _write(self):
+        with self._lock:
+            progress = dict(self.progress)
+            self._last_write = time.monotonic()
+        try:
+            if self.store.heartbeat(self.job_id, progress):
+                self.cancel_requested = True
+        except sqlite3.Error as e:
+            logger.warning(f"Could not update job {self.job_id}: {e}")
+
+    def update(self, force=False, **fields):
+        with self._lock:
+            self.progress.update(fields)
+            due = force or time.monotonic() - self._last_write >= PROGRESS_WRITE_S
+        if due:
+            self._write()
+
+    def check_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelled()
+
+
+def run_build(job, reporter):
+    """Fetch, parse, embed and persist one build or append job; returns its result summary.
+
+    A failed build is removed from disk, and so is a cancelled one that
+    never reached a checkpoint. Neither leaves a half-written index that
+    blocks its name or shows up in the chat sidebar.
+    """
+    from utils.manifest import MANIFEST_FNAME
+
+    index_name = job["index_name"]
+    index_path = os.path.join(INDEX_DIR, index_name)
+    # A build that checkpointed before its worker died continues like an append
+    resuming = job["kind"] == BUILD and job["attempts"] > 1 and os.path.exists(os.path.join(index_path, MANIFEST_FNAME))
+    if job["kind"] == BUILD and os.path.exists(index_path) and not resuming and job["attempts"] == 1:
+        raise ValueError(f"Index '{index_name}' already exists")
+    if job["kind"] == APPEND:
+        if not os.path.exists(index_path):
+            raise ValueError(f"Index '{index_name}' does not exist")
+        return _sync_job(job, reporter, index_path, resuming)
+
+    if not resuming and os.path.exists(index_path):
+        # Left by an attempt whose worker died before its first checkpoint
+        shutil.rmtree(index_path)
+    try:
+        return _sync_job(job, reporter, index_path, resuming)
+    except JobCancelled:
+        if not os.path.exists(os.path.join(index_path, MANIFEST_FNAME)):
+            shutil.rmtree(index_path, ignore_errors=True)
+        raise
+    except Exception:
+        logger.info(f"Removing partial index {index_path}")
+        shutil.rmtree(index_path, ignore_errors=True)
+        raise
+
+
+def _sync_job(job, reporter, index_path, resuming):
+    from llama_index.core import Document, StorageContext, VectorStoreIndex, load_index_from_storage
+    from llama_index.core.settings import Settings
+
+    from utils.embed_cache import get_embedding_cache
+    from utils.index_meta import read_index_metadata, update_index_metadata
+    from utils.indexing import file_sources, format_summary, sync_index, url_source
+    from utils.manifest import load_manifest, save_manifest
+    from utils.metrics import span
+    from utils.docstore import SqliteDocumentStore
+    from utils.ollama_client import get_embed_model
+    from utils.vector_store import MmapVectorStore, storage_context_for
+    from utils.web_fetch import NOT_MODIFIED, get_web_fetcher
+
+    params = job["params"]
+    index_name = job["index_name"]
+    started = time.time()
+    result = {"warnings": []}
+    sources = file_sources(os.path.join(DOC_ROOT, index_name))
+    if params.get("urls"):
+        reporter.update(force=True, phase="fetching")
+        fetched = get_web_fetcher().fetch_all(params["urls"])
+        for fetch in fetched:
+            if fetch.error is not None:
+                result["warnings"].append(f"Failed to load {fetch.url}: {fetch.error}")
+                continue
+            document = Document(text=fetch.text, id_=fetch.url, metadata={"url": fetch.url})
+            sources.append(url_source(fetch.url, [document]))
+        result["web"] = {
+            "fetched": sum(1 for fetch in fetched if fetch.error is None),
+            "requested": len(fetched),
+            "not_modified": sum(1 for fetch in fetched if fetch.status == NOT_MODIFIED),
+        }
+    reporter.check_cancelled()
+
+    Settings.embed_model = get_embed_model(params["embedding_model"])
+    embed_stats_before = get_embedding_cache().stats()
+    if job["kind"] == APPEND or resuming:
+        index = load_index_from_storage(storage_context_for(index_path))
+    else:
+        # Chunks are written straight to the on-disk docstore as they are inserted
+        docstore = SqliteDocumentStore.for_index(index_path) if params.get("docstore") == "sqlite" else None
+        vector_store = None
+        if params.get("vector_dtype"):
+            vector_store = MmapVectorStore(
+                dtype=params["vector_dtype"],
+                ann_params=params.get("ann_params"),
+                quantization=params.get("quantization"),
+                lexical=params.get("lexical", False),
+            )
+        storage_context = StorageContext.from_defaults(docstore=docstore, vector_store=vector_store)
+        index = VectorStoreIndex(nodes=[], storage_context=storage_context)
+    manifest = load_manifest(index_path)
+
+    def persist():
+        with span("build_persist", index=index_name, model=params["embedding_model"]):
+            index.storage_context.persist(persist_dir=index_path)
+            save_manifest(index_path, manifest)
+            update_index_metadata(
+                index_path,
+                embedding_model=params["embedding_model"],
+                updated_at=time.strftime("%Y-%m-%d %H:%M:%S"),
+            )
+
+    last_checkpoint = time.monotonic()
+
+    def on_source(key, state, chunks):
+        nonlocal last_checkpoint
+        reporter.check_cancelled()
+        # Manifest and index agree between sources, so this is a safe point to resume from
+        if time.monotonic() - last_checkpoint >= BUILD_CHECKPOINT_S:
+            reporter.update(force=True, phase="checkpointing")
+            persist()
+            last_checkpoint = time.monotonic()
+            reporter.update(force=True, phase="indexing")
+
+    def on_progress(progress):
+        reporter.update(
+            phase="indexing",
+            sources_done=progress.sources_done,
+            total_sources=progress.total_sources,
+            chunks_done=progress.chunks_done,
+            chunks_per_sec=progress.chunks_per_sec,
+            eta=progress.eta,
+        )
+
+    reporter.update(force=True, phase="indexing", sources_done=0, total_sources=len(sources), chunks_done=0)
+    summary = sync_index(index, manifest, sources, on_source=on_source, on_progress=on_progress, index_name=index_name)
+    reporter.update(force=True, phase="persisting")
+    persist()
+
+    embed_stats = get_embedding_cache().stats()
+    result.update(
+        summary=format_summary(summary),
+        failed=summary["failed"],
+        chunks_added=summary["chunks_added"],
+        seconds=time.time() - started,
+        slowest_parses=sorted(summary["parse_seconds"].items(), key=lambda item: item[1], reverse=True)[:20],
+        embeddings_reused=embed_stats["hits"] - embed_stats_before["hits"],
+        embeddings_sent=embed_stats["misses"] - embed_stats_before["misses"],
+        ann=read_index_metadata(index_path).get("ann"),
+        quantization=read_index_metadata(index_path).get("quantization"),
+        lexical=read_index_metadata(index_path).get("lexical"),
+    )
+    return result
+
+
+def run_job(store, job):
+    label = f"job {job['id']} ({job['kind']} {job['index_name']})"
+    logger.info(f"Starting {label}, attempt {job['attempts']}")
+    with JobReporter(store, job["id"]) as reporter:
+        try:
+            reporter.update(force=True, phase="waiting for index lock")
+            with index_lock(job["index_name"]):
+                result = run_build(job, reporter)
+        except JobCancelled:
+            if os.path.exists(os.path.join(INDEX_DIR, job["index_name"])):
+                store.finish(job["id"], CANCELLED, "Cancelled; the index is as of its last checkpoint")
+            else:
+                store.finish(job["id"], CANCELLED, "Cancelled; the partial index was removed")
+            logger.info(f"Cancelled {label}")
+        except Exception as e:
+            logger.exception(f"Failed {label}")
+            store.finish(job["id"], FAILED, str(e))
+        else:
+            store.finish(job["id"], DONE, result["summary"], result)
+            logger.info(f"Finished {label}: {result['summary']}")
+
+
+def work(store, idle_exit=None, until_job=None):
+    """Claim and run jobs; return after idle_exit seconds without work, or once until_job is finished."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    idle_since = time.monotonic()
+    while True:
+        if until_job is not None and store.get(until_job)["status"] not in ACTIVE:
+            return
+        store.recover()
+        job = store.claim(worker)
+        if job is not None:
+            run_job(store, job)
+            idle_since = time.monotonic()
+            continue
+        if idle_exit is not None and time.monotonic() - idle_since >= idle_exit:
+            return
+        time.sleep(JOB_POLL_S)
+
+
+class WorkerPool:
+    """Worker processes started on demand by the Streamlit app."""
+
+    def __init__(self, store, size):
+        self.store = store
+        self.size = size
+        self._processes = []
+        self._lock = threading.Lock()
+
+    def ensure(self):
+        """Start workers while jobs are queued; returns the number alive."""
+        self.store.recover()
+        with self._lock:
+            # poll() also reaps exited workers
+            self._processes = [p for p in self._processes if p.poll() is None]
+            queued = sum(1 for job in self.store.active() if job["status"] == QUEUED)
+            while queued and len(self._processes) < self.size:
+                # Own session: the worker finishes its job if Streamlit is restarted
+                self._processes.append(subprocess.Popen(
+                    [sys.executable, "-m", "utils.build_jobs", "worker", "--idle-exit", str(JOB_WORKER_IDLE_S)],
+                    start_new_session=True,
+                ))
+                queued -= 1
+            return len(self._processes)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    global _pool
+    store = get_job_store()
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(store, BUILD_JOB_WORKERS)
+        return _pool
+
+
+def format_progress(job):
+    progress = job["progress"]
+    if job["status"] != RUNNING or not progress:
+        return ""
+    text = progress.get("phase", "")
+    if "total_sources" in progress:
+        text += f", {progress.get('sources_done', 0)}/{progress['total_sources']} sources"
+    if progress.get("chunks_done"):
+        text += f", {progress['chunks_done']} chunks ({progress.get('chunks_per_sec', 0):.1f}/s)"
+    if progress.get("eta") is not None:
+        text += f", ETA {progress['eta']:.0f}s"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Queue and run index build jobs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Queue a build (or --append) job")
+    enqueue.add_argument("index_name")
+    enqueue.add_argument("--model", help="Embedding model (new indexes; appends use the index's model)")
+    enqueue.add_argument("--append", action="store_true", help="Add to an existing index")
+    enqueue.add_argument("--docs", nargs="*", default=[], help="Files or folders to copy into Documents/<index>")
+    enqueue.add_argument("--url", action="append", default=[], help="Web page to index (repeatable)")
+    enqueue.add_argument("--format", choices=["float32", "float16", "json"], default="float32")
+    enqueue.add_argument("--docstore", choices=["sqlite", "json"], default="sqlite",
+                         help="Keep chunk text on disk (sqlite) or load it all with the index (json)")
+    enqueue.add_argument("--ann", action="store_true", help="Also build an IVF-flat ANN index")
+    enqueue.add_argument("--nlist", type=int, default=0, help="ANN clusters, 0 = auto")
+    enqueue.add_argument("--nprobe", type=int, default=8)
+    enqueue.add_argument("--quantize", choices=["int8", "pq"], help="Keep compressed vector codes in memory")
+    enqueue.add_argument("--pq-m", type=int, default=0, help="PQ sub-vectors (bytes per vector), 0 = dim / 8")
+    enqueue.add_argument("--rerank", type=int, default=8, help="Candidates re-scored exactly, as a multiple of top-k")
+    enqueue.add_argument("--no-lexical", action="store_true", help="Skip the BM25 keyword index")
+    enqueue.add_argument("--wait", action="store_true", help="Run a worker here until the job is finished")
+
+    worker = commands.add_parser("worker", help="Run queued jobs")
+    worker.add_argument("--idle-exit", type=float, help="Exit after this many seconds without work")
+
+    listing = commands.add_parser("list", help="Show recent jobs")
+    listing.add_argument("--limit", type=int, default=20)
+
+    cancel = commands.add_parser("cancel", help="Cancel a queued or running job")
+    cancel.add_argument("job_id", type=int)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    store = get_job_store()
+
+    if args.command == "enqueue":
+        from utils.index_meta import read_index_metadata
+        from utils.indexing import SUPPORTED_EXTENSIONS
+
+        model = args.model
+        if args.append and not model:
+            model = read_index_metadata(os.path.join(INDEX_DIR, args.index_name)).get("embedding_model")
+        if not model:
+            parser.error("--model is required")
+        doc_dir = os.path.join(DOC_ROOT, args.index_name)
+        os.makedirs(doc_dir, exist_ok=True)
+        for path in args.docs:
+            paths = [os.path.join(path, name) for name in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+            for file_path in paths:
+                if os.path.isfile(file_path) and file_path.lower().endswith(SUPPORTED_EXTENSIONS):
+                    shutil.copy2(file_path, doc_dir)
+        try:
+            job_id = enqueue_index_job(
+                args.index_name,
+                model,
+                append=args.append,
+                urls=args.url,
+                vector_dtype=None if args.format == "json" else args.format,
+                ann_params={"nlist": args.nlist or None, "nprobe": args.nprobe} if args.ann else None,
+                docstore=args.docstore,
+                quantization={"kind": args.quantize, "m": args.pq_m or None, "rerank": args.rerank}
+                if args.quantize else None,
+                lexical=not args.append and args.format != "json" and not args.no_lexical,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Queued job {job_id}")
+        if args.wait:
+            work(store, until_job=job_id)
+            job = store.get(job_id)
+            print(f"Job {job_id} {job['status']}: {job['message']}")
+            return 0 if job["status"] == DONE else 1
+    elif args.command == "worker":
+        work(store, idle_exit=args.idle_exit)
+    elif args.command == "list":
+        for job in reversed(store.jobs(args.limit)):
+            print(f"{job['id']:>5} {job['kind']:<6} {job['index_name']:<24} {job['status']:<9} "
+                  f"{format_progress(job) or job['message'] or ''}")
+    elif args.command == "cancel":
+        if not store.cancel(args.job_id):
+            print(f"Job {args.job_id} is not queued or running")
+            return 1
+        print(f"Cancellation requested for job {args.job_id}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Token-budgeted chat history with a rolling summary of older turns.
+
+Each model gets a history budget of HISTORY_CONTEXT_SHARE of its context
+window (see utils.model_catalog), leaving the rest for the system prompt,
+retrieved context and the answer. The most recent messages that fit are
+sent verbatim. Older ones are folded into a running summary by the LLM on
+a background thread; until that finishes, turns use the previous summary.
+"""
+import os
+import logging
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.model_catalog import context_tokens
+from utils.scheduler import BACKGROUND, request_context
+
+logger = logging.getLogger(__name__)
+
+HISTORY_CONTEXT_SHARE = float(os.getenv("HISTORY_CONTEXT_SHARE", "0.5"))
+# Messages always kept verbatim, even over budget
+MIN_RECENT_MESSAGES = 2
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an AI assistant.
+Keep facts, decisions, names and open questions. Answer with the updated summary only.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}"""
+
+# One summarizer for all sessions, so summaries never compete with each other for the LLM
+_summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text):
+    from llama_index.core.utils import get_tokenizer
+
+    return len(get_tokenizer()(text))
+
+
+def history_budget(model_name):
+    return int(context_tokens(model_name) * HISTORY_CONTEXT_SHARE)
+
+
+def _transcript(messages):
+    return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+
+def summarize(llm, summary, messages):
+    prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", transcript=_transcript(messages))
+    with request_context(priority=BACKGROUND):
+        return llm.complete(prompt).text.strip()
+
+
+class ChatHistory:
+    """Per-session compaction state: the summary and how many messages it covers."""
+
+    def __init__(self):
+        self.summary = ""
+        self.summarized = 0
+        self._pending = None  # (future, message count the new summary will cover)
+
+    def _collect_summary(self):
+        if self._pending is None or not self._pending[0].done():
+            return
+        future, covers = self._pending
+        self._pending = None
+        try:
+            self.summary = future.result()
+            self.summarized = covers
+        except Exception as e:
+            logger.warning(f"History summary failed, retrying next turn: {e}")
+
+    def compact(self, messages, model_name, llm):
+        """Return (summary, recent messages, stats) for a turn.
+
+        messages are {"role", "content"} dicts, oldest first. stats has the
+        tokens the full history would cost, the tokens actually sent and
+        the difference.
+        """
+        self._collect_summary()
+        budget = max(history_budget(model_name) - count_tokens(self.summary), 0)
+        keep_from = len(messages)
+        used = 0
+        while keep_from > 0:
+            cost = count_tokens(messages[keep_from - 1]["content"])
+            if used + cost > budget and len(messages) - keep_from >= MIN_RECENT_MESSAGES:
+                break
+            used += cost
+            keep_from -= 1
+        # Messages already in the summary are never re-sent, even if they would fit
+        keep_from = max(keep_from, min(self.summarized, len(messages) - MIN_RECENT_MESSAGES))
+
+        if keep_from > self.summarized and self._pending is None and llm is not None:
+            fold = messages[self.summarized:keep_from]
+            self._pending = (_summarizer.submit(summarize, llm, self.summary, fold), keep_from)
+
+        recent = messages[keep_from:]
+        full = sum(count_tokens(m["content"]) for m in messages)
+        sent = sum(count_tokens(m["content"]) for m in recent) + count_tokens(self.summary)
+        return self.summary, recent, {"full": full, "sent": sent, "saved": max(full - sent, 0)}
+
+
+def to_chat_messages(messages):
+    from llama_index.core.llms import ChatMessage
+
+    return [ChatMessage(role=m["role"], content=m["content"]) for m in messages]
@@ -0,0 +1,213 @@
+"""Disk-backed docstore: node text and metadata stay in SQLite until retrieved.
+
+SimpleDocumentStore loads every chunk of docstore.json into memory, although a
+chat turn only reads the top-k retrieved nodes. SqliteDocumentStore keeps the
+same llama_index collections in Indexes/<name>/docstore.sqlite and fetches
+nodes by id (one query per retrieval) through a small LRU of raw JSON.
+
+Writes stay in one open transaction until the storage context is persisted,
+so chat sessions reading the index (WAL mode) never see a half-applied build
+or append, and a build that dies rolls back to its last persist.
+
+Convert an existing index with:
+    python -m utils.docstore Indexes/<name> [--keep-json]
+"""
+import os
+import sys
+import json
+import sqlite3
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.docstore.utils import json_to_doc
+from llama_index.core.storage.kvstore.types import DEFAULT_BATCH_SIZE, DEFAULT_COLLECTION, BaseKVStore
+
+from utils.index_meta import read_index_metadata, update_index_metadata
+
+logger = logging.getLogger(__name__)
+
+DOCSTORE_CACHE_SIZE = int(os.getenv("DOCSTORE_CACHE_SIZE", "512"))
+DOCSTORE_FORMAT = "sqlite"
+DOCSTORE_VERSION = 1
+DOCSTORE_FNAME = "docstore.sqlite"
+JSON_DOCSTORE_FNAME = "docstore.json"
+# SQLite caps bound parameters per statement
+MAX_SQL_PARAMS = 900
+
+
+class SqliteKVStore(BaseKVStore):
+    """BaseKVStore over a single SQLite table, with an LRU of recently read values."""
+
+    def __init__(self, path, cache_size=DOCSTORE_CACHE_SIZE, read_only=False):
+        self.path = path
+        self.cache_size = cache_size
+        self.read_only = read_only
+        self._cache = OrderedDict()  # (collection, key) -> JSON text
+        # One connection behind a lock: its open write transaction must be seen by every reader
+        self._lock = threading.RLock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "collection TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (collection, key))"
+            )
+            self._conn.commit()
+
+    def _remember(self, cache_key, text):
+        self._cache[cache_key] = text
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def put(self, key, val, collection=DEFAULT_COLLECTION):
+        self.put_all([(key, val)], collection=collection)
+
+    async def aput(self, key, val, collection=DEFAULT_COLLECTION):
+        self.put(key, val, collection=collection)
+
+    def put_all(self, kv_pairs, collection=DEFAULT_COLLECTION, batch_size=DEFAULT_BATCH_SIZE):
+        rows = [(collection, key, json.dumps(val)) for key, val in kv_pairs]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)", rows)
+            for _, key, _ in rows:
+                self._cache.pop((collection, key), None)
+
+    async def aput_all(self, kv_pairs, collection=DEFAULT_COLLECTION, batch_size=DEFAULT_BATCH_SIZE):
+        self.put_all(kv_pairs, collection=collection, batch_size=batch_size)
+
+    def get(self, key, collection=DEFAULT_COLLECTION):
+        return self.get_many([key], collection=collection).get(key)
+
+    async def aget(self, key, collection=DEFAULT_COLLECTION):
+        return self.get(key, collection=collection)
+
+    def get_many(self, keys, collection=DEFAULT_COLLECTION):
+        """{key: value} for the keys that exist, one query for all cache misses."""
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                text = self._cache.get((collection, key))
+                if text is None:
+                    missing.append(key)
+                else:
+                    self._cache.move_to_end((collection, key))
+                    found[key] = text
+            for start in range(0, len(missing), MAX_SQL_PARAMS):
+                batch = missing[start:start + MAX_SQL_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                for key, text in self._conn.execute(
+                    f"SELECT key, value FROM kv WHERE collection = ? AND key IN ({placeholders})",
+                    [collection, *batch],
+                ):
+                    self._remember((collection, key), text)
+                    found[key] = text
+        # Fresh dicts every time: callers mutate what they get back
+        return {key: json.loads(text) for key, text in found.items()}
+
+    def get_all(self, collection=DEFAULT_COLLECTION):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM kv WHERE collection = ?", (collection,)).fetchall()
+        return {key: json.loads(text) for key, text in rows}
+
+    async def aget_all(self, collection=DEFAULT_COLLECTION):
+        return self.get_all(collection=collection)
+
+    def delete(self, key, collection=DEFAULT_COLLECTION):
+        with self._lock:
+            self._cache.pop((collection, key), None)
+            cursor = self._conn.execute("DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key))
+        return cursor.rowcount > 0
+
+    async def adelete(self, key, collection=DEFAULT_COLLECTION):
+        return self.delete(key, collection=collection)
+
+    def commit(self):
+        with self._lock:
+            if not self.read_only:
+                self._conn.commit()
+
+    def cache_stats(self):
+        with self._lock:
+            return {"entries": len(self._cache), "max_entries": self.cache_size}
+
+
+class SqliteDocumentStore(KVDocumentStore):
+    def __init__(self, path, cache_size=DOCSTORE_CACHE_SIZE, read_only=False, namespace=None):
+        super().__init__(SqliteKVStore(path, cache_size=cache_size, read_only=read_only), namespace=namespace)
+        self.path = path
+
+    @classmethod
+    def for_index(cls, index_path, read_only=False):
+        os.makedirs(index_path, exist_ok=True)
+        return cls(os.path.join(index_path, DOCSTORE_FNAME), read_only=read_only)
+
+    def get_nodes(self, node_ids, raise_error=True):
+        found = self._kvstore.get_many(node_ids, collection=self._node_collection)
+        nodes = []
+        for node_id in node_ids:
+            data = found.get(node_id)
+            if data is None:
+                if raise_error:
+                    raise ValueError(f"doc_id {node_id} not found.")
+                nodes.append(None)
+            else:
+                nodes.append(json_to_doc(data))
+        return nodes
+
+    async def aget_nodes(self, node_ids, raise_error=True):
+        return self.get_nodes(node_ids, raise_error=raise_error)
+
+    def persist(self, persist_path=None, fs=None):
+        """Commit pending writes; persist_path is ignored (the store is already on disk)."""
+        self._kvstore.commit()
+        update_index_metadata(
+            os.path.dirname(self.path),
+            docstore={"format": DOCSTORE_FORMAT, "version": DOCSTORE_VERSION},
+        )
+
+
+def is_sqlite_docstore(index_path):
+    return read_index_metadata(index_path).get("docstore", {}).get("format") == DOCSTORE_FORMAT
+
+
+def convert_json_docstore(index_path, keep_json=False):
+    """One-shot copy of docstore.json into docstore.sqlite; returns the node count."""
+    from llama_index.core.storage.docstore import SimpleDocumentStore
+
+    json_path = os.path.join(index_path, JSON_DOCSTORE_FNAME)
+    source = SimpleDocumentStore.from_persist_path(json_path)
+    store = SqliteDocumentStore.for_index(index_path)
+    # Copy the raw collections so ids, hashes and ref doc info carry over unchanged
+    for collection, values in source._kvstore.to_dict().items():
+        store._kvstore.put_all(list(values.items()), collection=collection)
+    store.persist()
+    if not keep_json:
+        os.remove(json_path)
+    return len(source.docs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move docstore.json into a disk-backed SQLite docstore.")
+    parser.add_argument("index_paths", nargs="+", help="Index directories, e.g. Indexes/_L4T_README")
+    parser.add_argument("--keep-json", action="store_true", help="Keep docstore.json")
+    args = parser.parse_args(argv)
+
+    for index_path in args.index_paths:
+        if is_sqlite_docstore(index_path):
+            print(f"{index_path}: already converted")
+            continue
+        count = convert_json_docstore(index_path, keep_json=args.keep_json)
+        print(f"{index_path}: converted {count} nodes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""Persistent embedding cache keyed by (embedding model, normalized text hash).
+
+One SQLite file is shared by every index build and by query-time embedding
+in the chat page, so identical chunks or repeated questions are sent to
+Ollama only once per model. The file is size bounded: when it grows past
+EMBED_CACHE_MAX_MB, the least recently used vectors are evicted.
+"""
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from array import array
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.ollama import OllamaEmbedding
+
+from utils.embed_pipeline import EMBED_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join("Indexes", ".embedding_cache.sqlite"))
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "1024"))
+# Evict down to this fraction of the budget so eviction doesn't run on every insert
+EVICT_TO = 0.9
+# SQLite caps bound parameters per statement
+MAX_SQL_PARAMS = 900
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model_name, text):
+    # Ollama returns the same vector for query and document text, so no kind in the key
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+
+def _encode(vector):
+    return array("f", vector).tobytes()
+
+
+def _decode(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        conn.commit()
+        self._bytes = self._total_bytes()
+
+    def _conn(self):
+        # One connection per thread; WAL lets build workers and chat sessions share the file
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _total_bytes(self):
+        row = self._conn().execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        return row[0]
+
+    def get_many(self, model_name, texts):
+        """Cached vectors for texts (None where missing)."""
+        keys = [cache_key(model_name, text) for text in texts]
+        found = {}
+        conn = self._conn()
+        for start in range(0, len(keys), MAX_SQL_PARAMS):
+            batch = keys[start:start + MAX_SQL_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            for key, blob in conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ):
+                found[key] = blob
+        if found:
+            conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(time.time(), key) for key in found],
+            )
+            conn.commit()
+        with self._lock:
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [_decode(found[key]) if key in found else None for key in keys]
+
+    def put_many(self, model_name, texts, vectors):
+        rows = [
+            (cache_key(model_name, text), model_name, _encode(vector), time.time())
+            for text, vector in zip(texts, vectors)
+        ]
+        conn = self._conn()
+        conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        with self._lock:
+            self._bytes += sum(len(row[2]) for row in rows)
+            over_budget = self._bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        conn = self._conn()
+        total = self._total_bytes()
+        if total > self.max_bytes:
+            count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            average = total / max(count, 1)
+            drop = int((total - self.max_bytes * EVICT_TO) / average) + 1
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (drop,),
+            )
+            conn.commit()
+            logger.info(f"Embedding cache evicted {drop} vectors")
+            total = self._total_bytes()
+        with self._lock:
+            self._bytes = total
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(EMBED_CACHE_PATH, EMBED_CACHE_MAX_MB * 1024 * 1024)
+        return _cache
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Wraps an embedding model so every vector goes through the shared cache."""
+
+    _inner: Any = PrivateAttr()
+    _cache: Any = PrivateAttr()
+
+    def __init__(self, inner, cache=None, **kwargs):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            callback_manager=inner.callback_manager,
+            **kwargs,
+        )
+        self._inner = inner
+        self._cache = cache or get_embedding_cache()
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    @property
+    def inner(self):
+        return self._inner
+
+    def _lookup(self, texts):
+        cached = self._cache.get_many(self.model_name, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        return cached, missing
+
+    def _store(self, texts, cached, missing, vectors):
+        self._cache.put_many(self.model_name, [texts[i] for i in missing], vectors)
+        for i, vector in zip(missing, vectors):
+            cached[i] = vector
+        return cached
+
+    def _embed_batch(self, texts):
+        # OllamaEmbedding sends one /api/embeddings request per text; /api/embed takes the whole batch
+        if isinstance(self._inner, OllamaEmbedding):
+            # Imported here: utils.ollama_client imports this module
+            from utils.ollama_client import get_client
+
+            return get_client(self._inner.base_url).embed(
+                model=self.model_name, input=texts, options=self._inner.ollama_additional_kwargs
+            )["embeddings"]
+        return self._inner._get_text_embeddings(texts)
+
+    async def _aembed_batch(self, texts):
+        if isinstance(self._inner, OllamaEmbedding):
+            # The same scheduled /api/embed call, off the event loop
+            return await asyncio.to_thread(self._embed_batch, texts)
+        return await self._inner._aget_text_embeddings(texts)
+
+    def _embed_query(self, query):
+        # Queries and texts share cache keys, so both must come from /api/embed (unit-length vectors)
+        if isinstance(self._inner, OllamaEmbedding):
+            return self._embed_batch([query])[0]
+        return self._inner._get_query_embedding(query)
+
+    async def _aembed_query(self, query):
+        if isinstance(self._inner, OllamaEmbedding):
+            return (await self._aembed_batch([query]))[0]
+        return await self._inner._aget_query_embedding(query)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        cached, missing = self._lookup(texts)
+        if not missing:
+            return cached
+        vectors = self._embed_batch([texts[i] for i in missing])
+        return self._store(texts, cached, missing, vectors)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        cached, missing = self._lookup(texts)
+        if not missing:
+            return cached
+        vectors = await self._aembed_batch([texts[i] for i in missing])
+        return self._store(texts, cached, missing, vectors)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        cached, missing = self._lookup([query])
+        if not missing:
+            return cached[0]
+        return self._store([query], cached, missing, [self._embed_query(query)])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        cached, missing = self._lookup([query])
+        if not missing:
+            return cached[0]
+        vector = await self._aembed_query(query)
+        return self._store([query], cached, missing, [vector])[0]
+
+
+def cached_ollama_embedding(model_name, base_url):
+    return CachedEmbedding(
+        OllamaEmbedding(model_name=model_name, base_url=base_url, embed_batch_size=EMBED_BATCH_SIZE)
+    )
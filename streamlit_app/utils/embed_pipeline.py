@@ -0,0 +1,118 @@
+"""Concurrent, batched embedding of chunks during index builds.
+
+Chunks are grouped into EMBED_BATCH_SIZE batches and sent to the embedding
+model by at most EMBED_CONCURRENCY worker threads. Submission blocks while
+that many batches are in flight, so chunking never runs far ahead of
+Ollama. A failed batch is retried with exponential backoff.
+
+Every finished batch is written to the embedding cache by CachedEmbedding,
+so a build that fails part way re-embeds only the batches that never came
+back when it is run again.
+"""
+import os
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.scheduler import BUILD, request_context
+
+logger = logging.getLogger(__name__)
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_RETRIES = int(os.getenv("EMBED_RETRIES", "3"))
+RETRY_BACKOFF_S = 1.0
+
+
+class EmbedProgress:
+    """Running chunk throughput and an ETA extrapolated from sources done so far."""
+
+    def __init__(self, total_sources):
+        self.total_sources = total_sources
+        self.sources_done = 0
+        self.chunks_done = 0
+        self.chunks_seen = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def chunks_per_sec(self):
+        elapsed = self.elapsed
+        return self.chunks_done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """Seconds left, or None until there is enough to extrapolate from."""
+        if not self.sources_done or not self.chunks_done:
+            return None
+        expected = self.chunks_seen / self.sources_done * self.total_sources
+        return max(expected - self.chunks_done, 0) / self.chunks_per_sec
+
+
+def embed_with_retry(embed_model, texts, retries=EMBED_RETRIES):
+    for attempt in range(retries + 1):
+        try:
+            # Builds queue behind interactive chat in the shared Ollama scheduler
+            with request_context(priority=BUILD):
+                return embed_model.get_text_embedding_batch(texts)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = RETRY_BACKOFF_S * 2 ** attempt
+            logger.warning(f"Embedding batch of {len(texts)} failed ({e}), retrying in {delay:.0f}s")
+            time.sleep(delay)
+
+
+def embed_nodes(
+    embed_model,
+    nodes,
+    batch_size=EMBED_BATCH_SIZE,
+    concurrency=EMBED_CONCURRENCY,
+    retries=EMBED_RETRIES,
+    on_batch=None,
+):
+    """Set node.embedding on every node that lacks one.
+
+    on_batch(count) is called from this thread after each finished batch.
+    The first batch that still fails after its retries is re-raised once
+    the batches already in flight have finished.
+    """
+    from llama_index.core.schema import MetadataMode
+
+    todo = [node for node in nodes if node.embedding is None]
+    batches = [todo[start:start + batch_size] for start in range(0, len(todo), batch_size)]
+    if not batches:
+        return nodes
+
+    error = None
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed") as pool:
+        in_flight = {}
+        pending = iter(batches)
+        while True:
+            # Keep at most `concurrency` batches outstanding (backpressure)
+            while error is None and len(in_flight) < concurrency:
+                batch = next(pending, None)
+                if batch is None:
+                    break
+                texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+                in_flight[pool.submit(embed_with_retry, embed_model, texts, retries)] = batch
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                try:
+                    vectors = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                for node, vector in zip(batch, vectors):
+                    node.embedding = vector
+                if on_batch:
+                    on_batch(len(batch))
+    if error is not None:
+        raise error
+    return nodes
@@ -0,0 +1,310 @@
+"""Parallel retrieval across several RAG indexes with one merged top-k.
+
+FederatedRetriever embeds the question once, searches every index from a
+shared thread pool (NumPy scoring and SQLite reads release the GIL) and
+keeps the global top-k by score. Scores are only comparable between
+indexes built with the same embedding model, which is checked up front.
+Hybrid results are not: their fused scores only rank chunks within one
+index. So for hybrid queries every index returns its dense and its BM25
+candidates, and the pooled rankings are fused once.
+
+A large index can be split into shards that are searched the same way
+(from streamlit_app/):
+    python -m utils.federated <index_name> --shards 4
+"""
+import os
+import sys
+import time
+import heapq
+import shutil
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+
+from utils.index_meta import read_index_metadata, update_index_metadata
+from utils.lexical import HYBRID_ALPHA, fuse_ranked
+from utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+FEDERATED_WORKERS = int(os.getenv("FEDERATED_WORKERS", "4"))
+SHARD_SUFFIX = "_shard"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_search_pool():
+    """Thread pool shared by all sessions for loading and searching indexes."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=FEDERATED_WORKERS, thread_name_prefix="rag-search")
+        return _pool
+
+
+def index_label(index_names):
+    """Metrics / cache label for a set of indexes searched together."""
+    return "+".join(index_names)
+
+
+def embedding_models(index_paths):
+    """{index path: embedding model from metadata.json, or None}."""
+    return {path: read_index_metadata(path).get("embedding_model") for path in index_paths}
+
+
+def check_same_embedding(index_paths):
+    """The embedding model shared by all indexes; ValueError if they differ."""
+    models = embedding_models(index_paths)
+    distinct = set(models.values())
+    if len(distinct) != 1 or None in distinct:
+        details = ", ".join(f"{os.path.basename(path)}: {model}" for path, model in models.items())
+        raise ValueError(f"Indexes must share one embedding model to be searched together ({details})")
+    return distinct.pop()
+
+
+def load_indexes(index_paths, loader):
+    """Load (or fetch from cache) every index concurrently, in the given order."""
+    if len(index_paths) == 1:
+        return [loader(index_paths[0])]
+    return list(get_search_pool().map(loader, index_paths))
+
+
+class FederatedRetriever(BaseRetriever):
+    """Searches several retrievers in parallel and merges their top-k by score.
+
+    retrievers maps index name to retriever. With sparse_retrievers (index
+    name to BM25 retriever) the pooled dense and BM25 candidates are merged
+    into two rankings, each by its own score, and fused by reciprocal rank
+    with weight alpha. After each query shard_stats holds {"index",
+    "seconds", "nodes"} per index, and every search is recorded as a
+    rag_shard_retrieval span labelled with its index.
+    """
+
+    def __init__(self, retrievers, similarity_top_k, embed_model, model_name=None, sparse_retrievers=None,
+                 alpha=HYBRID_ALPHA):
+        super().__init__()
+        self._retrievers = dict(retrievers)
+        self._sparse_retrievers = dict(sparse_retrievers or {})
+        self._similarity_top_k = similarity_top_k
+        self._embed_model = embed_model
+        self._model_name = model_name
+        self._alpha = alpha
+        self.shard_stats = []
+
+    def _search(self, index_name, retriever, query_bundle, sparse_retriever=None):
+        start = time.perf_counter()
+        with span("rag_shard_retrieval", index=index_name, model=self._model_name) as attrs:
+            nodes = retriever.retrieve(query_bundle)
+            sparse_nodes = sparse_retriever.retrieve(query_bundle) if sparse_retriever is not None else []
+            attrs["nodes"] = len(nodes) + len(sparse_nodes)
+        return nodes, sparse_nodes, time.perf_counter() - start
+
+    def _retrieve(self, query_bundle):
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._embed_model.get_query_embedding(query_bundle.query_str)
+        pool = get_search_pool()
+        futures = {
+            name: pool.submit(self._search, name, retriever, query_bundle, self._sparse_retrievers.get(name))
+            for name, retriever in self._retrievers.items()
+        }
+        merged, sparse_merged = [], []
+        self.shard_stats = []
+        for name, future in futures.items():
+            nodes, sparse_nodes, seconds = future.result()
+            self.shard_stats.append({"index": name, "seconds": seconds, "nodes": len(nodes) + len(sparse_nodes)})
+            merged.extend(nodes)
+            sparse_merged.extend(sparse_nodes)
+        if not self._sparse_retrievers:
+            return heapq.nlargest(self._similarity_top_k, merged, key=lambda node: node.score or 0.0)
+        return self._fuse(merged, sparse_merged)
+
+    def _fuse(self, dense_nodes, sparse_nodes):
+        """One reciprocal rank fusion over the pooled dense and BM25 candidates of all indexes."""
+        by_id = {}
+        rankings = []
+        for nodes in (dense_nodes, sparse_nodes):
+            ranked = sorted(nodes, key=lambda node: node.score or 0.0, reverse=True)
+            for node in ranked:
+                by_id.setdefault(node.node.node_id, node.node)
+            rankings.append([node.node.node_id for node in ranked])
+        best = fuse_ranked(*rankings, self._similarity_top_k, alpha=self._alpha)
+        return [NodeWithScore(node=by_id[node_id], score=score) for node_id, score in best]
+
+
+def federated_retriever(indexes, retriever_kwargs, embed_model, model_name=None):
+    """FederatedRetriever over {name: index} with hybrid_retriever_kwargs() settings.
+
+    Hybrid settings search each index twice, dense and BM25 only, so the
+    fusion ranks candidates from all indexes together.
+    """
+    if retriever_kwargs.get("vector_store_query_mode") != "hybrid":
+        return FederatedRetriever(
+            {name: index.as_retriever(**retriever_kwargs) for name, index in indexes.items()},
+            similarity_top_k=retriever_kwargs["similarity_top_k"],
+            embed_model=embed_model,
+            model_name=model_name,
+        )
+    candidates = retriever_kwargs["similarity_top_k"]
+    return FederatedRetriever(
+        {name: index.as_retriever(similarity_top_k=candidates) for name, index in indexes.items()},
+        similarity_top_k=retriever_kwargs["hybrid_top_k"],
+        embed_model=embed_model,
+        model_name=model_name,
+        sparse_retrievers={
+            name: index.as_retriever(
+                vector_store_query_mode="sparse",
+                similarity_top_k=candidates,
+                sparse_top_k=retriever_kwargs.get("sparse_top_k", candidates),
+            )
+            for name, index in indexes.items()
+        },
+        alpha=retriever_kwargs.get("alpha", HYBRID_ALPHA),
+    )
+
+
+def format_shard_stats(shard_stats):
+    return ", ".join(f"{stat['index']} {stat['seconds'] * 1000:.0f} ms ({stat['nodes']})" for stat in shard_stats)
+
+
+def _split_units(manifest, docstore):
+    """(source key or None, ref doc ids, node ids) units that must stay in one shard.
+
+    Manifest sources keep all their documents together; ref docs not in the
+    manifest (indexes built before manifests existed) are units on their own.
+    """
+    units = []
+    covered = set()
+    for key, entry in manifest["sources"].items():
+        units.append((key, entry["ref_doc_ids"], entry["node_ids"]))
+        covered.update(entry["ref_doc_ids"])
+    for ref_doc_id, info in (docstore.get_all_ref_doc_info() or {}).items():
+        if ref_doc_id not in covered:
+            units.append((None, [ref_doc_id], list(info.node_ids)))
+    return units
+
+
+def _write_shard(source, row_index, shard_path, units, manifest, embed_model, ann_params, index_name, shards):
+    """Persist one shard index with the given units' nodes, vectors and manifest entries.
+
+    row_index is the source vector store's row_index(), shared by all shards.
+    """
+    from llama_index.core import StorageContext, VectorStoreIndex
+
+    from utils.docstore import SqliteDocumentStore
+    from utils.manifest import MANIFEST_VERSION, save_manifest
+    from utils.vector_store import MmapVectorStore
+
+    vector_store, docstore = source.vector_store, source.docstore
+    storage_context = StorageContext.from_defaults(
+        docstore=SqliteDocumentStore.for_index(shard_path),
+        vector_store=MmapVectorStore(
+            dtype=vector_store.dtype, ann_params=ann_params, quantization=vector_store.quantization,
+            lexical=vector_store.lexical,
+        ),
+    )
+    shard = VectorStoreIndex(nodes=[], storage_context=storage_context, embed_model=embed_model)
+    shard_manifest = {"version": MANIFEST_VERSION, "sources": {}}
+    for key, ref_doc_ids, node_ids in units:
+        # Nodes arrive embedded, so the index stores them without calling the model again
+        nodes = docstore.get_nodes(node_ids)
+        for node, embedding in zip(nodes, vector_store.embeddings(node_ids, row_index)):
+            node.embedding = embedding.tolist()
+        shard.insert_nodes(nodes)
+        for ref_doc_id in ref_doc_ids:
+            doc_hash = docstore.get_document_hash(ref_doc_id)
+            if doc_hash is not None:
+                shard.docstore.set_document_hash(ref_doc_id, doc_hash)
+        if key is not None:
+            shard_manifest["sources"][key] = manifest["sources"][key]
+    storage_context.persist(persist_dir=shard_path)
+    save_manifest(shard_path, shard_manifest)
+    update_index_metadata(
+        shard_path,
+        embedding_model=embed_model.model_name,
+        shard_of={"index": index_name, "shards": shards},
+        updated_at=time.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    return shard_manifest
+
+
+def split_index(index_dir, doc_root, index_name, shards):
+    """Split an index into `shards` new indexes <name>_shard1..N; returns their names.
+
+    Sources are spread greedily by chunk count, and nodes keep their
+    embeddings, so nothing is re-embedded. Uploaded files are copied to each
+    shard's documents folder so later appends to a shard keep them. The
+    original index is left untouched.
+    """
+    from utils.manifest import load_manifest
+    from utils.ollama_client import get_embed_model
+    from utils.vector_store import storage_context_for
+
+    index_path = os.path.join(index_dir, index_name)
+    names = [f"{index_name}{SHARD_SUFFIX}{i + 1}" for i in range(shards)]
+    existing = [name for name in names if os.path.exists(os.path.join(index_dir, name))]
+    if existing:
+        raise ValueError(f"Shard indexes already exist: {', '.join(existing)}")
+    embedding_model = read_index_metadata(index_path).get("embedding_model")
+    if not embedding_model:
+        raise ValueError(f"Index '{index_name}' has no embedding model in metadata.json")
+    source = storage_context_for(index_path, read_only=True)
+    manifest = load_manifest(index_path)
+
+    assignments = [[] for _ in range(shards)]
+    loads = [0] * shards
+    for unit in sorted(_split_units(manifest, source.docstore), key=lambda unit: -len(unit[2])):
+        target = loads.index(min(loads))
+        assignments[target].append(unit)
+        loads[target] += len(unit[2])
+
+    ann_params = None
+    if source.vector_store.ann_params:
+        # nlist was sized for the whole index; let each shard pick its own
+        ann_params = {"nlist": None, "nprobe": source.vector_store.ann_params["nprobe"]}
+    embed_model = get_embed_model(embedding_model)
+    row_index = source.vector_store.row_index()
+    try:
+        for name, units in zip(names, assignments):
+            shard_manifest = _write_shard(
+                source, row_index, os.path.join(index_dir, name), units, manifest, embed_model, ann_params,
+                index_name, shards,
+            )
+            for key, entry in shard_manifest["sources"].items():
+                if entry.get("kind") == "file":
+                    os.makedirs(os.path.join(doc_root, name), exist_ok=True)
+                    shutil.copy2(os.path.join(doc_root, index_name, key), os.path.join(doc_root, name, key))
+            logger.info(f"Wrote {name}: {len(units)} sources, {sum(len(unit[2]) for unit in units)} chunks")
+    except Exception:
+        # Half-written shards would block a retry
+        for name in names:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+            shutil.rmtree(os.path.join(doc_root, name), ignore_errors=True)
+        raise
+    return names
+
+
+def main(argv=None):
+    from utils.build_jobs import DOC_ROOT, INDEX_DIR, index_lock
+
+    parser = argparse.ArgumentParser(description="Split an index into shards that chat searches in parallel.")
+    parser.add_argument("index_name", help="Index under Indexes/, e.g. _L4T_README")
+    parser.add_argument("--shards", type=int, required=True, help="Number of shard indexes to write")
+    args = parser.parse_args(argv)
+    if args.shards < 2:
+        parser.error("--shards must be at least 2")
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    # No build job may change the index while it is copied
+    with index_lock(args.index_name):
+        names = split_index(INDEX_DIR, DOC_ROOT, args.index_name, args.shards)
+    print(f"{args.index_name}: wrote {', '.join(names)}; select them together in the chat sidebar")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
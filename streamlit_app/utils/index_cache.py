@@ -0,0 +1,144 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+
+from llama_index.core import load_index_from_storage
+
+from utils.vector_store import storage_context_for
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the on-disk size of all cached indexes (MB)
+INDEX_CACHE_MAX_MB = int(os.getenv("INDEX_CACHE_MAX_MB", "2048"))
+# SQLite docstores stay on disk, and readers touch their -shm file; every
+# persist also rewrites metadata.json, so skipping them misses no change
+UNLOADED_SUFFIXES = (".sqlite", ".sqlite-wal", ".sqlite-shm")
+
+
+def index_signature(index_path):
+    """(file name, mtime, size) for every loaded file in the persist dir.
+
+    Any persist or append rewrites at least one store file, so a changed
+    signature means the cached copy is stale.
+    """
+    signature = []
+    for name in sorted(os.listdir(index_path)):
+        path = os.path.join(index_path, name)
+        if os.path.isfile(path) and not name.endswith(UNLOADED_SUFFIXES):
+            stat = os.stat(path)
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def signature_size(signature):
+    return sum(size for _, _, size in signature)
+
+
+def load_index(index_path):
+    return load_index_from_storage(storage_context_for(index_path, read_only=True))
+
+
+class IndexRegistry:
+    """Process-wide LRU cache of loaded indexes, shared by all sessions.
+
+    Entries are keyed by index path and validated against the on-disk
+    signature on every lookup. The memory budget is accounted using the
+    size of the persisted files as an estimate of the loaded footprint.
+    """
+
+    def __init__(self, max_bytes, loader=load_index):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self._entries = OrderedDict()  # path -> (signature, size, index)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, index_path):
+        signature = index_signature(index_path)
+        entry = self._lookup(index_path, signature)
+        if entry is not None:
+            return entry
+
+        # One loader per index, so concurrent sessions don't all parse the same files
+        with self._lock:
+            load_lock = self._load_locks.setdefault(index_path, threading.Lock())
+        with load_lock:
+            signature = index_signature(index_path)
+            entry = self._lookup(index_path, signature, count=False)
+            if entry is not None:
+                return entry
+            with self._lock:
+                self.misses += 1
+            logger.info(f"Index cache miss, loading {index_path}")
+            index = self.loader(index_path)
+            self._store(index_path, signature, index)
+            return index
+
+    def _lookup(self, index_path, signature, count=True):
+        with self._lock:
+            entry = self._entries.get(index_path)
+            if entry is None:
+                return None
+            if entry[0] != signature:
+                del self._entries[index_path]
+                self.invalidations += 1
+                return None
+            self._entries.move_to_end(index_path)
+            if count:
+                self.hits += 1
+            return entry[2]
+
+    def _store(self, index_path, signature, index):
+        size = signature_size(signature)
+        with self._lock:
+            self._entries[index_path] = (signature, size, index)
+            self._entries.move_to_end(index_path)
+            # Evict least recently used, but always keep the entry just loaded
+            while self._current_bytes() > self.max_bytes and len(self._entries) > 1:
+                evicted, _ = self._entries.popitem(last=False)
+                self.evictions += 1
+                logger.info(f"Index cache evicted {evicted}")
+
+    def _current_bytes(self):
+        return sum(size for _, size, _ in self._entries.values())
+
+    def invalidate(self, index_path):
+        with self._lock:
+            if self._entries.pop(index_path, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._current_bytes(),
+                "max_bytes": self.max_bytes,
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_index_registry():
+    """Registry singleton; module state outlives Streamlit reruns and sessions."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = IndexRegistry(INDEX_CACHE_MAX_MB * 1024 * 1024)
+        return _registry
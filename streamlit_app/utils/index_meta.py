@@ -0,0 +1,27 @@
+import os
+import json
+import time
+
+METADATA_FNAME = "metadata.json"
+
+
+def read_index_metadata(index_path):
+    meta_path = os.path.join(index_path, METADATA_FNAME)
+    if os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def update_index_metadata(index_path, **fields):
+    """Merge fields into metadata.json, keeping keys written by other components."""
+    os.makedirs(index_path, exist_ok=True)
+    metadata = read_index_metadata(index_path)
+    metadata.update(fields)
+    metadata.setdefault("created_at", time.strftime("%Y-%m-%d %H:%M:%S"))
+    meta_path = os.path.join(index_path, METADATA_FNAME)
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, meta_path)
+    return metadata
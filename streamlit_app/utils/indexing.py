@@ -0,0 +1,200 @@
+"""Index build / append logic shared by the Build Index page."""
+import os
+import logging
+from collections import namedtuple
+from functools import partial
+
+from utils.ingest import iter_parsed
+from utils.metrics import observe, span
+from utils.embed_pipeline import EMBED_BATCH_SIZE, EMBED_CONCURRENCY, EmbedProgress, embed_nodes
+from utils.manifest import (
+    CHANGED,
+    NEW,
+    REMOVED,
+    UNCHANGED,
+    classify_sources,
+    file_sha256,
+    text_sha256,
+)
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".md", ".txt")
+
+# key: file name or URL, kind: "file" or "url", load: callable returning Documents
+Source = namedtuple("Source", ["key", "kind", "content_hash", "load"])
+
+
+def list_source_files(doc_dir):
+    if not os.path.isdir(doc_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(doc_dir)
+        if os.path.isfile(os.path.join(doc_dir, name)) and name.lower().endswith(SUPPORTED_EXTENSIONS)
+    )
+
+
+def _with_stable_ids(source_key, documents):
+    # Deterministic ref doc ids let a later sync delete exactly this source's nodes
+    for i, doc in enumerate(documents):
+        doc.id_ = f"{source_key}#{i}"
+    return documents
+
+
+def load_file_documents(path, source_key):
+    from llama_index.core import SimpleDirectoryReader
+
+    return _with_stable_ids(source_key, SimpleDirectoryReader(input_files=[path]).load_data())
+
+
+def file_sources(doc_dir):
+    return [
+        Source(name, "file", file_sha256(os.path.join(doc_dir, name)),
+               partial(load_file_documents, os.path.join(doc_dir, name), name))
+        for name in list_source_files(doc_dir)
+    ]
+
+
+def url_source(url, documents):
+    content_hash = text_sha256("\n".join(doc.text for doc in documents))
+    documents = _with_stable_ids(url, documents)
+    return Source(url, "url", content_hash, lambda: documents)
+
+
+def empty_summary():
+    return {
+        "added": 0,
+        "replaced": 0,
+        "skipped": 0,
+        "removed": 0,
+        "chunks_added": 0,
+        "chunks_skipped": 0,
+        "chunks_removed": 0,
+        "failed": [],
+        "parse_seconds": {},
+    }
+
+
+def sync_index(index, manifest, sources, remove_missing=True, on_source=None, on_progress=None, index_name=None):
+    """Bring index in line with sources, embedding only new or changed ones.
+
+    Nodes of changed sources, and of file sources that disappeared from the
+    documents folder (when remove_missing), are deleted first. Sources are
+    parsed in a process pool (see utils.ingest) and their chunks embedded
+    concurrently in batches (see utils.embed_pipeline), a window at a time.
+    on_progress(EmbedProgress) is called after every batch. Parse, chunk and
+    embed times are recorded as build_* metrics labelled with index_name.
+    The manifest is updated in place; the caller persists both index and
+    manifest.
+    """
+    from llama_index.core.ingestion import run_transformations
+    from llama_index.core.settings import Settings
+
+    known = manifest["sources"]
+    hashes = {source.key: source.content_hash for source in sources}
+    removable = [key for key, entry in known.items() if entry.get("kind") == "file"] if remove_missing else []
+    status = classify_sources(manifest, hashes, removable)
+    summary = empty_summary()
+    labels = {"index": index_name, "model": Settings.embed_model.model_name}
+
+    for key, state in status.items():
+        if state not in (CHANGED, REMOVED):
+            continue
+        entry = known[key]
+        for ref_doc_id in entry["ref_doc_ids"]:
+            index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+        summary["chunks_removed"] += len(entry["node_ids"])
+        if state == REMOVED:
+            del known[key]
+            summary["removed"] += 1
+            if on_source:
+                on_source(key, REMOVED, 0)
+
+    progress = EmbedProgress(sum(1 for source in sources if status[source.key] != UNCHANGED))
+    # Sources chunked but not yet embedded: (source, [(doc id, doc hash)], nodes)
+    window = []
+    window_size = EMBED_BATCH_SIZE * EMBED_CONCURRENCY
+
+    def on_batch(count):
+        progress.chunks_done += count
+        if on_progress:
+            on_progress(progress)
+
+    def flush():
+        nodes = [node for _, _, source_nodes in window for node in source_nodes]
+        try:
+            with span("build_embedding", **labels, chunks=len(nodes), sources=len(window)):
+                embed_nodes(Settings.embed_model, nodes, on_batch=on_batch)
+        except Exception as e:
+            logger.warning(f"Embedding failed for {len(window)} sources: {e}")
+            for source, _, _ in window:
+                summary["failed"].append((source.key, str(e)))
+                known.pop(source.key, None)
+        else:
+            for source, doc_hashes, source_nodes in window:
+                _insert_source(index, known, source, doc_hashes, source_nodes)
+                state = status[source.key]
+                summary["added" if state == NEW else "replaced"] += 1
+                summary["chunks_added"] += len(source_nodes)
+                if on_source:
+                    on_source(source.key, state, len(source_nodes))
+        window.clear()
+
+    changed = []
+    for source in sources:
+        if status[source.key] != UNCHANGED:
+            changed.append(source)
+            continue
+        summary["skipped"] += 1
+        summary["chunks_skipped"] += len(known[source.key]["node_ids"])
+        if on_source:
+            on_source(source.key, UNCHANGED, 0)
+
+    for source, documents, seconds, error in iter_parsed(changed):
+        summary["parse_seconds"][source.key] = seconds
+        observe("build_parse_seconds", seconds, **labels, source=source.key, failed=error is not None)
+        if error is None:
+            try:
+                with span("build_chunking", **labels, source=source.key) as attrs:
+                    nodes = run_transformations(documents, Settings.transformations)
+                    attrs["chunks"] = len(nodes)
+            except Exception as e:
+                error = e
+        if error is not None:
+            logger.warning(f"Failed to load {source.key}: {error}")
+            summary["failed"].append((source.key, str(error)))
+            # A changed source already lost its old nodes; forget it so the next sync re-adds it
+            known.pop(source.key, None)
+            continue
+        progress.sources_done += 1
+        progress.chunks_seen += len(nodes)
+        # Only ids and hashes outlive chunking; the parsed text lives on in the nodes
+        window.append((source, [(doc.doc_id, doc.hash) for doc in documents], nodes))
+        del documents
+        if sum(len(source_nodes) for _, _, source_nodes in window) >= window_size:
+            flush()
+    if window:
+        flush()
+    return summary
+
+
+def _insert_source(index, known, source, doc_hashes, nodes):
+    # Nodes arrive embedded, so the index stores them without calling the model again
+    index.insert_nodes(nodes)
+    for doc_id, doc_hash in doc_hashes:
+        index.docstore.set_document_hash(doc_id, doc_hash)
+    known[source.key] = {
+        "kind": source.kind,
+        "hash": source.content_hash,
+        "ref_doc_ids": [doc_id for doc_id, _ in doc_hashes],
+        "node_ids": [node.node_id for node in nodes],
+    }
+
+
+def format_summary(summary):
+    return (
+        f"Files: {summary['added']} added, {summary['replaced']} replaced, "
+        f"{summary['skipped']} unchanged, {summary['removed']} removed. "
+        f"Chunks: {summary['chunks_added']} embedded, {summary['chunks_skipped']} reused, "
+        f"{summary['chunks_removed']} deleted."
+    )
@@ -0,0 +1,75 @@
+"""Streaming document parsing for index builds.
+
+File sources are parsed in a process pool (PDF/DOCX parsing is CPU bound)
+and yielded in order of completion. At most INGEST_WINDOW files are queued
+or being parsed at once, and the next file is only submitted when the
+consumer asks for another result. Peak memory therefore stays bounded no
+matter how many files an index has. Other sources (already fetched URLs)
+are yielded inline.
+"""
+import os
+import time
+import logging
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_WINDOW = int(os.getenv("INGEST_WINDOW", str(2 * max(INGEST_WORKERS, 1))))
+
+# documents is None and error is set when loading failed
+Parsed = namedtuple("Parsed", ["source", "documents", "seconds", "error"])
+
+
+def timed_load(load):
+    start = time.perf_counter()
+    documents = load()
+    return documents, time.perf_counter() - start
+
+
+def _parse_inline(source):
+    start = time.perf_counter()
+    try:
+        documents, seconds = timed_load(source.load)
+    except Exception as e:
+        return Parsed(source, None, time.perf_counter() - start, e)
+    return Parsed(source, documents, seconds, None)
+
+
+def iter_parsed(sources, workers=INGEST_WORKERS, window=INGEST_WINDOW):
+    """Yield a Parsed per source, file sources in order of completion."""
+    pooled = [source for source in sources if source.kind == "file"]
+    if workers <= 0 or len(pooled) <= 1:
+        pooled = []
+    pooled_keys = {source.key for source in pooled}
+    for source in sources:
+        if source.key not in pooled_keys:
+            yield _parse_inline(source)
+    if not pooled:
+        return
+
+    # spawn, not fork: the Streamlit process already runs threads (embedding pool, SQLite)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        in_flight = {}
+        pending = iter(pooled)
+        while True:
+            while len(in_flight) < max(window, 1):
+                source = next(pending, None)
+                if source is None:
+                    break
+                in_flight[pool.submit(timed_load, source.load)] = (source, time.perf_counter())
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                source, submitted = in_flight.pop(future)
+                try:
+                    documents, seconds = future.result()
+                except Exception as e:
+                    logger.warning(f"Parsing {source.key} failed: {e}")
+                    yield Parsed(source, None, time.perf_counter() - submitted, e)
+                else:
+                    yield Parsed(source, documents, seconds, None)
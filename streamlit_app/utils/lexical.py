@@ -0,0 +1,308 @@
+"""BM25 inverted index over chunk text, fused with vector search at query time.
+
+Dense similarity blurs exact identifiers (L4T versions, CLI flags, error
+codes), so a binary index can also keep postings per term. Tokens are
+lowercased runs of letters and digits; compounds such as "r35.4.1" or
+"max-workers" are kept whole and also split into their parts.
+
+Files written next to vectors.npy (rows follow vectors.npy):
+    lexical_terms.txt       one term per line; term id = line number
+    lexical_offsets.npy     (terms + 1,) start of each term's postings
+    lexical_rows.npy        int32 rows grouped by term, ascending
+    lexical_tfs.npy         uint16 term frequency of each posting
+    lexical_doc_len.npy     int32 token count of each row
+
+A hybrid query takes the dense and the BM25 top candidates and merges them
+by weighted reciprocal rank, so only the best few chunks reach the prompt.
+
+Build the postings for an existing binary index with:
+    python -m utils.lexical Indexes/<name>
+"""
+import os
+import re
+import sys
+import argparse
+from collections import Counter
+
+import numpy as np
+
+from utils.retrieval import top_k
+
+LEXICAL_KIND = "bm25"
+TERMS_FNAME = "lexical_terms.txt"
+OFFSETS_FNAME = "lexical_offsets.npy"
+ROWS_FNAME = "lexical_rows.npy"
+TFS_FNAME = "lexical_tfs.npy"
+DOC_LEN_FNAME = "lexical_doc_len.npy"
+LEXICAL_FNAMES = (TERMS_FNAME, OFFSETS_FNAME, ROWS_FNAME, TFS_FNAME, DOC_LEN_FNAME)
+
+# Chunks that reach the prompt for a hybrid query, and candidates taken from each side
+HYBRID_TOP_K = int(os.getenv("HYBRID_TOP_K", "6"))
+HYBRID_CANDIDATES = 12
+# Weight of the dense ranking in the fusion; the BM25 ranking gets 1 - alpha
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))
+RRF_K = 60
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_TOKEN_CHARS = 64
+NODES_PER_READ = 1000
+
+_TOKEN = re.compile(r"[0-9a-z]+(?:[._:/+-][0-9a-z]+)*")
+_SEPARATORS = re.compile(r"[._:/+-]")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i if in is it its of on or that the this to was "
+    "what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) > MAX_TOKEN_CHARS or token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if _SEPARATORS.search(token):
+            tokens.extend(part for part in _SEPARATORS.split(token) if part and part not in STOPWORDS)
+    return tokens
+
+
+def _csr(term_ids, rows, tfs, num_terms):
+    """Postings grouped by term (rows stay ascending within a term); returns (offsets, rows, tfs)."""
+    order = np.argsort(term_ids, kind="stable")
+    offsets = np.zeros(num_terms + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=num_terms))
+    return offsets, rows[order], tfs[order]
+
+
+class BM25Index:
+    """Postings arrays for BM25 over rows 0..count-1."""
+
+    def __init__(self, terms, offsets, rows, tfs, doc_len):
+        self.terms = terms
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self._vocab = None
+        self._length_norm = None
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            [], np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.uint16), np.empty(0, dtype=np.int32),
+        )
+
+    @classmethod
+    def build(cls, token_lists):
+        return cls.empty().extend(token_lists)
+
+    @property
+    def count(self):
+        return self.doc_len.shape[0]
+
+    @property
+    def nbytes(self):
+        return int(
+            self.offsets.nbytes + self.rows.nbytes + self.tfs.nbytes + self.doc_len.nbytes
+            + sum(len(term) + 1 for term in self.terms)
+        )
+
+    def vocab(self):
+        if self._vocab is None:
+            self._vocab = {term: i for i, term in enumerate(self.terms)}
+        return self._vocab
+
+    def _term_ids(self):
+        return np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.offsets))
+
+    def extend(self, token_lists):
+        """New index with rows count.. added for token_lists; existing postings are reused."""
+        terms = list(self.terms)
+        vocab = dict(self.vocab())
+        term_ids, rows, tfs, doc_len = [], [], [], []
+        for i, tokens in enumerate(token_lists):
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_id = vocab.get(term)
+                if term_id is None:
+                    term_id = vocab[term] = len(terms)
+                    terms.append(term)
+                term_ids.append(term_id)
+                rows.append(self.count + i)
+                tfs.append(min(tf, np.iinfo(np.uint16).max))
+        offsets, all_rows, all_tfs = _csr(
+            np.concatenate([self._term_ids(), np.asarray(term_ids, dtype=np.int64)]),
+            np.concatenate([np.asarray(self.rows, dtype=np.int32), np.asarray(rows, dtype=np.int32)]),
+            np.concatenate([np.asarray(self.tfs, dtype=np.uint16), np.asarray(tfs, dtype=np.uint16)]),
+            len(terms),
+        )
+        extended = BM25Index(
+            terms, offsets, all_rows, all_tfs,
+            np.concatenate([self.doc_len, np.asarray(doc_len, dtype=np.int32)]),
+        )
+        extended._vocab = vocab
+        return extended
+
+    def take(self, keep):
+        """Index over the kept rows only, renumbered 0..len(keep)-1; unused terms are dropped."""
+        keep = np.asarray(keep, dtype=np.int64)
+        new_rows = np.full(self.count, -1, dtype=np.int64)
+        new_rows[keep] = np.arange(keep.shape[0])
+        mapped = new_rows[np.asarray(self.rows)]
+        alive = mapped >= 0
+        term_ids = self._term_ids()[alive]
+        used = np.flatnonzero(np.bincount(term_ids, minlength=len(self.terms)))
+        new_term_ids = np.full(len(self.terms), -1, dtype=np.int64)
+        new_term_ids[used] = np.arange(used.shape[0])
+        offsets, rows, tfs = _csr(
+            new_term_ids[term_ids], mapped[alive].astype(np.int32), np.asarray(self.tfs)[alive], used.shape[0]
+        )
+        return BM25Index([self.terms[i] for i in used], offsets, rows, tfs, self.doc_len[keep])
+
+    def scores(self, query):
+        """BM25 score of every row for the query text."""
+        scores = np.zeros(self.count, dtype=np.float32)
+        if self.count == 0:
+            return scores
+        if self._length_norm is None:
+            average = max(float(self.doc_len.mean()), 1.0)
+            self._length_norm = (BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / average)).astype(np.float32)
+        vocab = self.vocab()
+        for term in set(tokenize(query)):
+            term_id = vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            df = end - start
+            idf = np.log(1 + (self.count - df + 0.5) / (df + 0.5))
+            rows = self.rows[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + self._length_norm[rows])
+        return scores
+
+    def search(self, query, k, mask=None):
+        """(rows, scores) of the k best rows that contain any query term."""
+        scores = self.scores(query)
+        if mask is not None:
+            scores = np.where(mask, scores, 0)
+        hits = np.flatnonzero(scores > 0)
+        best, best_scores = top_k(scores[hits], k)
+        return hits[best], best_scores
+
+    def report(self):
+        return {
+            "kind": LEXICAL_KIND,
+            "rows": int(self.count),
+            "terms": len(self.terms),
+            "postings": int(self.rows.shape[0]),
+            "bytes": self.nbytes,
+        }
+
+    def save(self, index_path):
+        for fname, write in (
+            (TERMS_FNAME, lambda f: f.write("\n".join(self.terms).encode("utf-8"))),
+            (OFFSETS_FNAME, lambda f: np.save(f, self.offsets)),
+            (ROWS_FNAME, lambda f: np.save(f, np.asarray(self.rows, dtype=np.int32))),
+            (TFS_FNAME, lambda f: np.save(f, np.asarray(self.tfs, dtype=np.uint16))),
+            (DOC_LEN_FNAME, lambda f: np.save(f, self.doc_len)),
+        ):
+            tmp_path = os.path.join(index_path, fname + ".tmp")
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, os.path.join(index_path, fname))
+
+    @classmethod
+    def load(cls, index_path):
+        with open(os.path.join(index_path, TERMS_FNAME), "r", encoding="utf-8") as f:
+            text = f.read()
+        return cls(
+            text.split("\n") if text else [],
+            np.load(os.path.join(index_path, OFFSETS_FNAME)),
+            # Only the postings of the query terms are touched
+            np.load(os.path.join(index_path, ROWS_FNAME), mmap_mode="r"),
+            np.load(os.path.join(index_path, TFS_FNAME), mmap_mode="r"),
+            np.load(os.path.join(index_path, DOC_LEN_FNAME)),
+        )
+
+
+def remove_lexical_files(index_path):
+    for fname in LEXICAL_FNAMES:
+        path = os.path.join(index_path, fname)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def fuse_ranked(dense_keys, lexical_keys, k, alpha=HYBRID_ALPHA):
+    """Weighted reciprocal rank fusion of two rankings of any keys; returns the best k (key, fused score)."""
+    fused = {}
+    for weight, keys in ((alpha, dense_keys), (1 - alpha, lexical_keys)):
+        for rank, key in enumerate(keys):
+            fused[key] = fused.get(key, 0.0) + weight / (RRF_K + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def fuse(dense_rows, lexical_rows, k, alpha=HYBRID_ALPHA):
+    """Weighted reciprocal rank fusion of two row rankings; returns (rows, fused scores) of the best k."""
+    best = fuse_ranked(np.asarray(dense_rows).tolist(), np.asarray(lexical_rows).tolist(), k, alpha)
+    return (
+        np.asarray([row for row, _ in best], dtype=np.int64),
+        np.asarray([score for _, score in best], dtype=np.float32),
+    )
+
+
+def hybrid_retriever_kwargs(indexes, top_k=HYBRID_CANDIDATES):
+    """as_retriever() arguments: hybrid if every index has postings, else plain top_k vector search."""
+    if indexes and all(getattr(index.vector_store, "has_lexical", False) for index in indexes):
+        return {
+            "similarity_top_k": top_k,
+            "vector_store_query_mode": "hybrid",
+            "sparse_top_k": top_k,
+            "hybrid_top_k": HYBRID_TOP_K,
+            "alpha": HYBRID_ALPHA,
+        }
+    return {"similarity_top_k": top_k}
+
+
+def build_for_index(index_path):
+    """Write postings for an existing binary index from its docstore; returns the report."""
+    from llama_index.core.schema import MetadataMode
+
+    from utils.index_meta import update_index_metadata
+    from utils.vector_store import is_mmap_index, storage_context_for
+
+    if not is_mmap_index(index_path):
+        raise ValueError(f"{index_path} is not a binary index; convert it with python -m utils.vector_store first")
+    storage_context = storage_context_for(index_path, read_only=True)
+    ids = storage_context.vector_store._ids
+    token_lists = []
+    for start in range(0, len(ids), NODES_PER_READ):
+        for node in storage_context.docstore.get_nodes(ids[start:start + NODES_PER_READ]):
+            token_lists.append(tokenize(node.get_content(metadata_mode=MetadataMode.NONE)))
+    lexical = BM25Index.build(token_lists)
+    lexical.save(index_path)
+    report = lexical.report()
+    update_index_metadata(index_path, lexical=report)
+    return report
+
+
+def main(argv=None):
+    from utils.build_jobs import index_lock
+
+    parser = argparse.ArgumentParser(description="Build BM25 postings for existing binary indexes.")
+    parser.add_argument("index_paths", nargs="+", help="Index directories, e.g. Indexes/_L4T_README")
+    args = parser.parse_args(argv)
+
+    for index_path in args.index_paths:
+        # No build job may change the index while its postings are written
+        with index_lock(os.path.basename(os.path.normpath(index_path))):
+            report = build_for_index(index_path)
+        print(
+            f"{index_path}: {report['terms']} terms, {report['postings']} postings "
+            f"({report['bytes'] / (1024 * 1024):.1f} MB)"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""Per-index manifest of source content hashes and the nodes built from them.
+
+manifest.json maps a source key (uploaded file name or URL) to the hash of
+its content and the ref doc / node ids it produced, so appends can skip
+unchanged sources and delete the nodes of changed or removed ones.
+"""
+import os
+import json
+import hashlib
+
+MANIFEST_FNAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+REMOVED = "removed"
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(index_path):
+    path = os.path.join(index_path, MANIFEST_FNAME)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"version": MANIFEST_VERSION, "sources": {}}
+
+
+def save_manifest(index_path, manifest):
+    path = os.path.join(index_path, MANIFEST_FNAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def classify_sources(manifest, hashes, removable=()):
+    """Status per source key: new, changed or unchanged for current sources,
+    removed for keys in removable that are in the manifest but no longer present."""
+    known = manifest["sources"]
+    status = {}
+    for key, content_hash in hashes.items():
+        if key not in known:
+            status[key] = NEW
+        elif known[key]["hash"] != content_hash:
+            status[key] = CHANGED
+        else:
+            status[key] = UNCHANGED
+    for key in removable:
+        if key in known and key not in hashes:
+            status[key] = REMOVED
+    return status
@@ -0,0 +1,259 @@
+"""Timing spans and histograms for the chat and index build hot paths.
+
+span("rag_retrieval", index=..., model=...) times a block and records it
+in the <name>_seconds histogram, labelled by index and model. Extra
+attributes such as chunk counts go to the JSONL log only, keeping label
+cardinality low. Non-timing values (tokens/sec) go through observe().
+
+Histograms are exported in Prometheus text format on METRICS_PORT (/metrics)
+and every sample is appended to METRICS_LOG_DIR/metrics-<date>.jsonl. The
+Metrics page shows p50/p95/p99 computed from recent samples.
+
+Index builds run in worker processes (utils.build_jobs). Their samples
+reach the app through the same JSONL files: each record carries its pid,
+and before summarizing or exporting, the registry adds the records other
+processes appended since it was created.
+"""
+import os
+import glob
+import json
+import time
+import bisect
+import logging
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+METRICS_LOG_DIR = os.getenv("METRICS_LOG_DIR", "logs")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+# Recent samples kept per series for percentiles
+SAMPLES_PER_SERIES = 2048
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500, 1000)
+LABEL_NAMES = ("index", "model")
+
+
+def _buckets_for(name):
+    return SECONDS_BUCKETS if name.endswith("_seconds") else RATE_BUCKETS
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.samples = deque(maxlen=SAMPLES_PER_SERIES)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.samples.append(value)
+
+
+class MetricsRegistry:
+    def __init__(self, log_dir=METRICS_LOG_DIR):
+        self.log_dir = log_dir
+        self._series = defaultdict(dict)  # name -> {labels tuple: Histogram}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        # Log file -> bytes already read; records written before this registry existed are skipped
+        self._log_offsets = {path: os.path.getsize(path) for path in self._log_paths()}
+
+    def _observe(self, name, value, index, model):
+        labels = (index or "", model or "")
+        with self._lock:
+            histogram = self._series[name].get(labels)
+            if histogram is None:
+                histogram = self._series[name][labels] = Histogram(_buckets_for(name))
+            histogram.observe(value)
+
+    def observe(self, name, value, index=None, model=None, **attrs):
+        self._observe(name, value, index, model)
+        self._log({
+            "ts": time.time(), "metric": name, "value": value, "index": index, "model": model,
+            "pid": os.getpid(), **attrs,
+        })
+
+    def _log_paths(self):
+        return sorted(glob.glob(os.path.join(self.log_dir, "metrics-*.jsonl"))) if self.log_dir else []
+
+    def collect_other_processes(self):
+        """Add the samples other processes (build workers) appended to the JSONL log."""
+        pid = os.getpid()
+        records = []
+        # Also serializes the page and /metrics threads, so no line is read twice
+        with self._log_lock:
+            for path in self._log_paths():
+                offset = self._log_offsets.get(path, 0)
+                try:
+                    with open(path, "rb") as f:
+                        f.seek(offset)
+                        data = f.read()
+                except OSError:
+                    continue
+                # A line still being written is read next time
+                complete = data[:data.rfind(b"\n") + 1]
+                self._log_offsets[path] = offset + len(complete)
+                records.extend(complete.splitlines())
+        for line in records:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("pid") not in (None, pid) and isinstance(record.get("value"), (int, float)):
+                self._observe(record["metric"], record["value"], record.get("index"), record.get("model"))
+
+    def _log(self, record):
+        if not self.log_dir:
+            return
+        path = os.path.join(self.log_dir, time.strftime("metrics-%Y-%m-%d.jsonl"))
+        line = json.dumps(record, default=str) + "\n"
+        try:
+            with self._log_lock:
+                os.makedirs(self.log_dir, exist_ok=True)
+                with open(path, "a") as f:
+                    f.write(line)
+        except OSError as e:
+            logger.warning(f"Could not write metrics log {path}: {e}")
+
+    @contextmanager
+    def span(self, name, index=None, model=None, **attrs):
+        """Time the block into <name>_seconds; the yielded dict adds JSONL attributes."""
+        start = time.perf_counter()
+        extra = dict(attrs)
+        try:
+            yield extra
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, index=index, model=model, **extra)
+
+    def summary(self):
+        """[{metric, index, model, count, p50, p95, p99, mean}] for every series."""
+        self.collect_other_processes()
+        rows = []
+        with self._lock:
+            for name in sorted(self._series):
+                for (index, model), histogram in sorted(self._series[name].items()):
+                    values = sorted(histogram.samples)
+                    rows.append({
+                        "metric": name,
+                        "index": index,
+                        "model": model,
+                        "count": histogram.count,
+                        "p50": percentile(values, 0.50),
+                        "p95": percentile(values, 0.95),
+                        "p99": percentile(values, 0.99),
+                        "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                    })
+        return rows
+
+    def render_prometheus(self):
+        self.collect_other_processes()
+        lines = []
+        with self._lock:
+            for name in sorted(self._series):
+                metric = f"copilot_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, histogram in sorted(self._series[name].items()):
+                    label_text = ",".join(
+                        f'{key}="{_escape(value)}"' for key, value in zip(LABEL_NAMES, labels)
+                    )
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                    lines.append(f"{metric}_sum{{{label_text}}} {histogram.sum}")
+                    lines.append(f"{metric}_count{{{label_text}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
+
+
+def span(name, index=None, model=None, **attrs):
+    return get_metrics().span(name, index=index, model=model, **attrs)
+
+
+def observe(name, value, index=None, model=None, **attrs):
+    get_metrics().observe(name, value, index=index, model=model, **attrs)
+
+
+def timed_stream(chunks, started, index=None, model=None):
+    """Yield chunks, recording time to first token (from started), generation time and tokens/sec.
+
+    Ollama streams one token per chunk, so chunks count as tokens.
+    """
+    first = None
+    count = 0
+    for chunk in chunks:
+        if first is None:
+            first = time.perf_counter()
+            observe("chat_ttft_seconds", first - started, index=index, model=model)
+        count += 1
+        yield chunk
+    if first is None:
+        return
+    generation = time.perf_counter() - first
+    observe("chat_generation_seconds", generation, index=index, model=model, tokens=count)
+    if generation > 0:
+        observe("chat_tokens_per_sec", count / generation, index=index, model=model)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics once per process; port 0 disables the endpoint."""
+    global _server
+    with _registry_lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"Metrics endpoint not started on port {port}: {e}")
+            _server = False
+            return None
+        threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+        logger.info(f"Prometheus metrics on :{port}/metrics")
+        return _server
@@ -0,0 +1,33 @@
+import os
+import json
+import threading
+
+# Path to the model catalog (mount as /app/model_catalog.json)
+CATALOG_PATH = os.getenv("MODEL_CATALOG_PATH", "/app/model_catalog.json")
+# Context window assumed for models whose catalog entry has no "Context" (Ollama's default num_ctx)
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("DEFAULT_CONTEXT_TOKENS", "4096"))
+
+_catalog = (None, {})  # (mtime_ns, catalog)
+_lock = threading.Lock()
+
+
+def load_model_catalog(path=CATALOG_PATH):
+    """Catalog dict (empty if missing), re-read only when the file changes."""
+    global _catalog
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    with _lock:
+        if _catalog[0] != mtime:
+            with open(path, "r") as f:
+                _catalog = (mtime, json.load(f))
+        return _catalog[1]
+
+
+def context_tokens(model_name):
+    """Context window for model_name from the catalog's optional "Context" field."""
+    try:
+        return int(load_model_catalog().get(model_name, {}).get("Context", DEFAULT_CONTEXT_TOKENS))
+    except (TypeError, ValueError):
+        return DEFAULT_CONTEXT_TOKENS
@@ -0,0 +1,174 @@
+"""Shared Ollama clients, model list and LLM / embedding instances.
+
+Module state outlives Streamlit reruns and sessions, so pages get:
+  - one ollama.Client per base URL, whose httpx pool keeps connections alive;
+    its chat / generate / embed calls wait for a slot in utils.scheduler and
+    carry the keep_alive chosen by utils.residency
+  - a model list cached for OLLAMA_MODELS_TTL_S seconds and refreshed in a
+    background thread once stale (callers keep the stale list meanwhile)
+  - one Ollama LLM and one cached embedding model per (model, base URL)
+llama_index is imported by get_llm / get_embed_model only, so pages that
+just list models or talk to the client directly start without it.
+"""
+import os
+import time
+import logging
+import threading
+
+import ollama
+
+from utils.scheduler import ScheduledStream, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODELS_TTL_S = float(os.getenv("OLLAMA_MODELS_TTL_S", "30"))
+LLM_REQUEST_TIMEOUT_S = 300.0
+
+_clients = {}
+_llms = {}
+_embed_models = {}
+_lock = threading.Lock()
+
+
+class ScheduledClient(ollama.Client):
+    """ollama.Client whose model calls are admitted by the shared scheduler.
+
+    Streaming calls hold their slot until the stream is exhausted or closed.
+    keep_alive_for(model) supplies keep_alive for calls that do not set one.
+    """
+
+    def __init__(self, host=None, scheduler=None, keep_alive_for=None, **kwargs):
+        super().__init__(host=host, **kwargs)
+        self._scheduler = scheduler or get_scheduler()
+        self._keep_alive_for = keep_alive_for
+
+    def _scheduled(self, call, args, kwargs, embedding=False):
+        model = kwargs.get("model") or (args[0] if args else "")
+        if kwargs.get("keep_alive") is None and self._keep_alive_for is not None:
+            kwargs["keep_alive"] = self._keep_alive_for(model)
+        waiter = self._scheduler.acquire(model, embedding=embedding)
+        try:
+            result = call(*args, **kwargs)
+        except BaseException:
+            self._scheduler.release(waiter)
+            raise
+        if kwargs.get("stream"):
+            return ScheduledStream(self._scheduler, waiter, result)
+        self._scheduler.release(waiter)
+        return result
+
+    def chat(self, *args, **kwargs):
+        return self._scheduled(super().chat, args, kwargs)
+
+    def generate(self, *args, **kwargs):
+        return self._scheduled(super().generate, args, kwargs)
+
+    def embed(self, *args, **kwargs):
+        return self._scheduled(super().embed, args, kwargs, embedding=True)
+
+    def embeddings(self, *args, **kwargs):
+        return self._scheduled(super().embeddings, args, kwargs, embedding=True)
+
+
+def _keep_alive_for(model):
+    # Imported here: utils.residency builds its manager on get_client
+    from utils.residency import keep_alive_for
+
+    return keep_alive_for(model)
+
+
+def get_client(base_url=OLLAMA_BASE_URL, timeout=None):
+    key = (base_url, timeout)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = ScheduledClient(host=base_url, timeout=timeout, keep_alive_for=_keep_alive_for)
+        return client
+
+
+def get_llm(model_name, base_url=OLLAMA_BASE_URL, request_timeout=LLM_REQUEST_TIMEOUT_S):
+    from llama_index.llms.ollama import Ollama
+
+    key = (model_name, base_url, request_timeout)
+    with _lock:
+        llm = _llms.get(key)
+        if llm is None:
+            llm = _llms[key] = Ollama(model=model_name, request_timeout=request_timeout, base_url=base_url)
+    # Route the LLM's calls through the shared, scheduled client (outside _lock: get_client takes it)
+    llm._client = get_client(base_url, timeout=request_timeout)
+    return llm
+
+
+def get_embed_model(model_name, base_url=OLLAMA_BASE_URL):
+    from utils.embed_cache import cached_ollama_embedding
+
+    key = (model_name, base_url)
+    with _lock:
+        embed_model = _embed_models.get(key)
+        if embed_model is None:
+            embed_model = _embed_models[key] = cached_ollama_embedding(model_name, base_url)
+    embed_model.inner._client = get_client(base_url)
+    return embed_model
+
+
+def model_name(entry):
+    return entry.get("name") or entry.get("model")
+
+
+class ModelRegistry:
+    """TTL cache of the host's model list with stale-while-refresh semantics."""
+
+    def __init__(self, base_url, ttl):
+        self.base_url = base_url
+        self.ttl = ttl
+        self._models = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        models = list(get_client(self.base_url).list().get("models", []))
+        with self._lock:
+            self._models = models
+            self._fetched_at = time.monotonic()
+        return models
+
+    def _refresh_in_background(self):
+        try:
+            self._fetch()
+        except Exception as e:
+            logger.warning(f"Refreshing Ollama model list failed, keeping cached list: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def models(self):
+        """Raw model entries; raises only if no list has ever been fetched."""
+        with self._lock:
+            models = self._models
+            stale = time.monotonic() - self._fetched_at > self.ttl
+            if models is not None and stale and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        if models is None:
+            return self._fetch()
+        return models
+
+    def model_names(self):
+        return sorted(name for name in map(model_name, self.models()) if name)
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = 0.0
+
+
+_registries = {}
+
+
+def get_model_registry(base_url=OLLAMA_BASE_URL):
+    with _lock:
+        registry = _registries.get(base_url)
+        if registry is None:
+            registry = _registries[base_url] = ModelRegistry(base_url, OLLAMA_MODELS_TTL_S)
+        return registry
@@ -0,0 +1,280 @@
+"""Compressed vector codes for a fast first pass, re-ranked exactly.
+
+Two codecs over the unit-normalized matrix in vectors.npy:
+    int8  one signed byte per dimension with a per-dimension scale
+    pq    product quantization: each vector is cut into m sub-vectors and
+          every sub-vector stored as the id of its closest of 256 k-means
+          centroids, so a vector takes m bytes
+A query scores every code (int8: one widened dot product, pq: table
+lookups), keeps the best k * RERANK_FACTOR rows and re-scores only those
+exactly from the memory-mapped matrix. Only the codes have to stay in
+memory; vectors.npy is read a few rows per query.
+
+Files written next to vectors.npy:
+    quant_codes.npy     (count, dim) int8 or (m, count) uint8 codes
+    quant_params.npz    kind plus int8 scales or pq codebooks
+"""
+import os
+import time
+
+import numpy as np
+
+from utils.retrieval import DenseTopK, normalize_query, top_k
+
+QUANT_KINDS = ("int8", "pq")
+CODES_FNAME = "quant_codes.npy"
+PARAMS_FNAME = "quant_params.npz"
+RERANK_FACTOR = 8
+MIN_CANDIDATES = 64
+# Codes are widened to float32 this many rows at a time (small blocks stay in cache)
+QUANT_BLOCK_ROWS = 2048
+PQ_CENTROIDS = 256
+# Default sub-vector width; 1024 dims -> m = 128 bytes per vector
+PQ_SUBVECTOR_DIMS = 8
+PQ_NITER = 10
+# k-means is trained on at most this many rows per centroid
+TRAIN_ROWS_PER_CENTROID = 64
+RECALL_K = 12
+RECALL_QUERIES = 200
+
+
+class Int8Codes:
+    kind = "int8"
+
+    def __init__(self, scales, codes):
+        self.scales = scales
+        self.codes = codes
+
+    @property
+    def count(self):
+        """Number of matrix rows covered; later rows must be scanned exactly."""
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    @classmethod
+    def train(cls, matrix, **kwargs):
+        scales = np.zeros(matrix.shape[1], dtype=np.float32)
+        for start in range(0, matrix.shape[0], QUANT_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + QUANT_BLOCK_ROWS], dtype=np.float32)
+            scales = np.maximum(scales, np.abs(block).max(axis=0))
+        scales = np.where(scales > 0, scales / 127, 1.0).astype(np.float32)
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        for start in range(0, matrix.shape[0], QUANT_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + QUANT_BLOCK_ROWS], dtype=np.float32)
+            codes[start:start + QUANT_BLOCK_ROWS] = np.clip(np.rint(block / scales), -127, 127)
+        return cls(scales, codes)
+
+    def scores(self, query):
+        # Folding the scales into the query keeps the per-row work to one widened dot product
+        scaled = query * self.scales
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, QUANT_BLOCK_ROWS):
+            scores[start:start + QUANT_BLOCK_ROWS] = self.codes[start:start + QUANT_BLOCK_ROWS].astype(np.float32) @ scaled
+        return scores
+
+    def params(self):
+        return {"scales": self.scales}
+
+    @classmethod
+    def from_params(cls, params, codes):
+        return cls(params["scales"], codes)
+
+
+def pq_subvectors(dim, m=None):
+    """Number of sub-vectors: m if given, else dim / PQ_SUBVECTOR_DIMS rounded to a divisor of dim."""
+    if m:
+        if dim % m:
+            raise ValueError(f"PQ sub-vectors ({m}) must divide the embedding dimension ({dim})")
+        return m
+    m = max(1, dim // PQ_SUBVECTOR_DIMS)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _kmeans(data, count, niter, rng):
+    """Euclidean k-means; returns (count, width) float32 centroids."""
+    centroids = data[rng.choice(data.shape[0], count, replace=False)].copy()
+    for _ in range(niter):
+        assign = _nearest(data, centroids)
+        counts = np.bincount(assign, minlength=count)
+        sums = np.stack([np.bincount(assign, weights=data[:, d], minlength=count) for d in range(data.shape[1])], axis=1)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty centroids with random rows so every code stays usable
+        empty = np.flatnonzero(~filled)
+        if empty.size:
+            centroids[empty] = data[rng.choice(data.shape[0], empty.size)]
+    return centroids
+
+
+def _nearest(data, centroids):
+    distances = (centroids * centroids).sum(axis=1) - 2 * (data @ centroids.T)
+    return np.argmin(distances, axis=1)
+
+
+class PQCodes:
+    kind = "pq"
+
+    def __init__(self, codebooks, codes):
+        self.codebooks = codebooks  # (m, centroids, dim / m)
+        # (m, count) uint8: one contiguous row of codes per sub-vector, for fast lookups
+        self.codes = codes
+
+    @property
+    def count(self):
+        return self.codes.shape[1]
+
+    @property
+    def m(self):
+        return self.codebooks.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.codebooks.nbytes
+
+    @classmethod
+    def train(cls, matrix, m=None, seed=0, train_rows=None):
+        rng = np.random.default_rng(seed)
+        count, dim = matrix.shape
+        m = pq_subvectors(dim, m)
+        width = dim // m
+        if train_rows is None:
+            train_rows = np.arange(count)
+        sample_size = min(train_rows.shape[0], PQ_CENTROIDS * TRAIN_ROWS_PER_CENTROID)
+        sample = np.asarray(matrix[np.sort(rng.choice(train_rows, sample_size, replace=False))], dtype=np.float32)
+        centroids = min(PQ_CENTROIDS, sample.shape[0])
+        codebooks = np.stack([
+            _kmeans(sample[:, j * width:(j + 1) * width], centroids, PQ_NITER, rng)
+            for j in range(m)
+        ])
+        pq = cls(codebooks, np.empty((m, 0), dtype=np.uint8))
+        pq.codes = pq.encode(matrix)
+        return pq
+
+    def encode(self, matrix):
+        width = self.codebooks.shape[2]
+        codes = np.empty((self.m, matrix.shape[0]), dtype=np.uint8)
+        for start in range(0, matrix.shape[0], QUANT_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + QUANT_BLOCK_ROWS], dtype=np.float32)
+            for j in range(self.m):
+                codes[j, start:start + QUANT_BLOCK_ROWS] = _nearest(block[:, j * width:(j + 1) * width], self.codebooks[j])
+        return codes
+
+    def scores(self, query):
+        # tables[j, c] = dot product of sub-query j with centroid c; a row's score sums its m entries
+        tables = np.einsum("mcw,mw->mc", self.codebooks, query.reshape(self.m, -1))
+        scores = np.zeros(self.count, dtype=np.float32)
+        for table, codes in zip(tables.astype(np.float32), self.codes):
+            scores += np.take(table, codes)
+        return scores
+
+    def params(self):
+        return {"codebooks": self.codebooks}
+
+    @classmethod
+    def from_params(cls, params, codes):
+        return cls(params["codebooks"], codes)
+
+
+CODECS = {Int8Codes.kind: Int8Codes, PQCodes.kind: PQCodes}
+
+
+def search(codec, matrix, query, k, mask=None, rerank=RERANK_FACTOR):
+    """(rows, scores) of the best k rows: approximate pass over codes, exact re-score of the candidates."""
+    query = normalize_query(query)
+    scores = codec.scores(query)
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+    candidates, _ = top_k(scores, max(k * rerank, MIN_CANDIDATES))
+    if candidates.size == 0:
+        return candidates, np.empty(0, dtype=np.float32)
+    # Sorted rows turn the gather into mostly sequential reads of the mmap
+    candidates.sort()
+    exact = np.asarray(matrix[candidates], dtype=np.float32) @ query
+    selected, exact = top_k(exact, k)
+    return candidates[selected], exact
+
+
+def save_codes(codec, index_path):
+    for fname, write in (
+        (CODES_FNAME, lambda f: np.save(f, codec.codes)),
+        (PARAMS_FNAME, lambda f: np.savez(f, kind=codec.kind, **codec.params())),
+    ):
+        tmp_path = os.path.join(index_path, fname + ".tmp")
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, os.path.join(index_path, fname))
+
+
+def load_codes(index_path):
+    with np.load(os.path.join(index_path, PARAMS_FNAME)) as params:
+        params = dict(params)
+    # Loaded into memory on purpose: the codes are what every query scans
+    codes = np.load(os.path.join(index_path, CODES_FNAME))
+    return CODECS[str(params.pop("kind"))].from_params(params, codes)
+
+
+def remove_quant_files(index_path):
+    for fname in (CODES_FNAME, PARAMS_FNAME):
+        path = os.path.join(index_path, fname)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def build_with_report(matrix, kind, pq_m=None, rerank=RERANK_FACTOR, seed=0):
+    """Encode the matrix and measure what it saves and costs.
+
+    Memory is the codes (plus scales or codebooks) against the stored
+    matrix. recall@12 compares quantized search, with and without the exact
+    re-ranking, to exact search for held-out rows used as queries; PQ
+    codebooks are trained without those rows.
+    """
+    if kind not in CODECS:
+        raise ValueError(f"Unsupported quantization: {kind}")
+    rng = np.random.default_rng(seed)
+    count = matrix.shape[0]
+    num_queries = min(RECALL_QUERIES, max(1, count // 10))
+    held_out = rng.choice(count, num_queries, replace=False)
+    train_rows = np.setdiff1d(np.arange(count), held_out) if count > num_queries else np.arange(count)
+
+    start = time.perf_counter()
+    codec = CODECS[kind].train(matrix, m=pq_m, seed=seed, train_rows=train_rows)
+    build_seconds = time.perf_counter() - start
+
+    exact = DenseTopK(matrix)
+    k = min(RECALL_K, count)
+    hits, first_pass_hits, exact_ms, quant_ms = 0, 0, 0.0, 0.0
+    for row in held_out:
+        query = np.asarray(matrix[row], dtype=np.float32)
+        start = time.perf_counter()
+        truth, _ = exact.search(query, RECALL_K)
+        exact_ms += (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        found, _ = search(codec, matrix, query, RECALL_K, rerank=rerank)
+        quant_ms += (time.perf_counter() - start) * 1000
+        hits += np.intersect1d(truth, found).size
+        first_pass, _ = top_k(codec.scores(normalize_query(query)), RECALL_K)
+        first_pass_hits += np.intersect1d(truth, first_pass).size
+    full_bytes = int(matrix.shape[0] * matrix.shape[1] * matrix.dtype.itemsize)
+    report = {
+        "kind": kind,
+        "count": codec.count,
+        "bytes_full": full_bytes,
+        "bytes_codes": int(codec.nbytes),
+        "memory_saved": 1 - codec.nbytes / full_bytes if full_bytes else 0.0,
+        "recall_at_12": hits / (num_queries * k),
+        "first_pass_recall_at_12": first_pass_hits / (num_queries * k),
+        "rerank": rerank,
+        "rerank_candidates": max(RECALL_K * rerank, MIN_CANDIDATES),
+        "recall_queries": int(num_queries),
+        "exact_ms": exact_ms / num_queries,
+        "quantized_ms": quant_ms / num_queries,
+        "build_seconds": build_seconds,
+    }
+    if kind == PQCodes.kind:
+        report["m"] = codec.m
+    return codec, report
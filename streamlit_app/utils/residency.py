@@ -0,0 +1,338 @@
+"""Keeps the selected LLM and embedding models loaded in Ollama.
+
+A cold model load costs seconds on the first request and can push the
+other model out of the Jetson's unified memory. ResidencyManager:
+  - sizes models from the "RAM" field of model_catalog.json ("~8-10 GB"
+    counts as 10 GB), or Ollama's file size plus overhead if not listed
+  - budgets host memory (HOST_MEMORY_GB, else MemTotal) minus
+    MODEL_MEMORY_RESERVE_GB for the app, indexes and the OS
+  - keeps warm the models that sessions selected within the keep-alive,
+    most recent selection first, as far as the budget allows
+  - preloads a selection in the background when it is made, and unloads
+    loaded models outside the warm set when the selection needs the room;
+    both happen on a worker thread, so a Streamlit rerun never waits on
+    Ollama or the scheduler
+  - refuses to preload a model larger than the budget, and warns when a
+    selection's models cannot be resident together (they would swap on
+    every RAG question)
+Every request sent through utils.ollama_client carries keep_alive for its
+model. Warm models get MODEL_KEEP_ALIVE; other models get Ollama's default.
+Without this, each chat request would reset the model to Ollama's
+5-minute default.
+"""
+import os
+import re
+import time
+import logging
+import threading
+
+from utils.model_catalog import load_model_catalog
+from utils.scheduler import BACKGROUND, request_context
+
+logger = logging.getLogger(__name__)
+
+MODEL_KEEP_ALIVE = os.getenv("MODEL_KEEP_ALIVE", "30m")
+MODEL_MEMORY_RESERVE_GB = float(os.getenv("MODEL_MEMORY_RESERVE_GB", "4"))
+# 0 = read MemTotal from /proc/meminfo (the host's memory, also inside Docker)
+HOST_MEMORY_GB = float(os.getenv("HOST_MEMORY_GB", "0"))
+# Loaded footprint of a model not in the catalog, relative to its file size
+SIZE_OVERHEAD = 1.2
+# How long a /api/ps answer is reused; the sidebar asks on every rerun
+PS_TTL_S = 5.0
+
+GB = 1 << 30
+_UNITS = {"MB": 1 << 20, "GB": GB, "TB": 1 << 40}
+
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+def parse_ram(text):
+    """Bytes for a catalog RAM string ("~8-10 GB", ">=32 GB", "~4 GB"), upper bound; None if unparseable."""
+    match = re.search(r"([\d.]+)(?:\s*-\s*([\d.]+))?\s*(MB|GB|TB)", str(text or ""), re.IGNORECASE)
+    if not match:
+        return None
+    high = float(match.group(2) or match.group(1))
+    return int(high * _UNITS[match.group(3).upper()])
+
+
+def keep_alive_seconds(value):
+    """Seconds for an Ollama keep_alive ("30m", "1h", "45s" or seconds); negative means forever."""
+    match = re.fullmatch(r"(-?[\d.]+)\s*(ms|s|m|h)?", str(value).strip())
+    if not match:
+        raise ValueError(f"Invalid keep_alive: {value!r}")
+    return float(match.group(1)) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}[match.group(2)]
+
+
+def host_memory_bytes():
+    if HOST_MEMORY_GB:
+        return int(HOST_MEMORY_GB * GB)
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def format_gb(size):
+    return f"{size / GB:.1f} GB"
+
+
+class ResidencyManager:
+    """Decides which models stay loaded and preloads them; shared by all sessions.
+
+    client is an ollama.Client. budget is the memory in bytes models may
+    use, or None if unknown, in which case nothing is refused or unloaded.
+    """
+
+    def __init__(self, client, budget, keep_alive=MODEL_KEEP_ALIVE, catalog=load_model_catalog):
+        self.client = client
+        self.budget = budget
+        self.keep_alive = keep_alive
+        self.keep_alive_s = keep_alive_seconds(keep_alive)
+        self.catalog = catalog
+        self._selections = {}  # owner -> (models, selected_at)
+        self._status = {}      # model -> (LOADING / READY / FAILED, monotonic time, error)
+        self._file_sizes = {}
+        self._ps = (0.0, [])
+        self._pending = {}     # wanted models -> whether to refresh /api/ps first
+        self._worker = None
+        self._lock = threading.Lock()
+        self.preloads = 0
+        self.unloads = 0
+
+    def model_bytes(self, model):
+        """Memory model needs when loaded, or None if neither catalog nor Ollama knows."""
+        size = parse_ram(self.catalog().get(model, {}).get("RAM"))
+        if size is not None:
+            return size
+        if model not in self._file_sizes:
+            try:
+                for entry in self.client.list().get("models", []):
+                    self._file_sizes[entry.get("model") or entry.get("name")] = entry.get("size")
+            except Exception as e:
+                logger.warning(f"Could not list Ollama models for sizing: {e}")
+            self._file_sizes.setdefault(model, None)
+        size = self._file_sizes.get(model)
+        return int(size * SIZE_OVERHEAD) if size else None
+
+    def check(self, models):
+        """Whether models can stay loaded together: {"ok", "refused", "warning", "required", "budget"}.
+
+        refused lists models that alone exceed the budget (not preloaded);
+        warning explains a combination that would make Ollama swap models.
+        """
+        models = [model for model in dict.fromkeys(models) if model]
+        sizes = {model: self.model_bytes(model) for model in models}
+        required = sum(size for size in sizes.values() if size)
+        report = {"ok": True, "refused": [], "warning": None, "required": required, "budget": self.budget}
+        if self.budget is None:
+            return report
+        report["refused"] = [model for model, size in sizes.items() if size and size > self.budget]
+        if report["refused"]:
+            report["ok"] = False
+            report["warning"] = (
+                f"{', '.join(report['refused'])} needs more than the {format_gb(self.budget)} available "
+                f"for models; it will not be preloaded and may not load at all."
+            )
+        elif required > self.budget:
+            report["ok"] = False
+            report["warning"] = (
+                f"{' and '.join(models)} need {format_gb(required)} together, but only "
+                f"{format_gb(self.budget)} is available for models. Ollama will reload one of them "
+                f"on every RAG question; pick a smaller LLM or embedding model."
+            )
+        return report
+
+    def _live_selections(self, now):
+        expired = [owner for owner, (_, at) in self._selections.items()
+                   if self.keep_alive_s >= 0 and now - at > self.keep_alive_s]
+        for owner in expired:
+            del self._selections[owner]
+        return sorted(self._selections.values(), key=lambda item: item[1], reverse=True)
+
+    def warm_set(self):
+        """Models to keep loaded: live selections, most recent first, while they fit the budget."""
+        with self._lock:
+            selections = self._live_selections(time.monotonic())
+        warm, used = [], 0
+        for models, _ in selections:
+            for model in models:
+                if model in warm:
+                    continue
+                size = self.model_bytes(model) or 0
+                if self.budget is not None and used + size > self.budget:
+                    continue
+                warm.append(model)
+                used += size
+        return warm
+
+    def keep_alive_for(self, model):
+        """keep_alive for a request to model: MODEL_KEEP_ALIVE if warm, else None (Ollama's default)."""
+        return self.keep_alive if model in self.warm_set() else None
+
+    def loaded(self, refresh=False):
+        """Models Ollama has loaded ([{"model", "size", "expires_at"}]), cached for PS_TTL_S."""
+        fetched_at, models = self._ps
+        if refresh or time.monotonic() - fetched_at > PS_TTL_S:
+            try:
+                models = [
+                    {"model": entry.get("model") or entry.get("name"), "size": entry.get("size"),
+                     "expires_at": entry.get("expires_at")}
+                    for entry in self.client.ps().get("models", [])
+                ]
+            except Exception as e:
+                logger.warning(f"Could not read loaded Ollama models: {e}")
+            self._ps = (time.monotonic(), models)
+        return models
+
+    def select(self, owner, models):
+        """Record owner's selection and queue preloading what is not loaded yet; returns check(models)."""
+        models = tuple(model for model in dict.fromkeys(models) if model)
+        report = self.check(models)
+        wanted = tuple(model for model in models if model not in report["refused"])
+        with self._lock:
+            previous = self._selections.get(owner, ((), 0.0))[0]
+            self._selections[owner] = (models, time.monotonic())
+            self._pending[wanted] = self._pending.get(wanted, False) or models != previous
+            start = self._worker is None
+            if start:
+                self._worker = threading.Thread(target=self._work, daemon=True, name="residency")
+        if start:
+            self._worker.start()
+        return report
+
+    def _work(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._worker = None
+                    return
+                wanted, refresh = self._pending.popitem()
+            try:
+                self._sync(wanted, refresh)
+            except Exception as e:
+                logger.warning(f"Could not preload {', '.join(wanted)}: {e}")
+
+    def _sync(self, wanted, refresh):
+        """Make room for and preload the wanted models that are not loaded."""
+        loaded = {entry["model"] for entry in self.loaded(refresh=refresh)}
+        missing = [model for model in wanted if model not in loaded]
+        if missing:
+            self._make_room(wanted, loaded)
+        for model in missing:
+            self.preload(model)
+
+    def _make_room(self, wanted, loaded):
+        """Unload loaded models outside the warm set while wanted models would not fit."""
+        if self.budget is None:
+            return
+        warm = set(self.warm_set())
+        resident = {model: self.model_bytes(model) or 0 for model in loaded}
+        needed = sum(self.model_bytes(model) or 0 for model in wanted if model not in loaded)
+        for model in sorted(resident, key=resident.get, reverse=True):
+            if sum(resident.values()) + needed <= self.budget:
+                break
+            if model in warm:
+                continue
+            self.unload(model)
+            del resident[model]
+
+    def _is_embedding(self, model):
+        try:
+            return "embedding" in (self.client.show(model).get("capabilities") or [])
+        except Exception:
+            return "embed" in model.lower()
+
+    def preload(self, model):
+        """Load model in a background thread unless a preload is already running."""
+        with self._lock:
+            state = self._status.get(model)
+            if state and state[0] == LOADING:
+                return
+            self._status[model] = (LOADING, time.monotonic(), None)
+            self.preloads += 1
+        threading.Thread(target=self._preload, args=(model,), daemon=True, name=f"preload-{model}").start()
+
+    def _preload(self, model):
+        start = time.perf_counter()
+        try:
+            with request_context(priority=BACKGROUND):
+                # An empty request only loads the model, as documented for Ollama
+                if self._is_embedding(model):
+                    self.client.embed(model=model, input=[], keep_alive=self.keep_alive)
+                else:
+                    self.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+        except Exception as e:
+            logger.warning(f"Preloading {model} failed: {e}")
+            with self._lock:
+                self._status[model] = (FAILED, time.monotonic(), str(e))
+        else:
+            logger.info(f"Preloaded {model} in {time.perf_counter() - start:.1f}s")
+            with self._lock:
+                self._status[model] = (READY, time.monotonic(), None)
+        self._ps = (0.0, self._ps[1])
+
+    def unload(self, model):
+        logger.info(f"Unloading {model} to make room for the selected models")
+        try:
+            if self._is_embedding(model):
+                self.client.embed(model=model, input=[], keep_alive=0)
+            else:
+                self.client.generate(model=model, prompt="", keep_alive=0)
+        except Exception as e:
+            logger.warning(f"Unloading {model} failed: {e}")
+            return
+        with self._lock:
+            self._status.pop(model, None)
+            self.unloads += 1
+
+    def status(self, model):
+        """(LOADING / READY / FAILED or None, error) of the last preload of model."""
+        with self._lock:
+            state = self._status.get(model)
+        return (state[0], state[2]) if state else (None, None)
+
+    def wait(self, models, timeout=None):
+        """Block until queued selections are handled and no preload of models is running; True if none is left."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._worker is not None or any(self.status(model)[0] == LOADING for model in models):
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self):
+        return {
+            "budget": self.budget,
+            "warm": self.warm_set(),
+            "loaded": self.loaded(),
+            "preloads": self.preloads,
+            "unloads": self.unloads,
+        }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_residency_manager():
+    """Manager singleton over the shared, scheduled Ollama client."""
+    global _manager
+    from utils.ollama_client import get_client
+
+    with _manager_lock:
+        if _manager is None:
+            memory = host_memory_bytes()
+            budget = max(memory - int(MODEL_MEMORY_RESERVE_GB * GB), 0) if memory else None
+            _manager = ResidencyManager(get_client(), budget)
+        return _manager
+
+
+def keep_alive_for(model):
+    """keep_alive to send with a request for model (None leaves Ollama's default)."""
+    return get_residency_manager().keep_alive_for(model)
@@ -0,0 +1,150 @@
+"""Semantic cache of RAG answers, shared by all chat sessions.
+
+Answers are grouped by (index name, model, system prompt, conversation so
+far), so a follow-up question only reuses an answer given after the same
+earlier turns and summary. Each group is tagged with the index version, a
+hash of its on-disk signature. A lookup for a newer version drops the old
+group, so rebuilding or appending to an index invalidates its answers.
+Within a group, a question hits when its embedding has cosine similarity
+>= RESPONSE_CACHE_THRESHOLD with a cached question. Entries expire after
+RESPONSE_CACHE_TTL_S and the least recently used are evicted beyond
+RESPONSE_CACHE_MAX_ENTRIES.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from utils.index_cache import index_signature
+from utils.retrieval import normalize_query
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", "86400"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+
+def index_version(index_path):
+    return hashlib.sha256(repr(index_signature(index_path)).encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    def __init__(self, threshold, ttl, max_entries):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (index, model, prompt hash, history hash) -> {"version": str, "entries": OrderedDict}
+        self._groups = {}
+        # entry id -> group key, in LRU order across all groups
+        self._lru = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def group_key(index_name, model_name, system_prompt, history=()):
+        """history is the context sent before the question: {"role", "content"} dicts."""
+        history_hash = hashlib.sha256()
+        for message in history:
+            history_hash.update(f"{message['role']}\0{message['content']}\0".encode("utf-8"))
+        return (
+            index_name,
+            model_name,
+            hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+            history_hash.hexdigest(),
+        )
+
+    def _group(self, key, version):
+        group = self._groups.get(key)
+        if group is not None and group["version"] != version:
+            for entry_id in group["entries"]:
+                self._lru.pop(entry_id, None)
+            self.invalidations += 1
+            group = None
+        if group is None:
+            group = self._groups[key] = {"version": version, "entries": OrderedDict()}
+        return group
+
+    def _expire(self, group, now):
+        expired = [entry_id for entry_id, entry in group["entries"].items() if now - entry["created"] > self.ttl]
+        for entry_id in expired:
+            del group["entries"][entry_id]
+            self._lru.pop(entry_id, None)
+
+    def lookup(self, key, version, question_embedding):
+        """Cached answer for the closest question above threshold, or None."""
+        query = normalize_query(question_embedding)
+        now = time.time()
+        with self._lock:
+            group = self._group(key, version)
+            self._expire(group, now)
+            best_id, best_score = None, self.threshold
+            for entry_id, entry in group["entries"].items():
+                score = float(entry["embedding"] @ query)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                # Most conversations never repeat, so do not keep an empty group per history
+                if not group["entries"]:
+                    del self._groups[key]
+                return None
+            self.hits += 1
+            self._lru.move_to_end(best_id)
+            entry = group["entries"][best_id]
+            return entry["answer"]
+
+    def store(self, key, version, question_embedding, answer):
+        with self._lock:
+            group = self._group(key, version)
+            entry_id = self._next_id
+            self._next_id += 1
+            group["entries"][entry_id] = {
+                "embedding": normalize_query(question_embedding),
+                "answer": answer,
+                "created": time.time(),
+            }
+            self._lru[entry_id] = key
+            while len(self._lru) > self.max_entries:
+                evicted, evicted_key = self._lru.popitem(last=False)
+                evicted_group = self._groups[evicted_key]
+                evicted_group["entries"].pop(evicted, None)
+                if not evicted_group["entries"]:
+                    del self._groups[evicted_key]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+            self._lru.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "entries": len(self._lru),
+                "max_entries": self.max_entries,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(RESPONSE_CACHE_THRESHOLD, RESPONSE_CACHE_TTL_S, RESPONSE_CACHE_MAX_ENTRIES)
+        return _cache
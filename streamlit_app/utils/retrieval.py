@@ -0,0 +1,238 @@
+"""Vectorized exact top-k search over a pre-normalized embedding matrix."""
+import time
+import operator
+from collections import OrderedDict
+
+import numpy as np
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+)
+
+from utils.metrics import span
+
+# Rows scored per block when the matrix is not float32 (avoids a full upcast copy)
+BLOCK_ROWS = 65536
+MASK_CACHE_SIZE = 64
+
+
+def normalize_rows(matrix, dtype=None):
+    """Unit-length copy of matrix, computed blockwise in float32."""
+    dtype = np.dtype(dtype or matrix.dtype)
+    out = np.empty(matrix.shape, dtype=dtype)
+    for start in range(0, matrix.shape[0], BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + BLOCK_ROWS], dtype=np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        out[start:start + BLOCK_ROWS] = block / norms
+    return out
+
+
+def normalize_query(query):
+    query = np.asarray(query, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    return query / norm if norm else query
+
+
+class DenseTopK:
+    """Cosine top-k where every row of matrix is already unit length.
+
+    Scoring is one matrix-vector product (blockwise for float16) and
+    selection uses argpartition, so only the k winners are ever sorted.
+    """
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def scores(self, query):
+        query = normalize_query(query)
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ query
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = np.asarray(self.matrix[start:start + BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + BLOCK_ROWS] = block @ query
+        return scores
+
+    def search(self, query, k, mask=None):
+        """Return (rows, scores) of the k best rows allowed by the boolean mask."""
+        if len(self) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = self.scores(query)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        return top_k(scores, k)
+
+
+def top_k(scores, k):
+    k = min(k, scores.shape[0])
+    if k < scores.shape[0]:
+        rows = np.argpartition(scores, -k)[-k:]
+    else:
+        rows = np.arange(scores.shape[0])
+    rows = rows[np.argsort(-scores[rows], kind="stable")]
+    rows = rows[np.isfinite(scores[rows])]
+    return rows, scores[rows]
+
+
+def _text_match(value, target):
+    return isinstance(value, str) and str(target) in value
+
+
+def _in(value, target):
+    return value in target
+
+
+def _not_in(value, target):
+    return value not in target
+
+
+_OPERATORS = {
+    FilterOperator.EQ: operator.eq,
+    FilterOperator.NE: operator.ne,
+    FilterOperator.GT: operator.gt,
+    FilterOperator.GTE: operator.ge,
+    FilterOperator.LT: operator.lt,
+    FilterOperator.LTE: operator.le,
+    FilterOperator.IN: _in,
+    FilterOperator.NIN: _not_in,
+    FilterOperator.TEXT_MATCH: _text_match,
+}
+
+
+def flat_metadata(metadata):
+    """Scalar metadata fields that can be filtered on."""
+    return {
+        key: value
+        for key, value in (metadata or {}).items()
+        if not key.startswith("_") and isinstance(value, (str, int, float, bool))
+    }
+
+
+class MetadataColumns:
+    """Dictionary-encoded metadata columns with cached boolean filter masks.
+
+    Each key keeps its distinct values plus an int32 code per row (-1 when
+    the row lacks the key). A filter is evaluated once per distinct value
+    and expanded to a row mask by indexing, so masks cost O(rows) in NumPy
+    and repeated filters are served from an LRU cache.
+    """
+
+    def __init__(self, count=0, columns=None):
+        self.count = count
+        self._values = {}
+        self._codes = {}
+        self._positions = {}
+        for key, column in (columns or {}).items():
+            self._values[key] = list(column["values"])
+            self._codes[key] = np.asarray(column["codes"], dtype=np.int32)
+            self._positions[key] = {value: i for i, value in enumerate(self._values[key])}
+        self._masks = OrderedDict()
+
+    def append(self, rows):
+        rows = [flat_metadata(row) for row in rows]
+        keys = set(self._values).union(*[row.keys() for row in rows]) if rows else set()
+        for key in keys:
+            values = self._values.setdefault(key, [])
+            positions = self._positions.setdefault(key, {})
+            codes = []
+            for row in rows:
+                if key not in row:
+                    codes.append(-1)
+                    continue
+                value = row[key]
+                if value not in positions:
+                    positions[value] = len(values)
+                    values.append(value)
+                codes.append(positions[value])
+            existing = self._codes.get(key, np.full(self.count, -1, dtype=np.int32))
+            self._codes[key] = np.concatenate([existing, np.asarray(codes, dtype=np.int32)])
+        self.count += len(rows)
+        self._masks.clear()
+
+    def take(self, rows):
+        """Columns restricted to the given row positions (used when compacting)."""
+        taken = MetadataColumns(len(rows))
+        for key, codes in self._codes.items():
+            taken._values[key] = list(self._values[key])
+            taken._positions[key] = dict(self._positions[key])
+            taken._codes[key] = codes[rows]
+        return taken
+
+    def to_dict(self):
+        return {
+            key: {"values": self._values[key], "codes": self._codes[key].tolist()}
+            for key in self._codes
+        }
+
+    def mask(self, filters):
+        cache_key = repr(filters)
+        if cache_key in self._masks:
+            self._masks.move_to_end(cache_key)
+            return self._masks[cache_key]
+        mask = self._evaluate(filters)
+        self._masks[cache_key] = mask
+        if len(self._masks) > MASK_CACHE_SIZE:
+            self._masks.popitem(last=False)
+        return mask
+
+    def _evaluate(self, filters):
+        if isinstance(filters, MetadataFilter):
+            return self._evaluate_filter(filters)
+        masks = [self._evaluate(f) for f in filters.filters]
+        if not masks:
+            return np.ones(self.count, dtype=bool)
+        if filters.condition == FilterCondition.OR:
+            return np.logical_or.reduce(masks)
+        if filters.condition in (None, FilterCondition.AND):
+            return np.logical_and.reduce(masks)
+        raise ValueError(f"Unsupported metadata filter condition: {filters.condition}")
+
+    def _evaluate_filter(self, metadata_filter):
+        key, target = metadata_filter.key, metadata_filter.value
+        codes = self._codes.get(key)
+        if metadata_filter.operator == FilterOperator.IS_EMPTY:
+            if codes is None:
+                return np.ones(self.count, dtype=bool)
+            return codes < 0
+        compare = _OPERATORS.get(metadata_filter.operator)
+        if compare is None:
+            raise ValueError(f"Unsupported metadata filter operator: {metadata_filter.operator}")
+        if codes is None:
+            return np.zeros(self.count, dtype=bool)
+
+        allowed = []
+        for value in self._values[key]:
+            try:
+                allowed.append(bool(compare(value, target)))
+            except TypeError:
+                allowed.append(False)
+        # Extra trailing slot so code -1 (missing key) maps to False
+        allowed = np.asarray(allowed + [False], dtype=bool)
+        return allowed[codes]
+
+
+class TimedRetriever(BaseRetriever):
+    """Wraps a retriever with rag_query_embedding and rag_retrieval spans."""
+
+    def __init__(self, retriever, embed_model, index_name=None, model_name=None):
+        super().__init__()
+        self._retriever = retriever
+        self._embed_model = embed_model
+        self._labels = {"index": index_name, "model": model_name}
+        self.finished_at = None
+
+    def _retrieve(self, query_bundle):
+        if query_bundle.embedding is None:
+            with span("rag_query_embedding", **self._labels):
+                query_bundle.embedding = self._embed_model.get_query_embedding(query_bundle.query_str)
+        with span("rag_retrieval", **self._labels) as attrs:
+            nodes = self._retriever.retrieve(query_bundle)
+            attrs["nodes"] = len(nodes)
+        self.finished_at = time.perf_counter()
+        return nodes
@@ -0,0 +1,306 @@
+"""Process-wide admission control for Ollama requests.
+
+Every chat, generate and embedding call made through utils.ollama_client
+waits here for a slot. Streamlit serves each session on its own thread,
+so waiting is a blocking Condition wait rather than an asyncio queue.
+Admission rules, in order:
+  - at most SCHED_MAX_PER_MODEL requests run per model
+  - at most SCHED_MAX_MODELS models are busy at once; other models queue
+    until one drains, so Ollama doesn't swap models under load. Embedding
+    models (seen through embed calls) don't count: utils.residency keeps
+    them loaded next to the chat model, so a RAG query never waits for a
+    generation to finish
+  - higher priority first (interactive chat, then builds, then background);
+    while the best waiter is blocked, lower priorities are not admitted
+  - among equal priority, requests for a busy model first (grouping), then
+    the owner (session) with the fewest requests running, then FIFO
+A request that has waited SCHED_SWAP_AFTER_S for an idle model stops the
+busy model from taking new requests, so grouping cannot starve it.
+
+Index builds run in worker processes (utils.build_jobs) with schedulers of
+their own. While a process has interactive requests running or queued it
+writes its pid to SCHED_CHAT_MARKER; the other processes admit no build or
+background requests meanwhile, so chat still goes first across processes.
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SCHED_MAX_PER_MODEL = int(os.getenv("SCHED_MAX_PER_MODEL", "2"))
+SCHED_MAX_MODELS = int(os.getenv("SCHED_MAX_MODELS", "1"))
+SCHED_SWAP_AFTER_S = float(os.getenv("SCHED_SWAP_AFTER_S", "10"))
+# Shared by the app and build workers; empty disables cross-process priority
+SCHED_CHAT_MARKER = os.getenv("SCHED_CHAT_MARKER", os.path.join("Indexes", ".chat_active"))
+# How often a held-back request re-reads another process's marker
+MARKER_POLL_S = 0.25
+# Wait times kept per model for the percentile metrics
+WAIT_SAMPLES = 512
+
+INTERACTIVE = 0
+BUILD = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BUILD: "build", BACKGROUND: "background"}
+
+_priority = contextvars.ContextVar("ollama_priority", default=INTERACTIVE)
+_owner = contextvars.ContextVar("ollama_owner", default=None)
+
+
+@contextmanager
+def request_context(priority=None, owner=None):
+    """Tag Ollama calls made in this block (on this thread) with a priority and owner."""
+    tokens = []
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    if owner is not None:
+        tokens.append((_owner, _owner.set(owner)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("model", "priority", "owner", "enqueued", "seq")
+
+    def __init__(self, model, priority, owner, seq):
+        self.model = model
+        self.priority = priority
+        self.owner = owner
+        self.enqueued = time.monotonic()
+        self.seq = seq
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Scheduler:
+    def __init__(self, max_per_model, max_models, swap_after, chat_marker=None):
+        self.max_per_model = max_per_model
+        self.max_models = max_models
+        self.swap_after = swap_after
+        self.chat_marker = chat_marker
+        self._interactive = 0  # interactive requests queued or running here
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._running = defaultdict(int)        # model -> running requests
+        self._owner_running = defaultdict(int)  # owner -> running requests
+        self._seq = 0
+        self._waits = defaultdict(lambda: deque(maxlen=WAIT_SAMPLES))
+        self._admitted = defaultdict(int)
+        self._swaps = 0
+        self._last_model = None
+        self._embedding_models = set()
+
+    def _can_run(self, model):
+        if self._running[model] >= self.max_per_model:
+            return False
+        if model in self._embedding_models:
+            return True
+        busy = [m for m, count in self._running.items() if count and m not in self._embedding_models]
+        return model in busy or len(busy) < self.max_models
+
+    def _set_chat_marker(self, active):
+        """Publish (or withdraw) this process's interactive requests to the other processes."""
+        try:
+            if active:
+                os.makedirs(os.path.dirname(self.chat_marker) or ".", exist_ok=True)
+                tmp_path = f"{self.chat_marker}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(str(os.getpid()))
+                os.replace(tmp_path, self.chat_marker)
+            elif self._chat_marker_pid() == os.getpid():
+                os.remove(self.chat_marker)
+        except OSError as e:
+            logger.debug(f"Could not update {self.chat_marker}: {e}")
+
+    def _chat_marker_pid(self):
+        try:
+            with open(self.chat_marker, "r") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return None
+
+    def _chat_elsewhere(self):
+        """Whether another live process has interactive requests running or queued."""
+        if not self.chat_marker:
+            return False
+        pid = self._chat_marker_pid()
+        return bool(pid) and pid != os.getpid() and _pid_alive(pid)
+
+    def _track_interactive(self, waiter, delta):
+        if waiter.priority != INTERACTIVE or not self.chat_marker:
+            return
+        self._interactive += delta
+        if self._interactive == (1 if delta > 0 else 0):
+            self._set_chat_marker(self._interactive > 0)
+
+    def _next(self, now, waiters):
+        """The waiter to admit now among waiters, or None."""
+        busy = {m for m, count in self._running.items() if count}
+        starving = [
+            w for w in waiters
+            if w.model not in busy and w.model not in self._embedding_models and now - w.enqueued >= self.swap_after
+        ]
+        if starving:
+            # Let the busy models drain; only the oldest starving request may start
+            oldest = min(starving, key=lambda w: (w.priority, w.seq))
+            if self._can_run(oldest.model):
+                return oldest
+            # Embedding requests take no model slot, so they need not wait for the drain
+            embeds = [
+                w for w in waiters
+                if w.model in self._embedding_models and w.priority <= oldest.priority and self._can_run(w.model)
+            ]
+            return min(embeds, key=lambda w: (w.priority, w.seq)) if embeds else None
+        if not waiters:
+            return None
+
+        def rank(w):
+            return (w.priority, w.model not in busy, self._owner_running[w.owner], w.seq)
+
+        best = min(waiters, key=rank)
+        if self._can_run(best.model):
+            return best
+        # Nothing of lower priority jumps ahead, so busy models drain for e.g. a chat waiting on a build
+        candidates = [w for w in waiters if w.priority <= best.priority and self._can_run(w.model)]
+        return min(candidates, key=rank) if candidates else None
+
+    def acquire(self, model, priority=None, owner=None, embedding=False):
+        priority = _priority.get() if priority is None else priority
+        owner = _owner.get() if owner is None else owner
+        with self._cond:
+            if embedding:
+                self._embedding_models.add(model)
+            self._seq += 1
+            waiter = _Waiter(model, priority, owner, self._seq)
+            self._waiters.append(waiter)
+            self._track_interactive(waiter, 1)
+            try:
+                while True:
+                    held = self._chat_elsewhere()
+                    # Chat in another process holds back everything but this process's chat
+                    waiters = [w for w in self._waiters if w.priority == INTERACTIVE] if held else self._waiters
+                    if self._next(time.monotonic(), waiters) is waiter:
+                        break
+                    # Wake up periodically so the starvation rule kicks in without a release
+                    self._cond.wait(timeout=MARKER_POLL_S if held else self.swap_after / 2 or None)
+            except BaseException:
+                self._waiters.remove(waiter)
+                self._track_interactive(waiter, -1)
+                self._cond.notify_all()
+                raise
+            self._waiters.remove(waiter)
+            self._running[model] += 1
+            self._owner_running[owner] += 1
+            self._admitted[model] += 1
+            if model not in self._embedding_models:
+                if self._last_model is not None and self._last_model != model and self._running[model] == 1:
+                    self._swaps += 1
+                self._last_model = model
+            self._waits[model].append(time.monotonic() - waiter.enqueued)
+            # Another waiter may be admissible too (free slots on the same model)
+            self._cond.notify_all()
+        return waiter
+
+    def release(self, waiter):
+        with self._cond:
+            self._running[waiter.model] -= 1
+            self._owner_running[waiter.owner] -= 1
+            if not self._owner_running[waiter.owner]:
+                del self._owner_running[waiter.owner]
+            self._track_interactive(waiter, -1)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, model, priority=None, owner=None, embedding=False):
+        waiter = self.acquire(model, priority, owner, embedding)
+        try:
+            yield
+        finally:
+            self.release(waiter)
+
+    def stats(self):
+        with self._cond:
+            models = set(self._running) | set(self._admitted) | {w.model for w in self._waiters}
+            per_model = {}
+            for model in sorted(models):
+                waits = sorted(self._waits[model])
+                per_model[model] = {
+                    "running": self._running[model],
+                    "queued": sum(1 for w in self._waiters if w.model == model),
+                    "admitted": self._admitted[model],
+                    "wait_avg_s": sum(waits) / len(waits) if waits else 0.0,
+                    "wait_p95_s": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                }
+            queued_by_priority = defaultdict(int)
+            for w in self._waiters:
+                queued_by_priority[PRIORITY_NAMES.get(w.priority, str(w.priority))] += 1
+            return {
+                "queued": len(self._waiters),
+                "running": sum(self._running.values()),
+                "queued_by_priority": dict(queued_by_priority),
+                "model_swaps": self._swaps,
+                "models": per_model,
+            }
+
+
+class ScheduledStream:
+    """Iterator over a streamed response that holds its slot until exhausted or closed.
+
+    A class rather than a generator, so a stream dropped before its first
+    chunk still gives the slot back when it is garbage collected.
+    """
+
+    def __init__(self, scheduler, waiter, stream):
+        self._scheduler = scheduler
+        self._waiter = waiter
+        self._stream = iter(stream)
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._stream)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        close = getattr(self._stream, "close", None)
+        if close:
+            close()
+        self._scheduler.release(self._waiter)
+
+    def __del__(self):
+        self.close()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(SCHED_MAX_PER_MODEL, SCHED_MAX_MODELS, SCHED_SWAP_AFTER_S, SCHED_CHAT_MARKER)
+        return _scheduler
@@ -0,0 +1,66 @@
+"""Static assets cached per process and timing of page script runs.
+
+Streamlit re-executes a page script on every interaction, but module state
+lives as long as the server process, so:
+  - cached_image(path) opens an image once and re-opens it only when the
+    file's mtime changes (the same rule as utils.model_catalog)
+  - PageRun times one execution of a page. The first run of each page in
+    the process pays for its imports and is recorded as
+    page_<name>_cold_seconds; later runs as page_<name>_rerun_seconds.
+    Time spent inside paused(), such as waiting for a streamed answer, is
+    left out, so the numbers show the page's own overhead.
+Both metrics appear on the Metrics page; benchmarks/startup.py measures
+the same in fresh processes.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+_images = {}  # path -> (mtime_ns, image)
+_seen_pages = set()
+_lock = threading.Lock()
+
+
+def cached_image(path):
+    """PIL image at path, read once per process and again when the file changes."""
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        cached = _images.get(path)
+        if cached is None or cached[0] != mtime:
+            from PIL import Image
+
+            image = Image.open(path)
+            # Decode now so the file is closed and sessions share finished pixels
+            image.load()
+            cached = _images[path] = (mtime, image)
+        return cached[1]
+
+
+class PageRun:
+    """Times one execution of page; create it before the page's other imports."""
+
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.excluded = 0.0
+        with _lock:
+            self.cold = page not in _seen_pages
+            _seen_pages.add(page)
+
+    @contextmanager
+    def paused(self):
+        """Leave the time spent in this block out of the run."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.excluded += time.perf_counter() - start
+
+    def finish(self):
+        """Record the run; returns its seconds."""
+        from utils.metrics import observe
+
+        seconds = time.perf_counter() - self.started - self.excluded
+        observe(f"page_{self.page}_{'cold' if self.cold else 'rerun'}_seconds", seconds)
+        return seconds
@@ -0,0 +1,101 @@
+"""Incremental rendering of streamed chat answers.
+
+Re-rendering the whole answer on every flush makes markdown work and
+websocket payload grow quadratically with answer length. StreamRenderer
+instead:
+  - flushes on a time budget (STREAM_FLUSH_MS), stretched up to
+    STREAM_FLUSH_MAX_MS when rendering itself gets slow
+  - freezes completed markdown blocks (text up to a blank line outside a
+    code fence) into their own elements, so a flush only re-sends the
+    block still being written
+Once the stream ends the answer is rendered once more as a single element,
+so the final markdown is exactly what the chat history shows on rerun.
+"""
+import os
+import time
+
+import streamlit as st
+
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "100"))
+STREAM_FLUSH_MAX_MS = float(os.getenv("STREAM_FLUSH_MAX_MS", "1000"))
+# Render cost is kept below roughly 1/RENDER_BUDGET_FACTOR of streaming time
+RENDER_BUDGET_FACTOR = 10
+FENCES = ("```", "~~~")
+
+
+def last_block_boundary(text, in_fence=False):
+    """(end of the last complete markdown block in text, fence state there).
+
+    A block ends at a blank line outside a fenced code block; 0 if none.
+    """
+    boundary, boundary_fence = 0, in_fence
+    position = 0
+    for line in text.splitlines(keepends=True):
+        if not line.endswith("\n"):
+            break  # unfinished last line
+        position += len(line)
+        stripped = line.strip()
+        if stripped.startswith(FENCES):
+            in_fence = not in_fence
+        elif not stripped and not in_fence:
+            boundary, boundary_fence = position, in_fence
+    return boundary, boundary_fence
+
+
+class StreamRenderer:
+    def __init__(self, flush_ms=STREAM_FLUSH_MS, max_flush_ms=STREAM_FLUSH_MAX_MS):
+        self.flush_interval = flush_ms / 1000
+        self.min_interval = flush_ms / 1000
+        self.max_interval = max_flush_ms / 1000
+        self.text = ""
+        self.flushes = 0
+        self.render_seconds = 0.0
+        self.bytes_sent = 0
+        self._frozen = 0          # length of text already frozen into elements
+        self._in_fence = False    # fence state at self._frozen
+        self._rendered_tail = ""
+        self._holder = st.empty()
+        self._blocks = self._holder.container()
+        self._tail = self._blocks.empty()
+        self._last_flush = time.perf_counter()
+
+    def write(self, chunk):
+        self.text += chunk
+        if time.perf_counter() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        start = time.perf_counter()
+        pending = self.text[self._frozen:]
+        boundary, in_fence = last_block_boundary(pending, self._in_fence)
+        if boundary:
+            # The tail element becomes a finished block; later flushes go to a fresh one
+            self._render(self._tail, pending[:boundary])
+            self._frozen += boundary
+            self._in_fence = in_fence
+            self._tail = self._blocks.empty()
+            self._rendered_tail = ""
+            pending = pending[boundary:]
+        if pending and pending != self._rendered_tail:
+            self._render(self._tail, pending)
+            self._rendered_tail = pending
+        elapsed = time.perf_counter() - start
+        self.render_seconds += elapsed
+        self.flushes += 1
+        self.flush_interval = min(max(self.min_interval, elapsed * RENDER_BUDGET_FACTOR), self.max_interval)
+        self._last_flush = time.perf_counter()
+
+    def _render(self, element, text):
+        element.markdown(text)
+        self.bytes_sent += len(text.encode("utf-8"))
+
+    def finish(self):
+        """Render the full answer as one element and return its text."""
+        start = time.perf_counter()
+        if self.text:
+            self._render(self._holder, self.text)
+        self.render_seconds += time.perf_counter() - start
+        return self.text
+
+    def stats(self):
+        return {"flushes": self.flushes, "bytes_sent": self.bytes_sent, "chars": len(self.text)}
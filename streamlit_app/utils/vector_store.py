@@ -0,0 +1,491 @@
+"""Binary, memory-mapped vector store for persisted RAG indexes.
+
+Layout inside Indexes/<name>/:
+    vectors.npy       contiguous (count, dim) float32 or float16 matrix
+    vector_ids.json   node ids plus a deduplicated table of ref doc ids
+    metadata.json     "vector_store" entry with format, version, dtype and shape
+
+vectors.npy is opened with mmap_mode="r", so loading is zero-copy and every
+Streamlit process serving the same index shares the page cache.
+Optional IVF lists (utils.ann) or compressed int8/PQ codes (utils.quantize)
+are written next to it, and BM25 postings (utils.lexical) for hybrid queries.
+
+Convert an existing JSON index with:
+    python -m utils.vector_store Indexes/<name> [--float16] [--keep-json]
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.storage import StorageContext
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+from utils.index_meta import read_index_metadata, update_index_metadata
+from utils.docstore import SqliteDocumentStore, is_sqlite_docstore
+from utils.retrieval import DenseTopK, MetadataColumns, normalize_rows, top_k
+from utils.ann import DEFAULT_NPROBE, IVFFlatIndex, build_with_recall, remove_ann_files
+from utils.quantize import RERANK_FACTOR, build_with_report, load_codes, remove_quant_files, save_codes
+from utils.quantize import search as quantized_search
+from utils.lexical import BM25Index, fuse, remove_lexical_files, tokenize
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORE_FORMAT = "mmap"
+# 2: rows are stored unit-normalized and the sidecar carries metadata columns
+VECTOR_STORE_VERSION = 2
+VECTORS_FNAME = "vectors.npy"
+VECTOR_IDS_FNAME = "vector_ids.json"
+JSON_VECTOR_STORE_FNAME = "default__vector_store.json"
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def _atomic_write(path, write):
+    # Readers keep their mapping of the old inode until they reopen the file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """Vector store over a unit-normalized (count, dim) matrix.
+
+    Persisted indexes are memory-mapped; JSON indexes can be loaded into the
+    same in-memory representation with from_json() so queries always go
+    through the vectorized DenseTopK engine.
+    """
+
+    stores_text: bool = False
+    dtype: str = "float32"
+    # {"nlist": int or None, "nprobe": int}; set to build an IVF index on persist
+    ann_params: Optional[dict] = None
+    # {"kind": "int8" or "pq", "m": int or None, "rerank": int}; set to write compressed codes on persist
+    quantization: Optional[dict] = None
+    # Keep BM25 postings of the node text for hybrid queries
+    lexical: bool = False
+
+    _matrix: Any = PrivateAttr(default=None)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[Any] = PrivateAttr(default_factory=list)
+    _metadata: Any = PrivateAttr(default_factory=MetadataColumns)
+    _pending: List[Any] = PrivateAttr(default_factory=list)
+    _pending_metadata: List[Any] = PrivateAttr(default_factory=list)
+    _deleted: set = PrivateAttr(default_factory=set)
+    _engine: Any = PrivateAttr(default=None)
+    _alive: Any = PrivateAttr(default=None)
+    _ann: Any = PrivateAttr(default=None)
+    _quant: Any = PrivateAttr(default=None)
+    _lexical: Any = PrivateAttr(default=None)
+    _pending_terms: List[Any] = PrivateAttr(default_factory=list)
+
+    def __init__(self, dtype="float32", ann_params=None, quantization=None, lexical=False, **kwargs):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        if ann_params and quantization:
+            raise ValueError("An index uses either an ANN index or quantized vectors, not both")
+        super().__init__(dtype=dtype, ann_params=ann_params, quantization=quantization, lexical=lexical, **kwargs)
+
+    @classmethod
+    def from_persist_dir(cls, index_path):
+        index_meta = read_index_metadata(index_path)
+        meta = index_meta.get("vector_store", {})
+        if meta.get("version", VECTOR_STORE_VERSION) > VECTOR_STORE_VERSION:
+            raise ValueError(f"Vector store in {index_path} was written by a newer version")
+        store = cls(dtype=meta.get("dtype", "float32"))
+        matrix = np.load(os.path.join(index_path, VECTORS_FNAME), mmap_mode="r")
+        # Version 1 files hold raw embeddings; normalize once in memory
+        store._matrix = matrix if meta.get("normalized") else normalize_rows(matrix)
+        with open(os.path.join(index_path, VECTOR_IDS_FNAME), "r") as f:
+            sidecar = json.load(f)
+        docs = sidecar["docs"]
+        store._ids = sidecar["ids"]
+        store._ref_doc_ids = [docs[i] if i >= 0 else None for i in sidecar["doc_index"]]
+        store._metadata = MetadataColumns(len(store._ids), sidecar.get("metadata"))
+
+        ann_meta = index_meta.get("ann")
+        if ann_meta:
+            nprobe = ann_meta.get("nprobe", DEFAULT_NPROBE)
+            store.ann_params = {"nlist": ann_meta.get("nlist"), "nprobe": nprobe}
+            store._ann = IVFFlatIndex.load(index_path, nprobe=nprobe)
+
+        quant_meta = index_meta.get("quantization")
+        if quant_meta:
+            store.quantization = {
+                "kind": quant_meta["kind"],
+                "m": quant_meta.get("m"),
+                "rerank": quant_meta.get("rerank", RERANK_FACTOR),
+            }
+            store._quant = load_codes(index_path)
+
+        if index_meta.get("lexical"):
+            store.lexical = True
+            store._lexical = BM25Index.load(index_path)
+        return store
+
+    @classmethod
+    def from_arrays(cls, matrix, ids, ref_doc_ids=None, metadata=None, dtype="float32"):
+        """In-memory store over raw embeddings (one row per id)."""
+        store = cls(dtype=dtype)
+        store._matrix = normalize_rows(matrix, dtype)
+        store._ids = list(ids)
+        store._ref_doc_ids = list(ref_doc_ids) if ref_doc_ids is not None else [None] * len(store._ids)
+        store._metadata.append(metadata if metadata is not None else [{}] * len(store._ids))
+        return store
+
+    @classmethod
+    def from_json(cls, json_path, dtype="float32"):
+        """Load a SimpleVectorStore JSON file into an in-memory store."""
+        with open(json_path, "r") as f:
+            data = json.load(f)
+        text_id_to_ref_doc_id = data.get("text_id_to_ref_doc_id", {})
+        metadata_dict = data.get("metadata_dict", {})
+        store = cls(dtype=dtype)
+        for node_id, embedding in data.get("embedding_dict", {}).items():
+            store._pending.append(embedding)
+            store._pending_metadata.append(metadata_dict.get(node_id, {}))
+            store._ids.append(node_id)
+            store._ref_doc_ids.append(text_id_to_ref_doc_id.get(node_id))
+        return store
+
+    @classmethod
+    def class_name(cls):
+        return "MmapVectorStore"
+
+    @property
+    def client(self):
+        return None
+
+    @property
+    def count(self):
+        # Deliberately not __len__: StorageContext.from_defaults tests the store's truthiness
+        return len(self._ids) - len(self._deleted)
+
+    @property
+    def dim(self):
+        matrix = self._rows()
+        return matrix.shape[1] if matrix is not None else 0
+
+    def _rows(self):
+        """Full normalized matrix including vectors added since the last persist."""
+        if self._pending:
+            pending = normalize_rows(np.asarray(self._pending, dtype=np.float32), self.dtype)
+            self._matrix = pending if self._matrix is None else np.concatenate([self._matrix, pending])
+            self._metadata.append(self._pending_metadata)
+            self._pending = []
+            self._pending_metadata = []
+            self._engine = None
+        return self._matrix
+
+    def _search_engine(self):
+        matrix = self._rows()
+        if self._engine is None and matrix is not None:
+            self._engine = DenseTopK(matrix)
+        return self._engine
+
+    def _alive_mask(self):
+        if self._alive is None or self._alive.shape[0] != len(self._ids):
+            self._alive = np.ones(len(self._ids), dtype=bool)
+            if self._deleted:
+                self._alive[list(self._deleted)] = False
+        return self._alive
+
+    def _lexical_index(self):
+        """BM25 postings including nodes added since the last persist, or None if rows lack postings."""
+        if self._pending_terms:
+            self._lexical = (self._lexical or BM25Index.empty()).extend(self._pending_terms)
+            self._pending_terms = []
+        if self._lexical is None or self._lexical.count != len(self._ids):
+            return None
+        return self._lexical
+
+    @property
+    def has_lexical(self):
+        return self.lexical and self._lexical_index() is not None
+
+    def row_index(self):
+        """{node id: row} of the live rows."""
+        return {node_id: row for row, node_id in enumerate(self._ids) if row not in self._deleted}
+
+    def embeddings(self, node_ids, row_index=None):
+        """Unit-length float32 vectors of the given (not deleted) node ids, in order.
+
+        Building row_index() scans every row; callers fetching many batches
+        should build it once and pass it in.
+        """
+        rows = self.row_index() if row_index is None else row_index
+        return np.asarray(self._rows()[[rows[node_id] for node_id in node_ids]], dtype=np.float32)
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        for node in nodes:
+            self._pending.append(node.get_embedding())
+            self._pending_metadata.append(node.metadata)
+            self._ids.append(node.node_id)
+            self._ref_doc_ids.append(node.ref_doc_id)
+            if self.lexical:
+                self._pending_terms.append(tokenize(node.get_content(metadata_mode=MetadataMode.NONE)))
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        for row, ref in enumerate(self._ref_doc_ids):
+            if ref == ref_doc_id:
+                self._deleted.add(row)
+        self._alive = None
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        engine = self._search_engine()
+        if engine is None or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+
+        mask = self._alive_mask() if self._deleted else None
+        restrictions = []
+        if query.filters is not None:
+            restrictions.append(self._metadata.mask(query.filters))
+        if query.doc_ids is not None:
+            wanted = set(query.doc_ids)
+            restrictions.append(np.fromiter((ref in wanted for ref in self._ref_doc_ids), bool, len(self._ids)))
+        if query.node_ids is not None:
+            wanted = set(query.node_ids)
+            restrictions.append(np.fromiter((node_id in wanted for node_id in self._ids), bool, len(self._ids)))
+        for restriction in restrictions:
+            mask = restriction if mask is None else mask & restriction
+
+        if query.mode == VectorStoreQueryMode.SPARSE:
+            # BM25 ranking alone, for callers that fuse it with dense results from other indexes
+            lexical = self._lexical_index() if query.query_str else None
+            if lexical is None:
+                return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+            rows, scores = lexical.search(query.query_str, query.sparse_top_k or query.similarity_top_k, mask)
+            return VectorStoreQueryResult(
+                nodes=None,
+                similarities=scores.tolist(),
+                ids=[self._ids[row] for row in rows],
+            )
+
+        rows, scores = self._dense_search(query.query_embedding, query.similarity_top_k, mask)
+        lexical = self._lexical_index() if query.mode == VectorStoreQueryMode.HYBRID and query.query_str else None
+        if lexical is not None:
+            lexical_rows, _ = lexical.search(query.query_str, query.sparse_top_k or query.similarity_top_k, mask)
+            rows, scores = fuse(
+                rows, lexical_rows, query.hybrid_top_k or query.similarity_top_k,
+                **({"alpha": query.alpha} if query.alpha is not None else {}),
+            )
+        return VectorStoreQueryResult(
+            nodes=None,
+            similarities=scores.tolist(),
+            ids=[self._ids[row] for row in rows],
+        )
+
+    def _dense_search(self, query_embedding, k, mask):
+        if self._ann is not None:
+            return self._ann_search(query_embedding, k, mask)
+        if self._quant is not None:
+            return self._quantized_search(query_embedding, k, mask)
+        return self._search_engine().search(query_embedding, k, mask)
+
+    def _ann_search(self, query_embedding, k, mask):
+        """IVF search over indexed rows plus an exact scan of rows appended since."""
+        matrix = self._rows()
+        covered = self._ann.count
+        rows, scores = self._ann.search(matrix, query_embedding, k, None if mask is None else mask[:covered])
+        if matrix.shape[0] > covered:
+            tail_mask = None if mask is None else mask[covered:]
+            tail_rows, tail_scores = DenseTopK(matrix[covered:]).search(query_embedding, k, tail_mask)
+            rows = np.concatenate([rows, tail_rows + covered])
+            scores = np.concatenate([scores, tail_scores])
+            best, scores = top_k(scores, k)
+            rows = rows[best]
+        return rows, scores
+
+    def _quantized_search(self, query_embedding, k, mask):
+        """First pass over the codes, exact re-ranking, plus an exact scan of rows appended since."""
+        matrix = self._rows()
+        covered = self._quant.count
+        rows, scores = quantized_search(
+            self._quant, matrix, query_embedding, k,
+            None if mask is None else mask[:covered],
+            rerank=self.quantization.get("rerank", RERANK_FACTOR),
+        )
+        if matrix.shape[0] > covered:
+            tail_mask = None if mask is None else mask[covered:]
+            tail_rows, tail_scores = DenseTopK(matrix[covered:]).search(query_embedding, k, tail_mask)
+            rows = np.concatenate([rows, tail_rows + covered])
+            scores = np.concatenate([scores, tail_scores])
+            best, scores = top_k(scores, k)
+            rows = rows[best]
+        return rows, scores
+
+    def persist(self, persist_path: str, fs: Any = None) -> None:
+        # StorageContext passes <dir>/default__vector_store.json; the binary files live next to it
+        index_path = os.path.dirname(persist_path)
+        os.makedirs(index_path, exist_ok=True)
+        matrix = self._rows()
+        keep = [row for row in range(len(self._ids)) if row not in self._deleted]
+        metadata = self._metadata
+        if matrix is None:
+            matrix = np.zeros((0, 0), dtype=self.dtype)
+        elif self._deleted:
+            matrix = matrix[keep]
+            metadata = metadata.take(keep)
+        matrix = np.ascontiguousarray(matrix, dtype=self.dtype)
+        ids = [self._ids[row] for row in keep]
+        refs = [self._ref_doc_ids[row] for row in keep]
+
+        docs = sorted({ref for ref in refs if ref is not None})
+        doc_pos = {ref: i for i, ref in enumerate(docs)}
+        sidecar = {
+            "ids": ids,
+            "docs": docs,
+            "doc_index": [doc_pos[ref] if ref is not None else -1 for ref in refs],
+            "metadata": metadata.to_dict(),
+        }
+        _atomic_write(os.path.join(index_path, VECTORS_FNAME), lambda f: np.save(f, matrix))
+        _atomic_write(
+            os.path.join(index_path, VECTOR_IDS_FNAME),
+            lambda f: f.write(json.dumps(sidecar, separators=(",", ":")).encode("utf-8")),
+        )
+        update_index_metadata(
+            index_path,
+            vector_store={
+                "format": VECTOR_STORE_FORMAT,
+                "version": VECTOR_STORE_VERSION,
+                "dtype": self.dtype,
+                "normalized": True,
+                "count": int(matrix.shape[0]),
+                "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            },
+        )
+
+        # Drop the in-memory copy and map the file we just wrote
+        self._matrix = np.load(os.path.join(index_path, VECTORS_FNAME), mmap_mode="r")
+        self._persist_ann(index_path)
+        self._persist_quantization(index_path)
+        self._persist_lexical(index_path, keep)
+        self._ids, self._ref_doc_ids = ids, refs
+        self._metadata = metadata
+        self._deleted = set()
+        self._alive = None
+        self._engine = None
+
+    def _persist_ann(self, index_path):
+        # Row numbers change on compaction, so the IVF lists are rebuilt on every persist
+        if not self.ann_params or self._matrix.shape[0] == 0:
+            self._ann = None
+            remove_ann_files(index_path)
+            update_index_metadata(index_path, ann=None)
+            return
+        self._ann, report = build_with_recall(
+            self._matrix,
+            nlist=self.ann_params.get("nlist"),
+            nprobe=self.ann_params.get("nprobe", DEFAULT_NPROBE),
+        )
+        self._ann.save(index_path)
+        update_index_metadata(index_path, ann=report)
+        logger.info(f"IVF index for {index_path}: recall@12 {report['recall_at_12']:.3f}")
+
+    def _persist_quantization(self, index_path):
+        # Codes follow the compacted row order, so they are re-encoded on every persist
+        if not self.quantization or self._matrix.shape[0] == 0:
+            self._quant = None
+            remove_quant_files(index_path)
+            update_index_metadata(index_path, quantization=None)
+            return
+        self._quant, report = build_with_report(
+            self._matrix,
+            self.quantization["kind"],
+            pq_m=self.quantization.get("m"),
+            rerank=self.quantization.get("rerank", RERANK_FACTOR),
+        )
+        save_codes(self._quant, index_path)
+        update_index_metadata(index_path, quantization=report)
+        logger.info(
+            f"{report['kind']} codes for {index_path}: {report['memory_saved']:.0%} less vector memory, "
+            f"recall@12 {report['recall_at_12']:.3f}"
+        )
+
+    def _persist_lexical(self, index_path, keep):
+        # Appended rows are merged into the postings and deleted rows dropped; nothing is re-tokenized
+        lexical = self._lexical_index() if self.lexical else None
+        if lexical is None:
+            if self.lexical and self._ids:
+                logger.warning(
+                    f"{index_path} has rows without BM25 postings; run python -m utils.lexical {index_path}"
+                )
+            self._lexical = None
+            remove_lexical_files(index_path)
+            update_index_metadata(index_path, lexical=None)
+            return
+        if self._deleted:
+            lexical = lexical.take(keep)
+        lexical.save(index_path)
+        self._lexical = BM25Index.load(index_path)
+        report = lexical.report()
+        update_index_metadata(index_path, lexical=report)
+        logger.info(f"BM25 postings for {index_path}: {report['terms']} terms, {report['postings']} postings")
+
+
+def is_mmap_index(index_path):
+    return read_index_metadata(index_path).get("vector_store", {}).get("format") == VECTOR_STORE_FORMAT
+
+
+def storage_context_for(index_path, read_only=False):
+    """StorageContext for a persisted index, whichever vector store format it uses.
+
+    With read_only=True, legacy JSON indexes are also served by the vectorized
+    store; persisting such a context would rewrite the index in mmap format.
+    Indexes with a SQLite docstore keep node text on disk (see utils.docstore).
+    """
+    docstore = SqliteDocumentStore.for_index(index_path, read_only=read_only) if is_sqlite_docstore(index_path) else None
+    if is_mmap_index(index_path):
+        vector_store = MmapVectorStore.from_persist_dir(index_path)
+    elif read_only:
+        vector_store = MmapVectorStore.from_json(os.path.join(index_path, JSON_VECTOR_STORE_FNAME))
+    else:
+        return StorageContext.from_defaults(persist_dir=index_path, docstore=docstore)
+    return StorageContext.from_defaults(persist_dir=index_path, vector_store=vector_store, docstore=docstore)
+
+
+def convert_json_index(index_path, dtype="float32", keep_json=False):
+    """One-shot conversion of default__vector_store.json into the mmap format."""
+    json_path = os.path.join(index_path, JSON_VECTOR_STORE_FNAME)
+    store = MmapVectorStore.from_json(json_path, dtype=dtype)
+    store.persist(json_path)
+    if not keep_json:
+        os.remove(json_path)
+    return store.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert JSON vector stores to the mmap format.")
+    parser.add_argument("index_paths", nargs="+", help="Index directories, e.g. Indexes/_L4T_README")
+    parser.add_argument("--float16", action="store_true", help="Store vectors at half precision")
+    parser.add_argument("--keep-json", action="store_true", help="Keep default__vector_store.json")
+    args = parser.parse_args(argv)
+
+    for index_path in args.index_paths:
+        if is_mmap_index(index_path):
+            print(f"{index_path}: already converted")
+            continue
+        count = convert_json_index(
+            index_path,
+            dtype="float16" if args.float16 else "float32",
+            keep_json=args.keep_json,
+        )
+        print(f"{index_path}: converted {count} vectors")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Concurrent web page fetching with a conditional-request cache.
+
+All fetches share one pooled requests.Session. WEB_FETCH_CONCURRENCY pages
+are fetched at once, with at most WEB_FETCH_PER_HOST going to the same
+host. Each page's ETag / Last-Modified and its extracted text are kept in
+WEB_CACHE_DIR. Re-indexing a page that has not changed then costs a 304
+and no HTML conversion.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+WEB_CACHE_DIR = os.getenv("WEB_CACHE_DIR", os.path.join("Indexes", ".web_cache"))
+WEB_FETCH_CONCURRENCY = int(os.getenv("WEB_FETCH_CONCURRENCY", "8"))
+WEB_FETCH_PER_HOST = int(os.getenv("WEB_FETCH_PER_HOST", "2"))
+WEB_FETCH_TIMEOUT = float(os.getenv("WEB_FETCH_TIMEOUT", "20"))
+
+FETCHED = "fetched"
+NOT_MODIFIED = "not_modified"
+
+# status is FETCHED or NOT_MODIFIED on success; text is None and error set on failure
+FetchResult = namedtuple("FetchResult", ["url", "text", "status", "seconds", "error"])
+
+
+def html_to_text(html):
+    # Same conversion SimpleWebPageReader(html_to_text=True) applies
+    import html2text
+
+    return html2text.html2text(html)
+
+
+class PageCache:
+    """One JSON file per URL holding its validators and extracted text."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url):
+        try:
+            with open(self._path(url), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def put(self, url, etag, last_modified, text):
+        path = self._path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"url": url, "etag": etag, "last_modified": last_modified, "text": text}, f)
+        os.replace(tmp_path, path)
+
+
+class WebFetcher:
+    def __init__(
+        self,
+        cache=None,
+        concurrency=WEB_FETCH_CONCURRENCY,
+        per_host=WEB_FETCH_PER_HOST,
+        timeout=WEB_FETCH_TIMEOUT,
+    ):
+        self.cache = cache
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            return self._host_slots.setdefault(host, threading.BoundedSemaphore(self.per_host))
+
+    def fetch(self, url):
+        start = time.perf_counter()
+        try:
+            text, status = self._fetch(url)
+        except Exception as e:
+            logger.warning(f"Failed to fetch {url}: {e}")
+            return FetchResult(url, None, None, time.perf_counter() - start, e)
+        return FetchResult(url, text, status, time.perf_counter() - start, None)
+
+    def _fetch(self, url):
+        cached = self.cache.get(url) if self.cache else None
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        with self._slot(url):
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            return cached["text"], NOT_MODIFIED
+        response.raise_for_status()
+        text = html_to_text(response.text)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if self.cache and (etag or last_modified):
+            self.cache.put(url, etag, last_modified, text)
+        return text, FETCHED
+
+    def fetch_all(self, urls):
+        """FetchResult per URL, in the order given."""
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(urls)), thread_name_prefix="fetch") as pool:
+            return list(pool.map(self.fetch, urls))
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_web_fetcher():
+    """Fetcher singleton, so the connection pool survives Streamlit reruns."""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = WebFetcher(cache=PageCache(WEB_CACHE_DIR))
+        return _fetcher